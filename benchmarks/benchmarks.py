@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2022 Adam.Dybbroe
+
+# Author(s):
+
+#   Adam.Dybbroe <a000680@c21856.ad.smhi.se>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Timing and peak memory benchmarks of the hot paths, on synthetic data.
+
+Run locally against the current checkout with:
+
+    asv run --python=same --quick
+
+The time_* methods are timed and the peakmem_* methods report the peak
+resident memory of the process running them.
+"""
+
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from benchmarks.synthetic_data import AFIMG_PATTERN
+from benchmarks.synthetic_data import make_afimg_tree
+from benchmarks.synthetic_data import make_pps_tree
+from benchmarks.synthetic_data import make_tle_tree
+from benchmarks.synthetic_data import write_area_file
+
+AREAID = 'bench_nordic'
+START_TIME = datetime(2021, 7, 28, 12, 0)
+
+# Fire points along the synthetic swaths, some outside:
+FIRE_LONS = np.linspace(5, 25, 200)
+FIRE_LATS = np.linspace(50, 60, 200)
+
+
+def _get_data_dir(name):
+    dirname = os.path.join(tempfile.gettempdir(), 'fires_and_clouds_benchmarks', name)
+    shutil.rmtree(dirname, ignore_errors=True)
+    os.makedirs(dirname)
+    return dirname
+
+
+def _set_area_file(dirname):
+    from fires_and_clouds import areas
+
+    areas.set_area_file(write_area_file(dirname))
+
+
+class CloudUtilsSuite(object):
+    """Point extraction and composite updates on synthetic VIIRS granules."""
+
+    timeout = 300
+
+    def setup_cache(self):
+        dirname = _get_data_dir('pps')
+        write_area_file(dirname)
+        return dirname, make_pps_tree(dirname, START_TIME, 3, 'viirs')
+
+    def setup(self, data):
+        from fires_and_clouds.cloud_utils import LastCloudfreeView
+        from fires_and_clouds.cloud_utils import get_cloudmask_scene
+
+        dirname, ppsfiles = data
+        _set_area_file(dirname)
+        self.view = LastCloudfreeView(AREAID, START_TIME + timedelta(hours=2))
+        self.scn = get_cloudmask_scene(ppsfiles)
+        self.swath = self.view.get_scene_times_cloudfree_view(self.scn)
+        self.remapped = self.view.map_data(*self.swath)
+
+    def time_get_cloudfraction(self, data):
+        from fires_and_clouds.cloud_utils import get_cloudfraction
+
+        get_cloudfraction(FIRE_LONS, FIRE_LATS, data[1][1])
+
+    def peakmem_get_cloudfraction(self, data):
+        from fires_and_clouds.cloud_utils import get_cloudfraction
+
+        get_cloudfraction(FIRE_LONS, FIRE_LATS, data[1][1])
+
+    def time_get_cloudfraction_satpy(self, data):
+        from fires_and_clouds.cloud_utils import get_cloudfraction
+
+        get_cloudfraction(FIRE_LONS, FIRE_LATS, data[1][1], windowed=False)
+
+    def peakmem_get_cloudfraction_satpy(self, data):
+        from fires_and_clouds.cloud_utils import get_cloudfraction
+
+        get_cloudfraction(FIRE_LONS, FIRE_LATS, data[1][1], windowed=False)
+
+    def time_get_scene_times_cloudfree_view(self, data):
+        self.view.get_scene_times_cloudfree_view(self.scn)
+
+    def time_map_data(self, data):
+        self.view.map_data(*self.swath)
+
+    def peakmem_map_data(self, data):
+        self.view.map_data(*self.swath)
+
+    def time_set_time_dataset(self, data):
+        self.view.relative_obstimes = None
+        self.view.set_time_dataset(self.remapped)
+        self.view.set_time_dataset(self.remapped)
+
+    def time_freshness_composite_update(self, data):
+        from fires_and_clouds.cloud_utils import CloudfreeFreshnessComposite
+        from fires_and_clouds.areas import get_area_def
+
+        CloudfreeFreshnessComposite(get_area_def(AREAID)).update_from_scene(self.scn)
+
+
+class ResamplingSuite(object):
+    """The resamplers on a cropped three granule VIIRS scene, for area grids of 1 to 8 km."""
+
+    timeout = 600
+    params = (['nearest', 'gradient', 'bucket'], [1000, 2000, 4000, 8000])
+    param_names = ['resampler', 'pixel_size']
+
+    def setup_cache(self):
+        dirname = _get_data_dir('resampling')
+        write_area_file(dirname)
+        return dirname, make_pps_tree(dirname, START_TIME, 3, 'viirs')
+
+    def setup(self, data, resampler, pixel_size):
+        from fires_and_clouds.cloud_utils import LastCloudfreeView
+        from fires_and_clouds.areas import get_area_def
+
+        dirname, ppsfiles = data
+        _set_area_file(dirname)
+        # The benchmark area (2 km) with the same extent and another pixel size:
+        area_def = get_area_def(AREAID)
+        self.area_def = area_def.copy(height=area_def.height * 2000 // pixel_size,
+                                      width=area_def.width * 2000 // pixel_size)
+        view = LastCloudfreeView(AREAID, START_TIME + timedelta(hours=2))
+        self.swath = view.get_scene_times_cloudfree_view(view.get_cloudmask(ppsfiles))
+
+    def time_resample(self, data, resampler, pixel_size):
+        from fires_and_clouds.resampling import resample
+
+        resample(*self.swath, self.area_def, resampler=resampler)
+
+    def peakmem_resample(self, data, resampler, pixel_size):
+        from fires_and_clouds.resampling import resample
+
+        resample(*self.swath, self.area_def, resampler=resampler)
+
+
+class TleFilesSuite(object):
+    """Indexing of and lookups in a tle directory with 10^5 files."""
+
+    timeout = 300
+
+    def setup_cache(self):
+        dirname = _get_data_dir('tle')
+        make_tle_tree(dirname, datetime(2015, 1, 1), 100000)
+        return dirname
+
+    def setup(self, dirname):
+        from fires_and_clouds import utils
+
+        self.tle_index = utils.get_tle_index(dirname, utils.tlepattern)
+
+    def time_get_tle_index(self, dirname):
+        from fires_and_clouds import utils
+
+        utils._TLE_INDEX.clear()
+        utils.get_tle_index(dirname, utils.tlepattern)
+
+    def time_find_closest_tle_file(self, dirname):
+        from fires_and_clouds import utils
+
+        for day in range(100):
+            utils.find_closest_file_in_index(self.tle_index, datetime(2016, 1, 1) + timedelta(days=day, hours=3))
+
+
+class FileDiscoverySuite(object):
+    """File listing and matching on directory trees with 10^5 files."""
+
+    timeout = 600
+
+    def setup_cache(self):
+        dirname = _get_data_dir('trees')
+        make_afimg_tree(os.path.join(dirname, 'afimg'), datetime(2021, 1, 1), 100000)
+        pps_dir = os.path.join(dirname, 'pps')
+        # A day of PPS file names (without content) in a single date directory:
+        day_dir = os.path.join(pps_dir, START_TIME.strftime('%Y/%m/%d'))
+        os.makedirs(day_dir)
+        for idx in range(1000):
+            stime = START_TIME + idx * timedelta(seconds=85.4)
+            etime = stime + timedelta(seconds=85.4)
+            open(os.path.join(day_dir, 'S_NWC_CMA_npp_%05d_%sZ_%sZ.nc' % (
+                50000 + idx // 70, stime.strftime('%Y%m%dT%H%M%S%f')[:16],
+                etime.strftime('%Y%m%dT%H%M%S%f')[:16])), 'w').close()
+        return dirname
+
+    def time_get_af_files(self, dirname):
+        from fires_and_clouds.utils import get_af_files
+
+        get_af_files(os.path.join(dirname, 'afimg'), datetime(2021, 3, 1), datetime(2021, 3, 5), AFIMG_PATTERN)
+
+    def time_collect_product_files(self, dirname):
+        from fires_and_clouds.pps_files import PPSFilesGetter
+
+        getter = PPSFilesGetter(os.path.join(dirname, 'pps'), START_TIME, START_TIME + timedelta(days=1))
+        getter.collect_product_files(product_name='CMA')
+        getter.gather_granules('CMA')
+
+
+class ImportSuite(object):
+    """Import times of the light modules (asv runs each benchmark in a fresh process)."""
+
+    def timeraw_import_cloud_utils(self):
+        return "import fires_and_clouds.cloud_utils"
+
+    def timeraw_import_utils(self):
+        return "import fires_and_clouds.utils"
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2022 Adam.Dybbroe
+
+# Author(s):
+
+#   Adam.Dybbroe <a000680@c21856.ad.smhi.se>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Generators of synthetic input data for the benchmarks.
+
+NWCSAF/PPS cloudmask granules are created with the swath geometry of VIIRS
+or AVHRR (scan angles, satellite altitude and line spacing), on a spherical
+earth. TLE and VIIRS active fire (AFIMG) directory trees are created with
+empty files named as the real ones, as only the listing is benchmarked.
+"""
+
+import os
+from datetime import timedelta
+
+import numpy as np
+
+EARTH_RADIUS = 6371.0  # km
+
+# Swath geometry per instrument: pixels per line, maximum scan angle (deg),
+# satellite altitude (km), line spacing on ground (km) and line period (s):
+SWATH_GEOMETRY = {'viirs': {'npixels': 3200, 'max_scan_angle': 56.28, 'altitude': 834.,
+                            'line_spacing': 0.742, 'line_period': 1.779166667 / 16},
+                  'avhrr': {'npixels': 2048, 'max_scan_angle': 55.37, 'altitude': 833.,
+                            'line_spacing': 1.1, 'line_period': 1 / 6.}}
+
+PPS_PLATFORMS = {'viirs': ('npp', 'Suomi-NPP'),
+                 'avhrr': ('noaa19', 'NOAA-19')}
+
+# Chunks (lines, pixels) of the swath variables in the netCDF files:
+CHUNK_SIZES = (256, 256)
+
+AFIMG_PATTERN = ('AFIMG_{platform:s}_d{start_time:%Y%m%d_t%H%M%S%f}_e{end_hour:%H%M%S%f}_b{orbit:s}'
+                 '_c{processing_time:%Y%m%d%H%M%S%f}_cspp_dev.txt')
+
+AREA_DEFINITION = """
+bench_nordic:
+  description: Nordic area in polar stereographic projection, 2 km
+  projection:
+    proj: stere
+    lat_0: 90
+    lat_ts: 60
+    lon_0: 15
+    ellps: WGS84
+  shape:
+    height: 1200
+    width: 1000
+  area_extent:
+    lower_left_xy: [-1000000, -4400000]
+    upper_right_xy: [1000000, -2000000]
+"""
+
+
+def write_area_file(dirname):
+    """Write the area definition file of the benchmark area and return its path."""
+    filename = os.path.join(dirname, 'areas.yaml')
+    with open(filename, 'w') as fpt:
+        fpt.write(AREA_DEFINITION)
+    return filename
+
+
+def _lonlat_to_xyz(lon, lat):
+    lon, lat = np.deg2rad(lon), np.deg2rad(lat)
+    return np.array([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def get_swath_lonlats(lon0, lat0, heading, nlines, instrument='viirs'):
+    """Get the longitudes and latitudes of a swath starting with its nadir at lon0, lat0.
+
+    The sub-satellite track is the great circle leaving lon0, lat0 with the
+    *heading* (degrees from north), and the pixels are spaced as seen from
+    the satellite altitude with evenly spaced scan angles.
+    """
+    geom = SWATH_GEOMETRY[instrument]
+    start = _lonlat_to_xyz(lon0, lat0)
+    east = np.cross([0., 0., 1.], start)
+    east = east / np.linalg.norm(east)
+    north = np.cross(start, east)
+    direction = np.cos(np.deg2rad(heading)) * north + np.sin(np.deg2rad(heading)) * east
+    normal = np.cross(start, direction)
+
+    # Earth central angles along and across track:
+    along = np.arange(nlines) * geom['line_spacing'] / EARTH_RADIUS
+    scan_angles = np.deg2rad(np.linspace(-geom['max_scan_angle'], geom['max_scan_angle'], geom['npixels']))
+    across = np.arcsin((EARTH_RADIUS + geom['altitude']) / EARTH_RADIUS * np.sin(scan_angles)) - scan_angles
+
+    nadir = np.cos(along)[:, None] * start[None, :] + np.sin(along)[:, None] * direction[None, :]
+    xyz = (np.cos(across)[None, :, None] * nadir[:, None, :] +
+           np.sin(across)[None, :, None] * normal[None, None, :])
+    lons = np.rad2deg(np.arctan2(xyz[:, :, 1], xyz[:, :, 0]))
+    lats = np.rad2deg(np.arcsin(np.clip(xyz[:, :, 2], -1, 1)))
+
+    return lons.astype('float32'), lats.astype('float32')
+
+
+def get_cloudmask(shape, cloud_fraction=0.5, cell_size=32, seed=0):
+    """Get a cloudmask (0=cloudfree, 1=cloudy) with cloud cells of a given size in pixels."""
+    rng = np.random.default_rng(seed)
+    cells = rng.random((shape[0] // cell_size + 1, shape[1] // cell_size + 1)) < cloud_fraction
+    cloudmask = np.repeat(np.repeat(cells, cell_size, axis=0), cell_size, axis=1)
+    return cloudmask[:shape[0], :shape[1]].astype('int8')
+
+
+def make_pps_cma_granule(dirname, start_time, instrument='viirs', nlines=None, lon0=15., lat0=55.,
+                         heading=-10., orbit_number=50000):
+    """Write a synthetic NWCSAF/PPS CMA netCDF granule and return its path.
+
+    VIIRS granules have the 768 lines of a 86 seconds SDR granule, AVHRR
+    granules 5 minutes of lines, unless *nlines* is given.
+    """
+    import netCDF4
+
+    geom = SWATH_GEOMETRY[instrument]
+    if nlines is None:
+        nlines = 768 if instrument == 'viirs' else 1800
+    end_time = start_time + timedelta(seconds=nlines * geom['line_period'])
+    pps_platform, platform_name = PPS_PLATFORMS[instrument]
+
+    filename = os.path.join(dirname, 'S_NWC_CMA_%s_%05d_%sZ_%sZ.nc' %
+                            (pps_platform, orbit_number, start_time.strftime('%Y%m%dT%H%M%S%f')[:16],
+                             end_time.strftime('%Y%m%dT%H%M%S%f')[:16]))
+    lons, lats = get_swath_lonlats(lon0, lat0, heading, nlines, instrument)
+    with netCDF4.Dataset(filename, 'w') as nc_:
+        nc_.createDimension('time', 1)
+        nc_.createDimension('ny', nlines)
+        nc_.createDimension('nx', geom['npixels'])
+        nc_.source = 'NWC/PPS version v2018'
+        nc_.platform = platform_name
+        nc_.time_coverage_start = start_time.strftime('%Y%m%dT%H%M%S%f')[:16] + 'Z'
+        nc_.time_coverage_end = end_time.strftime('%Y%m%dT%H%M%S%f')[:16] + 'Z'
+
+        for name, data in (('lon', lons), ('lat', lats)):
+            var = nc_.createVariable(name, 'i4', ('ny', 'nx'), fill_value=-999, zlib=True,
+                                     chunksizes=CHUNK_SIZES)
+            var.scale_factor = 1e-5
+            var.add_offset = 0.
+            var[:] = data
+
+        var = nc_.createVariable('cma', 'i1', ('time', 'ny', 'nx'), fill_value=-1, zlib=True,
+                                 chunksizes=(1,) + CHUNK_SIZES)
+        var.valid_range = np.array([0, 1], 'i1')
+        var.long_name = 'Cloud mask'
+        var[0] = get_cloudmask((nlines, geom['npixels']), seed=int(start_time.timestamp()))
+
+    return filename
+
+
+def make_pps_tree(basedir, start_time, ngranules, instrument='viirs', **kwargs):
+    """Write consecutive synthetic CMA granules into YYYY/MM/DD subdirectories and return their paths."""
+    geom = SWATH_GEOMETRY[instrument]
+    nlines = kwargs.pop('nlines', 768 if instrument == 'viirs' else 1800)
+    duration = timedelta(seconds=nlines * geom['line_period'])
+    lat_step = nlines * geom['line_spacing'] / EARTH_RADIUS * 180 / np.pi
+    lat0 = kwargs.pop('lat0', 50.)
+
+    filenames = []
+    for idx in range(ngranules):
+        stime = start_time + idx * duration
+        dirname = os.path.join(basedir, stime.strftime('%Y/%m/%d'))
+        os.makedirs(dirname, exist_ok=True)
+        filenames.append(make_pps_cma_granule(dirname, stime, instrument, nlines=nlines,
+                                              lat0=lat0 + idx * lat_step, heading=0., **kwargs))
+    return filenames
+
+
+def make_tle_tree(dirname, start_time, nfiles, interval=timedelta(minutes=30)):
+    """Create *nfiles* (empty) tle files named tle-YYYYmmddHHMM.txt every *interval*."""
+    os.makedirs(dirname, exist_ok=True)
+    for idx in range(nfiles):
+        stime = start_time + idx * interval
+        open(os.path.join(dirname, stime.strftime('tle-%Y%m%d%H%M.txt')), 'w').close()
+
+
+def make_afimg_tree(basedir, start_time, nfiles, interval=timedelta(minutes=2)):
+    """Create *nfiles* (empty) VIIRS active fire files in YYYY/MM subdirectories every *interval*."""
+    dirname = None
+    for idx in range(nfiles):
+        stime = start_time + idx * interval
+        etime = stime + timedelta(seconds=85.4)
+        if dirname != os.path.join(basedir, stime.strftime('%Y/%m')):
+            dirname = os.path.join(basedir, stime.strftime('%Y/%m'))
+            os.makedirs(dirname, exist_ok=True)
+        ctime = etime + timedelta(minutes=8)
+        fname = 'AFIMG_j01_d%s_t%s_e%s_b%05d_c%s_cspp_dev.txt' % (stime.strftime('%Y%m%d'),
+                                                                  stime.strftime('%H%M%S%f')[:7],
+                                                                  etime.strftime('%H%M%S%f')[:7],
+                                                                  10000 + idx,
+                                                                  ctime.strftime('%Y%m%d%H%M%S%f'))
+        open(os.path.join(dirname, fname), 'w').close()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2022 Adam.Dybbroe
+
+# Author(s):
+
+#   Adam.Dybbroe <a000680@c21856.ad.smhi.se>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure the time it takes to import the fires_and_clouds modules.
+
+Each module is imported in a fresh Python interpreter a few times and the
+fastest run is reported, together with the heavy packages it pulled in.
+Exits with a non-zero status if a light module exceeds the time budget.
+"""
+
+import subprocess
+import sys
+
+LIGHT_MODULES = ['fires_and_clouds',
+                 'fires_and_clouds.pps_files',
+                 'fires_and_clouds.satellite_scanning_geometry',
+                 'fires_and_clouds.areas',
+                 'fires_and_clouds.utils',
+                 'fires_and_clouds.cloud_utils']
+
+HEAVY_PACKAGES = ['satpy', 'pyresample', 'pykdtree', 'matplotlib', 'cartopy',
+                  'trollimage', 'trollsched', 'pyorbital', 'xarray', 'dask', 'pandas']
+
+TIME_BUDGET = 0.5  # seconds
+
+CODE = """
+import sys
+import time
+tic = time.perf_counter()
+import {module}
+toc = time.perf_counter()
+heavy = [pkg for pkg in {heavy!r} if pkg in sys.modules]
+print('%f|%s' % (toc - tic, ','.join(heavy)))
+"""
+
+
+def time_import(module, repeat=3):
+    """Import a module in fresh interpreters and return the fastest time and the heavy packages loaded."""
+
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', CODE.format(module=module, heavy=HEAVY_PACKAGES)])
+        seconds, heavy = output.decode().strip().split('|')
+        timings.append(float(seconds))
+
+    return min(timings), heavy
+
+
+if __name__ == "__main__":
+
+    status = 0
+    for module in LIGHT_MODULES:
+        seconds, heavy = time_import(module)
+        flag = ''
+        if seconds > TIME_BUDGET:
+            flag = '  <-- over budget (%.2f s)' % TIME_BUDGET
+            status = 1
+        print("%-48s %6.3f s  %s%s" % (module, seconds, heavy, flag))
+
+    sys.exit(status)
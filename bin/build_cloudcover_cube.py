@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2022 Adam.Dybbroe
+
+# Author(s):
+
+#   Adam.Dybbroe <a000680@c21856.ad.smhi.se>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Remap all NWCSAF/PPS cloudmask scenes in a time window to an area and store
+them in a (time, y, x) cloud cover cube.
+
+"""
+
+from datetime import datetime
+import logging
+
+from fires_and_clouds.cloud_utils import PPSFilesGetter
+from fires_and_clouds.areas import get_area_def
+from fires_and_clouds.cloud_cube import build_cloudcover_cube
+
+PPS_DIR = "/data/lang/satellit2/polar/pps/"
+
+AREAID = 'sweden'
+
+
+if __name__ == "__main__":
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s %(levelname)s %(name)s] %(message)s')
+
+    START = datetime(2021, 7, 26, 0)
+    END = datetime(2021, 7, 28, 12)
+
+    pps_file_getter = PPSFilesGetter(PPS_DIR, START, END)
+    pps_file_getter.collect_product_files(product_name='CMA')
+    pps_file_getter.gather_granules('CMA')
+
+    area_def = get_area_def(AREAID)
+    cube = build_cloudcover_cube(pps_file_getter, area_def,
+                                 './cloudcover_cube_{area}.nc'.format(area=AREAID))
+    print("Number of scenes in cube: %d" % len(cube.get_scene_times()))
@@ -28,6 +28,8 @@ import os
 from fires_and_clouds.cloud_utils import generate_cloudmask_image
 from fires_and_clouds.cloud_utils import get_cloudmask_scene
 from fires_and_clouds.cloud_utils import get_satname_from_files
+from fires_and_clouds.areas import get_area_def
+from fires_and_clouds.overlays import save_dataset_with_overlays
 
 # Polar cloud products:
 #VIIRS_DATADIR = "/data/lang/satellit2/polar/pps/2021/06/11"
@@ -54,7 +56,7 @@ if __name__ == "__main__":
     areaid = "euron1"
 
     scn = get_cloudmask_scene(ppsfiles)
-    local_scn = scn.resample(areaid, radius_of_influence=8000)
+    local_scn = scn.resample(get_area_def(areaid), radius_of_influence=8000)
 
     cma = local_scn['cma'] * 255
     local_scn['cma'] = cma
@@ -92,13 +94,12 @@ if __name__ == "__main__":
     borders = {'outline': (255, 100, 100), 'width': 1.0, 'level': 3, 'resolution': 'i'}
     #rivers = {'outline': (0,   0, 255), 'width': 1.0, 'level': 3, 'resolution': 'i'}
 
-    local_scn.save_dataset('cma', filename=output_filename,
-                           overlay={'coast_dir': '/home/a000680/data/shapes/',
-                                    'overlays': {'coasts': coast,
-                                                 'borders': borders,
-                                                 # 'rivers': rivers,
-                                                 'points': points}},
-                           decorate={'decorate': [
+    save_dataset_with_overlays(local_scn, 'cma', output_filename, areaid,
+                               overlays={'coasts': coast,
+                                         'borders': borders,
+                                         # 'rivers': rivers,
+                                         'points': points},
+                               decorate=[
                                {'logo': {'logo_path': SMHILOGO_BLACK,
                                          'height': 90, 'bg': 'white', 'bg_opacity': 120}},
                                {'text': {'txt': start_time_txt,
@@ -108,4 +109,4 @@ if __name__ == "__main__":
                                          'height': 90,
                                          'bg': 'black',
                                          'bg_opacity': 120,
-                                         'line': 'white'}}, ]})
+                                         'line': 'white'}}, ])
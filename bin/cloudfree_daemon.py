@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2022 Adam.Dybbroe
+
+# Author(s):
+
+#   Adam.Dybbroe <a000680@c21856.ad.smhi.se>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Run a resident process updating the time since cloudfree view, the cloud
+statistics at fire points and the product image as new NWCSAF/PPS cloudmask
+granules arrive in the PPS output directories.
+
+"""
+
+import logging
+
+from fires_and_clouds.daemon import CloudfreeDaemon
+from fires_and_clouds.daemon import DirectoryWatcher
+
+VIIRS_PPS_PATH = "/data/lang/satellit2/polar/pps/"
+AVHRR_MODIS_PPS_PATH = "/data/lang/satellit/polar/PPS_products/satproj/"
+
+AREAID = 'sweden'
+
+OUTPUT_DIR = './'
+# Stage timings and counters for the node_exporter textfile collector:
+METRICS_FILE = './fires_and_clouds.prom'
+# Web tiles of the product, updated only where new granules change it:
+TILES_DIR = './tiles'
+
+# (lon, lat) of the fires to monitor:
+FIRE_POINTS = [(18.3244, 64.8210), ]  # Fire pixel 28 July, 2021, Lycksele
+
+POLL_INTERVAL = 10  # seconds
+
+
+if __name__ == "__main__":
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s %(levelname)s %(name)s] %(message)s')
+
+    watcher = DirectoryWatcher([VIIRS_PPS_PATH, AVHRR_MODIS_PPS_PATH], product_name='CMA')
+    daemon = CloudfreeDaemon(AREAID, output_dir=OUTPUT_DIR, fire_points=FIRE_POINTS,
+                             write_cog=True, tiles_dir=TILES_DIR, metrics_file=METRICS_FILE)
+    daemon.run(watcher, poll_interval=POLL_INTERVAL)
@@ -20,51 +20,32 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-"""
+"""Make a composite of the freshness of the cloudfree view from all VIIRS
+NWCSAF/PPS cloudmask scenes in a time window.
 """
 
-from glob import glob
-import os
-import numpy as np
+from datetime import datetime
+import logging
 import matplotlib.pyplot as plt
 from matplotlib import cm
 
-from fires_and_clouds.cloud_utils import get_cloudmask_scene
-from fires_and_clouds.cloud_utils import create_clfree_freshness_from_cloudmask
-from fires_and_clouds.cloud_utils import generate_cloudmask_image
-
-from pyresample import load_area
-from pyresample import kd_tree, geometry
-from trollsift.parser import Parser
+from fires_and_clouds.cloud_utils import PPSFilesGetter
+from fires_and_clouds.cloud_utils import create_freshness_composite
+from fires_and_clouds.areas import get_area_def
+from fires_and_clouds.areas import get_cartopy_crs
 
 
-# S_NWC_CMA_npp_50192_20210705T0323237Z_20210705T0324479Z.nc
-PATTERN = 'S_NWC_CMA_{platform_name:s}_{orbit_number:5d}_{start_time:%Y%m%dT%H%M%S%f}Z_{endtime:%Y%m%dT%H%M%S%f}Z.nc'
-PPS_DIR = "/data/lang/satellit2/polar/pps/2021/07/05"
+PPS_DIR = "/data/lang/satellit2/polar/pps/"
 
 AREAID = 'euron1'
-AREA_DEF_FILE = "/home/a000680/usr/src/pytroll-config/etc/areas.yaml"
-
-
-def map_data(lons, lats, time_data):
-    """Remap the data to projected area."""
-
-    swath_def = geometry.SwathDefinition(lons=lons, lats=lats)
-
-    area_def = load_area(AREA_DEF_FILE, AREAID)
-    result = kd_tree.resample_nearest(swath_def, time_data,
-                                      area_def, radius_of_influence=10000)
-    crs = area_def.to_cartopy_crs()
-
-    return result, crs
+# One of 'nearest', 'gradient', 'bucket' or 'auto' (see fires_and_clouds.resampling):
+RESAMPLER = 'nearest'
 
 
 def plot_data(data, crs, filename):
 
-    cmap = cm.YlGn
+    cmap = cm.YlGn_r
     cmaplist = [cmap(i) for i in range(cmap.N)]
-    # force the first color entry to be grey
-    cmaplist[0] = (.5, .5, .5, 1.0)
     # create the new map
     mycmap = cmap.from_list('Custom cmap', cmaplist, cmap.N)
 
@@ -78,61 +59,25 @@ def plot_data(data, crs, filename):
     plt.imshow(data, transform=crs, extent=crs.bounds, interpolation='nearest',
                origin='upper', cmap=mycmap)
     cbar = plt.colorbar()
-    cbar.set_label("Freshness of cloudfree view")
+    cbar.set_label("Hours since last cloudfree view")
     plt.savefig(filename)
     plt.clf()
 
 
 if __name__ == "__main__":
 
-    # PPS_FILES = (glob(os.path.join(PPS_DIR, "S_NWC_CMA_noaa20*nc")) +
-    #             glob(os.path.join(PPS_DIR, "S_NWC_CMA_npp*nc")))
-
-    PPS_FILES = glob(os.path.join(PPS_DIR, "S_NWC_CMA_noaa20_18794*nc"))
-
-    p__ = Parser(PATTERN)
-    for ppsfile in PPS_FILES:
-        res = p__.parse(os.path.basename(ppsfile))
-        break
-
-    this_scn = get_cloudmask_scene(PPS_FILES)
-    # generate_cloudmask_image(scn)
-
-    lons, lats, time_data1 = create_clfree_freshness_from_cloudmask(this_scn)
-
-    # cmap = cm.YlGn
-    # cmaplist = [cmap(i) for i in range(cmap.N)]
-    # # force the first color entry to be grey
-    # cmaplist[0] = (.5, .5, .5, 1.0)
-    # # create the new map
-    # mycmap = cmap.from_list('Custom cmap', cmaplist, cmap.N)
-
-    # # Plot the data with Cartopy:
-    # plt.figure(figsize=(16, 12))
-    # plt.title('Freshness of cloudfree view')
-
-    # extent = 0, time_data.shape[1], 0, time_data.shape[0]
-    # plt.imshow(time_data, extent=extent, origin='upper',
-    #            interpolation='nearest', cmap=mycmap)
-    # cbar = plt.colorbar()
-    # cbar.set_label("Freshness of cloudfree view")
-    # plt.show()
-
-    result, crs = map_data(lons, lats, time_data1)
-    plot_data(result, crs, './freshness_of_cloudfree_view_1.png')
-
-    #
-    PPS_FILES2 = glob(os.path.join(PPS_DIR, "S_NWC_CMA_npp_50197*nc"))
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s %(levelname)s %(name)s] %(message)s')
 
-    this_scn = get_cloudmask_scene(PPS_FILES2)
-    # generate_cloudmask_image(scn)
-    lons2, lats2, time_data2 = create_clfree_freshness_from_cloudmask(this_scn)
+    START = datetime(2021, 7, 5, 0)
+    END = datetime(2021, 7, 6, 0)
 
-    result2, crs = map_data(lons2, lats2, time_data2)
-    plot_data(result2, crs, './freshness_of_cloudfree_view_2.png')
+    pps_file_getter = PPSFilesGetter(PPS_DIR, START, END)
+    pps_file_getter.collect_product_files(platforms=['NOAA-20', 'Suomi-NPP'], product_name='CMA')
+    pps_file_getter.gather_granules('CMA')
 
-    # The assumption is that scene-2 is later than scene-1:
-    newres = np.where(np.greater(result2, result), result2, result)
+    area_def = get_area_def(AREAID)
+    composite = create_freshness_composite(pps_file_getter.pps_files['CMA'].values(), area_def,
+                                           resampler=RESAMPLER)
 
-    #result = np.maximum(result, result2)
-    plot_data(newres, crs, './freshness_of_cloudfree_view.png')
+    hours = composite.get_minutes_since_cloudfree(END) / 60.
+    plot_data(hours, get_cartopy_crs(AREAID), './freshness_of_cloudfree_view.png')
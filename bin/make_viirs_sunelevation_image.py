@@ -31,6 +31,8 @@ import matplotlib.pyplot as plt
 import numpy as np
 
 from satpy import Scene
+from fires_and_clouds.areas import get_area_def
+from fires_and_clouds.areas import get_cartopy_crs
 from satpy.utils import debug_on
 debug_on()
 
@@ -47,11 +49,11 @@ def make_cartopy_angle_plot(scn_obj, angle_param, **kwargs):
     label = "Angle (degrees)"
     if angle_param in ['solar_zenith_angle']:
         label = "Solar Zenith angle (degrees)"
-        crs = remap_scn[angle_param].attrs['area'].to_cartopy_crs()
+        crs = get_cartopy_crs(remap_scn[angle_param].attrs['area'].area_id)
         angles = remap_scn[angle_param]
     elif angle_param in ['solar_elevation_angle']:
         label = "Solar elevation angle (degrees)"
-        crs = remap_scn['solar_zenith_angle'].attrs['area'].to_cartopy_crs()
+        crs = get_cartopy_crs(remap_scn['solar_zenith_angle'].attrs['area'].area_id)
         angles = 90. - remap_scn['solar_zenith_angle']
     else:
         print("Angle parameter not supported")
@@ -79,7 +81,7 @@ if __name__ == "__main__":
     scn = Scene(filenames=FILENAMES, reader='viirs_sdr')
     scn.load(['solar_zenith_angle', 'satellite_zenith_angle'])
 
-    remap_scn = scn.resample(areaid, radius_of_influence=8000)
+    remap_scn = scn.resample(get_area_def(areaid), radius_of_influence=8000)
 
     CARTOPY = False
 
@@ -46,7 +46,10 @@ from fires_and_clouds.cloud_utils import get_satname_from_files
 from fires_and_clouds.utils import find_actual_tlefile
 from fires_and_clouds.utils import create_pass
 
-from pyresample import load_area
+from fires_and_clouds.areas import get_area_def
+from fires_and_clouds.areas import get_transform
+from fires_and_clouds.overlays import get_overlays_from_color
+from fires_and_clouds.overlays import save_dataset_with_overlays
 
 from datetime import datetime, timedelta
 import numpy as np
@@ -68,7 +71,6 @@ VIIRS_DATADIR = "/data/lang/satellit2/polar/pps/2021/06/11"
 AVHRR_MODIS_DATADIR = "/data/lang/satellit/polar/PPS_products/satproj/2021/06/11"
 
 TESTIMG = "/home/a000680/data/msb_proj2021/metop02_20211109_0809_78133_euron1_rgb_02b.tif"
-AREA_DEF_FILE = '/home/a000680/usr/src/pytroll-config/etc/areas.yaml'
 
 SMHILOGO = "/home/a000680/data/logos/SMHIlogotypevitRGB8mm.png"
 SMHILOGO_BLACK = "/home/a000680/data/logos/SMHIlogotypesvartRGB8mm.png"
@@ -89,7 +91,7 @@ def get_swathoutline_as_shape(start_time, end_time, satname, sensor, areaid):
     mypass = create_pass(satname, sensor, start_time, end_time, tle_filename)
 
     mypoly = get_polygon_from_contour(mypass.boundary.contour_poly)
-    areadef = load_area(AREA_DEF_FILE, areaid)
+    areadef = get_area_def(areaid)
 
     wgs84 = pyproj.CRS('EPSG:4326')
     mycrs = areadef.crs
@@ -108,32 +110,20 @@ def get_swathoutline_as_shape(start_time, end_time, satname, sensor, areaid):
 def get_mask_from_shape(poly_shape, areaid):
     """From a shapefile polygon object and area id create a binary mask."""
 
-    # Here we should extract the tiff-metadata corresponding to the area:
-    if areaid not in ['euron1', 'eurol']:
-        print("No support for this area id yet...")
-        return None
+    # The grid size and pixel to projection transform of the area:
+    im_size = get_area_def(areaid).shape
+    area_transform = get_transform(areaid)
 
-    if areaid == "eurol":
-        raster_path = '/home/a000680/data/msb_proj2021/met09_20211102_0900.eurol.cloudtype_standard.tif'
-    else:
-        raster_path = "/home/a000680/data/msb_proj2021/metop02_20211109_0809_78133_euron1_rgb_02b.tif"
-
-    with rasterio.open(raster_path, "r") as src:
-        raster_img = src.read()
-        raster_meta = src.meta
-
-    print("CRS Raster: {}".format(poly_shape.crs))
-    print("CRS Vector {}".format(src.crs))
+    print("CRS Vector: {}".format(poly_shape.crs))
 
     poly_shp = []
-    im_size = (raster_meta['height'], raster_meta['width'])
     for num, row in poly_shape.iterrows():
         if row['geometry'].geom_type == 'Polygon':
-            poly = poly_from_utm(row['geometry'], raster_meta['transform'])
+            poly = poly_from_utm(row['geometry'], area_transform)
             poly_shp.append(poly)
         else:
             for p in row['geometry']:
-                poly = poly_from_utm(p, raster_meta['transform'])
+                poly = poly_from_utm(p, area_transform)
                 poly_shp.append(poly)
 
     mask = rasterize(shapes=poly_shp, out_shape=im_size)
@@ -171,7 +161,7 @@ if __name__ == "__main__":
     ftime_str = future_time.strftime('%Y%m%d_%H%M')
 
     scn = get_cloudmask_scene(ppsfiles)
-    local_scn = scn.resample(areaid, radius_of_influence=8000)
+    local_scn = scn.resample(get_area_def(areaid), radius_of_influence=8000)
 
     swath_df = get_swathoutline_as_shape(start_time, end_time, 'NOAA-20', 'viirs', areaid)
 
@@ -188,9 +178,9 @@ if __name__ == "__main__":
                                                                                       area=areaid,
                                                                                       future=ftime_str)
 
-    local_scn.save_dataset('cma', filename=output_filename,
-                           overlay={'coast_dir': '/home/a000680/data/shapes/', 'color': 'red'},
-                           decorate={'decorate': [
+    save_dataset_with_overlays(local_scn, 'cma', output_filename, areaid,
+                               overlays=get_overlays_from_color('red'),
+                               decorate=[
                                {'logo': {'logo_path': SMHILOGO_BLACK,
                                          'height': 90, 'bg': 'white', 'bg_opacity': 120}},
                                {'text': {'txt': start_time_txt,
@@ -200,4 +190,4 @@ if __name__ == "__main__":
                                          'height': 90,
                                          'bg': 'black',
                                          'bg_opacity': 120,
-                                         'line': 'white'}}]})
+                                         'line': 'white'}}])
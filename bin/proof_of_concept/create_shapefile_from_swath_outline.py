@@ -36,7 +36,7 @@ from fires_and_clouds.utils import find_actual_tlefile
 from fires_and_clouds.utils import create_pass
 
 from pyresample.boundary import AreaDefBoundary
-from pyresample import load_area
+from fires_and_clouds.areas import get_area_def
 from trollsched.drawing import save_fig
 from datetime import datetime, timedelta
 import scipy.ndimage as ndimage
@@ -51,7 +51,6 @@ import rasterio.mask
 import pyproj
 from shapely.ops import transform
 
-AREA_DEF_FILE = '/home/a000680/usr/src/pytroll-config/etc/areas.yaml'
 AREAID = 'eurol'
 
 #TESTIMG = "/home/a000680/data/msb_proj2021/metop02_20211109_0809_78133_euron1_rgb_02b.tif"
@@ -79,7 +78,7 @@ if __name__ == "__main__":
 
     mypoly = get_polygon_from_contour(mypass.boundary.contour_poly)
 
-    areadef = load_area(AREA_DEF_FILE, AREAID)
+    areadef = get_area_def(AREAID)
 
     wgs84 = pyproj.CRS('EPSG:4326')
     #mycrs = areadef.to_cartopy_crs()
@@ -29,14 +29,13 @@ from pmw_data_coverage import find_actual_tlefile
 from pmw_data_coverage import create_pass
 
 from pyresample.boundary import AreaDefBoundary
-from pyresample import load_area
+from fires_and_clouds.areas import get_area_def
 from trollsched.drawing import save_fig
 from datetime import datetime, timedelta
 import scipy.ndimage as ndimage
 import numpy as np
 from pyresample import kd_tree, geometry
 
-AREA_DEF_FILE = '/home/a000680/usr/src/pytroll-config/etc/areas.yaml'
 AREAID = 'euro4'
 
 
@@ -69,7 +68,7 @@ if __name__ == "__main__":
     swath_def = geometry.SwathDefinition(lons=lons, lats=lats)
     shape = lons.shape
     data = np.ones(shape)
-    areadef = load_area(AREA_DEF_FILE, AREAID)
+    areadef = get_area_def(AREAID)
     result = kd_tree.resample_nearest(swath_def, data,
                                       areadef, radius_of_influence=50000)
 
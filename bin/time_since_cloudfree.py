@@ -26,6 +26,7 @@ showing the time since most recent cloudfree view
 """
 
 from datetime import datetime
+import logging
 from matplotlib import cm
 import matplotlib.pyplot as plt
 import numpy as np
@@ -34,13 +35,16 @@ from glob import glob
 
 from trollsift.parser import Parser
 from pyresample import kd_tree, geometry
-from pyresample import load_area
 from fires_and_clouds.cloud_utils import generate_cloudmask_image
 from fires_and_clouds.cloud_utils import create_clfree_freshness_from_cloudmask
 from fires_and_clouds.cloud_utils import get_cloudmask_scene
 from fires_and_clouds.cloud_utils import PPSFilesGetter
 from fires_and_clouds.cloud_utils import get_cloudfraction
 from fires_and_clouds.cloud_utils import LastCloudfreeView
+from fires_and_clouds.instrumentation import METRICS
+from fires_and_clouds.pipeline import CloudfreePipeline
+from fires_and_clouds.rendering import RenderWorker
+from fires_and_clouds.rendering import get_time_span_text
 
 from trollimage.colormap import rdbu, ylgnbu
 from trollimage.image import Image
@@ -62,7 +66,6 @@ PPS_DIR = "/data/lang/satellit2/polar/pps/"
 
 AREAID = 'euron1'
 AREAID = 'sweden'
-AREA_DEF_FILE = "/home/a000680/usr/src/pytroll-config/etc/areas.yaml"
 
 
 if __name__ == "__main__":
@@ -72,35 +75,44 @@ if __name__ == "__main__":
     START = datetime(2021, 7, 26, 0)
     END = datetime(2021, 7, 28, 12)
 
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s %(levelname)s %(name)s] %(message)s')
+
     pps_file_getter = PPSFilesGetter(PPS_DIR, START, END)
     pps_file_getter.collect_product_files(product_name='CMA')
     pps_file_getter.gather_granules('CMA')
 
-    sceneslist = list(pps_file_getter.pps_files['CMA'].keys())
-
     # start_time = datetime(2021, 6, 11, 12, 0)
     start_time = END
 
     myobj = LastCloudfreeView(AREAID, start_time)
 
-    sorted_scenes = sceneslist[::-1]
-    for nscene, pps_scene in enumerate(sorted_scenes):
-        print(nscene, pps_scene)
-
-        PPS_FILES = pps_file_getter.pps_files['CMA'][pps_scene]
-        # Get satellite and orbit number and add to scenes-id list
-        #
-        cmask = myobj.get_cloudmask(PPS_FILES)
-        print(myobj.scene_ids[-1])
-
-        lon, lat, time_data = myobj.get_scene_times_cloudfree_view(cmask)
-        result = myobj.map_data(lon, lat, time_data)
-        myobj.set_time_dataset(result)
-        filename = './minutes_since_last_cloudfree_view_from_{starttime}_{scene}.png'.format(starttime=start_time.strftime('%Y%m%d_%H%M'),
-                                                                                             scene=pps_scene)
-
-        # myobj.plot_data(filename, max_minutes=60*60)  # 60 hours = 2.5 days
-        myobj.plot_data(filename, max_minutes=60*24)  # 24 hours
+    MAX_MINUTES = 60*24  # 24 hours
+    # MAX_MINUTES = 60*60  # 60 hours = 2.5 days
+
+    # Only render the map after the last scene, or every scene in between:
+    FINAL_FRAME_ONLY = False
+
+    def get_filename(pps_scene):
+        return './minutes_since_last_cloudfree_view_from_{starttime}_{scene}.png'.format(starttime=start_time.strftime('%Y%m%d_%H%M'),
+                                                                                         scene=pps_scene)
+
+    # The frames are rendered in a separate process, while the next scenes are processed:
+    render_worker = RenderWorker(AREAID, max_minutes=MAX_MINUTES)
+
+    def plot_scene(view, pps_scene):
+        render_worker.submit(view.relative_obstimes.copy(),
+                             'Minutes since last cloudfree view: %s' % get_time_span_text(view.scene_ids),
+                             get_filename(pps_scene))
+
+    # Reading, resampling and compositing of the scenes overlap in a staged pipeline:
+    pipeline = CloudfreePipeline(myobj, read_workers=2, resample_workers=4,
+                                 on_scene=None if FINAL_FRAME_ONLY else plot_scene)
+    pipeline.run(pps_file_getter, 'CMA')
+    if FINAL_FRAME_ONLY and myobj.scene_ids:
+        plot_scene(myobj, 'latest')
+    render_worker.close()
+    # Timings of the stages run in this process (resampling is done in worker processes):
+    METRICS.log_report()
 
     # img = Image(myobj.relative_obstimes, mode="L", fill_value=None)
     # ylgnbu.set_range(32, 42)
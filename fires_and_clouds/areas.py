@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2022 Adam.Dybbroe
+
+# Author(s):
+
+#   Adam.Dybbroe <a000680@c21856.ad.smhi.se>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A process-wide registry of area definitions.
+
+The area definition file is parsed once, and the AreaDefinitions, cartopy
+CRSs, lon/lat grids and affine transforms are kept per area id. All cached
+entries are dropped when the area definition file changes on disk.
+"""
+
+import os
+import threading
+
+AREA_DEF_FILE = "/home/a000680/usr/src/pytroll-config/etc/areas.yaml"
+
+
+class AreaRegistry(object):
+    """Parse an area definition file once and memoise the derived area objects."""
+
+    def __init__(self, area_file=AREA_DEF_FILE):
+        """Initialize."""
+        self.area_file = area_file
+        self._lock = threading.RLock()
+        self._file_stat = None
+        self._areas = {}
+        self._cache = {}
+
+    def _check_file(self):
+        """Parse the area file, if not done already or if it has changed since."""
+        from pyresample.area_config import parse_area_file
+
+        stat = os.stat(self.area_file)
+        file_stat = (stat.st_mtime_ns, stat.st_size)
+        if file_stat == self._file_stat:
+            return
+
+        self._areas = {area.area_id: area for area in parse_area_file(self.area_file)}
+        self._cache = {}
+        self._file_stat = file_stat
+
+    def _get_cached(self, kind, areaid, create):
+        """Get an object derived from an area, creating it the first time."""
+        with self._lock:
+            self._check_file()
+            key = (kind, areaid)
+            if key not in self._cache:
+                try:
+                    area_def = self._areas[areaid]
+                except KeyError:
+                    raise KeyError("Area %s not defined in %s" % (areaid, self.area_file))
+                self._cache[key] = create(area_def)
+            return self._cache[key]
+
+    def get_area_def(self, areaid):
+        """Get the AreaDefinition of an area id."""
+        return self._get_cached('area_def', areaid, lambda area_def: area_def)
+
+    def get_cartopy_crs(self, areaid):
+        """Get the cartopy CRS of an area id."""
+        return self._get_cached('cartopy_crs', areaid, lambda area_def: area_def.to_cartopy_crs())
+
+    def get_lonlats(self, areaid):
+        """Get the longitudes and latitudes of the pixel centers of an area id."""
+        return self._get_cached('lonlats', areaid, lambda area_def: area_def.get_lonlats())
+
+    def get_transform(self, areaid):
+        """Get the affine transform (as used by rasterio) from pixel to projection coordinates of an area id."""
+        return self._get_cached('transform', areaid, get_affine_transform)
+
+
+def get_affine_transform(area_def):
+    """Get the affine transform from pixel (col, row) to projection coordinates of an area definition."""
+    from affine import Affine
+
+    xmin, _, _, ymax = area_def.area_extent
+    return Affine(area_def.pixel_size_x, 0.0, xmin, 0.0, -area_def.pixel_size_y, ymax)
+
+
+_REGISTRY = AreaRegistry()
+
+
+def get_area_def(areaid):
+    """Get the AreaDefinition of an area id from the process-wide registry."""
+    return _REGISTRY.get_area_def(areaid)
+
+
+def get_cartopy_crs(areaid):
+    """Get the cartopy CRS of an area id from the process-wide registry."""
+    return _REGISTRY.get_cartopy_crs(areaid)
+
+
+def get_lonlats(areaid):
+    """Get the longitudes and latitudes of an area id from the process-wide registry."""
+    return _REGISTRY.get_lonlats(areaid)
+
+
+def get_transform(areaid):
+    """Get the affine transform of an area id from the process-wide registry."""
+    return _REGISTRY.get_transform(areaid)
+
+
+def set_area_file(area_file):
+    """Point the process-wide registry to another area definition file."""
+    global _REGISTRY
+    _REGISTRY = AreaRegistry(area_file)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2022 Adam.Dybbroe
+
+# Author(s):
+
+#   Adam.Dybbroe <a000680@c21856.ad.smhi.se>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A spatio-temporal (time, y, x) cube of cloud masks remapped to an area.
+
+Every cloudmask scene in a time window is remapped to the target area once
+and appended to a chunked and compressed netCDF file with a scene time
+coordinate. Point time series, freshness maps and climatologies then become
+slices and reductions of the cube.
+"""
+
+import logging
+import os
+
+import numpy as np
+import netCDF4
+
+from fires_and_clouds.cloud_utils import get_cloudmask_scene
+from fires_and_clouds.cloud_utils import get_granule_start_times
+from fires_and_clouds.cloud_utils import get_satname_from_files
+from fires_and_clouds.cloud_utils import remap_cloudmask
+
+LOG = logging.getLogger(__name__)
+
+TIME_UNITS = 'seconds since 1970-01-01 00:00:00'
+NODATA = 255
+
+
+class CloudCoverCube(object):
+    """A (time, y, x) cube of remapped cloud masks stored in a netCDF file."""
+
+    def __init__(self, filename, area_def, chunk_size=256, time_chunk=8, complevel=4):
+        """Initialize."""
+        self.filename = filename
+        self.area_def = area_def
+        self.chunk_size = chunk_size
+        self.time_chunk = time_chunk
+        self.complevel = complevel
+        if not os.path.exists(self.filename):
+            self._create()
+
+    def _create(self):
+        """Create an empty cube file for the area."""
+        nlines, npixels = self.area_def.shape
+        with netCDF4.Dataset(self.filename, 'w') as nc_:
+            nc_.createDimension('time', None)
+            nc_.createDimension('y', nlines)
+            nc_.createDimension('x', npixels)
+
+            times = nc_.createVariable('time', 'f8', ('time',))
+            times.units = TIME_UNITS
+            times.standard_name = 'time'
+            nc_.createVariable('platform_name', str, ('time',))
+
+            chunks = (self.time_chunk, min(self.chunk_size, nlines), min(self.chunk_size, npixels))
+            cma = nc_.createVariable('cma', 'u1', ('time', 'y', 'x'), zlib=True,
+                                     complevel=self.complevel, chunksizes=chunks,
+                                     fill_value=NODATA)
+            cma.long_name = 'Cloudmask (0=cloudfree, 1=cloudy)'
+
+            nc_.area_id = self.area_def.area_id
+            nc_.crs_wkt = self.area_def.crs.to_wkt()
+            nc_.area_extent = np.array(self.area_def.area_extent)
+
+    def get_scene_times(self):
+        """Get the scene times of the cube as datetime objects."""
+        with netCDF4.Dataset(self.filename, 'r') as nc_:
+            times = nc_['time'][:]
+            if len(times) == 0:
+                return []
+            return list(netCDF4.num2date(times, TIME_UNITS, only_use_cftime_datetimes=False,
+                                         only_use_python_datetimes=True))
+
+    def append(self, scene_time, cloudmask, platform_name=''):
+        """Append a remapped cloudmask observed at scene_time to the cube."""
+        with netCDF4.Dataset(self.filename, 'a') as nc_:
+            idx = len(nc_.dimensions['time'])
+            nc_['time'][idx] = netCDF4.date2num(scene_time, TIME_UNITS)
+            nc_['platform_name'][idx] = platform_name
+            nc_['cma'][idx, :, :] = cloudmask
+
+    def get_point_series(self, lon, lat):
+        """Get the scene times and the cloudmask time series at a geographical position.
+
+        Raises a ValueError if the position is outside the area.
+        """
+        # With arrays, positions outside the area get masked indices:
+        cols, rows = self.area_def.get_array_indices_from_lonlat(np.atleast_1d(lon), np.atleast_1d(lat))
+        if np.ma.is_masked(cols) or np.ma.is_masked(rows):
+            raise ValueError("Position (%.4f, %.4f) is outside the area %s" % (lon, lat, self.area_def.area_id))
+        with netCDF4.Dataset(self.filename, 'r') as nc_:
+            series = nc_['cma'][:, int(np.ravel(rows)[0]), int(np.ravel(cols)[0])]
+        return self.get_scene_times(), series
+
+    def get_latest_cloudfree_time(self, end_time=None):
+        """Get a map of the scene time of the latest cloudfree view (seconds since 1970), masked if never seen.
+
+        Only scenes up to *end_time* are considered. The cube is reduced one
+        time chunk at a time to keep the memory bounded.
+        """
+        with netCDF4.Dataset(self.filename, 'r') as nc_:
+            times = nc_['time'][:]
+            latest = np.full(self.area_def.shape, np.nan)
+            if end_time is not None:
+                valid_times = np.flatnonzero(times <= netCDF4.date2num(end_time, TIME_UNITS))
+            else:
+                valid_times = np.arange(len(times))
+            for start in range(0, len(valid_times), self.time_chunk):
+                tidx = valid_times[start:start + self.time_chunk]
+                cma = nc_['cma'][tidx, :, :]
+                for cmask, stime in zip(cma, times[tidx]):
+                    cloudfree = np.ma.filled(cmask == 0, False)
+                    latest = np.where(cloudfree, np.fmax(latest, stime), latest)
+        return np.ma.masked_invalid(latest)
+
+
+def build_cloudcover_cube(pps_file_getter, area_def, filename, product_name='CMA', radius_of_influence=10000):
+    """Remap every cloudmask scene found by a PPSFilesGetter to an area and add it to a cube file.
+
+    Scenes already in the cube (same scene start time) are skipped, so an
+    existing cube can be extended with a later time window.
+    """
+
+    if not pps_file_getter.granules:
+        pps_file_getter.gather_granules(product_name)
+
+    cube = CloudCoverCube(filename, area_def)
+    existing_times = set(cube.get_scene_times())
+
+    scenes = []
+    for ppsfiles in pps_file_getter.pps_files[product_name].values():
+        scene_time = get_granule_start_times(ppsfiles)[0]
+        if scene_time not in existing_times:
+            scenes.append((scene_time, ppsfiles))
+
+    for scene_time, ppsfiles in sorted(scenes, key=lambda item: item[0]):
+        LOG.info("Add scene %s to cube", scene_time.strftime('%Y-%m-%d %H:%M:%S'))
+        scn = get_cloudmask_scene(ppsfiles)
+        cube.append(scene_time, remap_cloudmask(scn, area_def, radius_of_influence),
+                    get_satname_from_files(ppsfiles))
+
+    return cube
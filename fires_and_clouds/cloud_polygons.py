@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2022 Adam.Dybbroe
+
+# Author(s):
+
+#   Adam.Dybbroe <a000680@c21856.ad.smhi.se>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Polygonisation of cloud masks remapped to an area.
+
+The connected clouds (and cloudfree areas) of the remapped cloudmask are
+labelled, and the labels are split in square tiles which are polygonised
+in parallel worker processes, taking the geotransform directly from the
+area definition. The polygons are either dissolved to whole clouds, or cut
+at the tile borders carrying the tile row and column, so that the polygons
+of single tiles can be replaced later.
+The result is a GeoDataFrame which is bulk-written to a GeoPackage or
+FlatGeobuf file, or patched tile by tile into a persistent GeoPackage layer
+as new granules arrive.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fires_and_clouds.areas import get_area_def
+from fires_and_clouds.areas import get_transform
+
+NODATA = 255
+TILE_SIZE = 512
+
+
+def get_tile_windows(shape, tile_size=TILE_SIZE):
+    """Get the (tile_row, tile_col, row_slice, col_slice) of the tiles covering an array shape."""
+    nlines, npixels = shape
+    return [(row // tile_size, col // tile_size,
+             slice(row, min(row + tile_size, nlines)), slice(col, min(col + tile_size, npixels)))
+            for row in range(0, nlines, tile_size) for col in range(0, npixels, tile_size)]
+
+
+def polygonize_tile(data, transform_coeffs, nodata=NODATA):
+    """Polygonise one tile of a cloudmask, skipping no-data pixels.
+
+    *transform_coeffs* are the (a, b, c, d, e, f) coefficients of the affine
+    transform of the tile. Returns a list of (geojson-like geometry, raster
+    value) tuples.
+    """
+    from affine import Affine
+    from rasterio.features import shapes
+
+    mask = data != nodata
+    if not mask.any():
+        return []
+    return list(shapes(np.where(mask, data, 0), mask=mask, transform=Affine(*transform_coeffs)))
+
+
+def get_cloud_components(cloudmask, nodata=NODATA):
+    """Label the connected areas of equal value of a cloudmask (4-connected, as the polygons).
+
+    Returns the labels (int32, 0 for no data), and the raster value and the
+    number of pixels of each label (indexed by the label).
+    """
+    from scipy import ndimage
+
+    labels = np.zeros(cloudmask.shape, dtype='int32')
+    label_values = [nodata]
+    for value in np.unique(cloudmask):
+        if value == nodata:
+            continue
+        value_labels, nvalue_labels = ndimage.label(cloudmask == value)
+        inside = value_labels > 0
+        labels[inside] = value_labels[inside] + (len(label_values) - 1)
+        label_values.extend([value] * nvalue_labels)
+    sizes = np.bincount(labels.ravel(), minlength=len(label_values))
+    return labels, np.array(label_values, dtype='int32'), sizes
+
+
+def polygonize_cloudmask(cloudmask, areaid, tile_size=TILE_SIZE, workers=4, nodata=NODATA,
+                         simplify_tolerance=None, min_area=None, tiles=None):
+    """Polygonise a cloudmask on an area to a GeoDataFrame, tile by tile in parallel.
+
+    *simplify_tolerance* and *min_area* are in projection units (metres).
+    *min_area* applies to whole clouds (connected areas of equal value), not
+    to the pieces of them in each tile. Without *tiles* the pieces are
+    dissolved to whole clouds before simplifying, and tile_row and tile_col
+    are -1. With *tiles*, a set of (tile_row, tile_col), only those tiles
+    are polygonised, the polygons are cut at the tile borders and each piece
+    is simplified on its own.
+    """
+    import geopandas as gpd
+    import shapely
+
+    area_def = get_area_def(areaid)
+    transform = get_transform(areaid)
+    labels, label_values, label_sizes = get_cloud_components(np.asarray(cloudmask), nodata)
+    windows = [window for window in get_tile_windows(cloudmask.shape, tile_size)
+               if tiles is None or (window[0], window[1]) in tiles]
+    tile_args = [(labels[rows, cols],
+                  (transform.a, 0.0, transform.c + cols.start * transform.a,
+                   0.0, transform.e, transform.f + rows.start * transform.e),
+                  0)
+                 for _, _, rows, cols in windows]
+
+    if workers > 1 and len(tile_args) > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(polygonize_tile, *zip(*tile_args)))
+    else:
+        results = [polygonize_tile(*args) for args in tile_args]
+
+    geometries = []
+    components = []
+    tile_rows = []
+    tile_cols = []
+    for (tile_row, tile_col, _, _), features in zip(windows, results):
+        for geometry, label in features:
+            geometries.append(geometry)
+            components.append(int(label))
+            tile_rows.append(tile_row)
+            tile_cols.append(tile_col)
+
+    components = np.array(components, dtype='int32')
+    polygons = gpd.GeoDataFrame({'raster_val': label_values[components],
+                                 'tile_row': np.array(tile_rows, dtype='int32'),
+                                 'tile_col': np.array(tile_cols, dtype='int32'),
+                                 'component': components},
+                                geometry=[shapely.geometry.shape(geometry) for geometry in geometries],
+                                crs=area_def.crs)
+
+    if min_area:
+        pixel_area = abs(transform.a * transform.e)
+        polygons = polygons[label_sizes[components] * pixel_area >= min_area]
+    if tiles is None and len(polygons) > 0:
+        polygons = polygons.dissolve(by='component', aggfunc='first', as_index=False)
+        polygons[['tile_row', 'tile_col']] = -1
+    if simplify_tolerance:
+        polygons['geometry'] = polygons.geometry.simplify(simplify_tolerance, preserve_topology=True)
+
+    return polygons.drop(columns='component').reset_index(drop=True)
+
+
+def write_polygons(polygons, filename, layer='clouds'):
+    """Bulk-write cloud polygons to a file, as FlatGeobuf if it ends with .fgb and as GeoPackage otherwise."""
+    if filename.endswith('.fgb'):
+        polygons.to_file(filename, driver='FlatGeobuf')
+    else:
+        polygons.to_file(filename, driver='GPKG', layer=layer)
+
+
+def get_changed_tiles(changed, tile_size=TILE_SIZE):
+    """Get the set of (tile_row, tile_col) of the tiles with changed pixels."""
+    rows, cols = np.nonzero(changed)
+    ntile_cols = -(-changed.shape[1] // tile_size)
+    tiles = np.unique((rows // tile_size) * ntile_cols + cols // tile_size)
+    return {(int(tile // ntile_cols), int(tile % ntile_cols)) for tile in tiles}
+
+
+class CloudPolygonLayer(object):
+    """A persistent GeoPackage layer of cloud polygons, patched granule by granule.
+
+    The layer holds the polygons of the latest cloudmask seen in each pixel.
+    A new granule only changes the pixels under its swath, so only the tiles
+    where the cloudmask changed are polygonised again, and their features
+    are replaced in the layer. As the polygons are cut at the tile borders,
+    the other tiles stay valid as they are. With *min_area*, all the tiles
+    of the clouds touching the changed pixels are polygonised again, as
+    their area decides whether they are kept.
+    """
+
+    def __init__(self, filename, areaid, layer='clouds', tile_size=TILE_SIZE, workers=4,
+                 simplify_tolerance=None, min_area=None):
+        """Initialize, continuing from the cloudmask state saved next to the layer if any."""
+        self.filename = filename
+        self.areaid = areaid
+        self.layer = layer
+        self.tile_size = tile_size
+        self.workers = workers
+        self.simplify_tolerance = simplify_tolerance
+        self.min_area = min_area
+        self.state_file = filename + '.state.npy'
+        if os.path.exists(self.state_file) and os.path.exists(self.filename):
+            self.cloudmask = np.load(self.state_file)
+        else:
+            self.cloudmask = np.full(get_area_def(areaid).shape, NODATA, dtype=np.uint8)
+
+    def update(self, granule_cloudmask):
+        """Add a cloudmask granule remapped to the area (NODATA outside the swath).
+
+        Returns the number of tiles polygonised again.
+        """
+        swath = granule_cloudmask != NODATA
+        cloudmask = np.where(swath, granule_cloudmask, self.cloudmask)
+        changed = cloudmask != self.cloudmask
+        if self.min_area and changed.any():
+            # The clouds touching the changed pixels may have grown or shrunk
+            # across the minimum area, in any of the tiles they cover:
+            for labels in (get_cloud_components(self.cloudmask)[0], get_cloud_components(cloudmask)[0]):
+                changed |= np.isin(labels, np.unique(labels[changed])) & (labels > 0)
+        changed_tiles = get_changed_tiles(changed, self.tile_size)
+        self.cloudmask = cloudmask
+        if not changed_tiles:
+            return 0
+
+        polygons = self._polygonize(changed_tiles)
+        if os.path.exists(self.filename):
+            self._delete_tiles(changed_tiles)
+            if len(polygons) > 0:
+                polygons.to_file(self.filename, driver='GPKG', layer=self.layer, mode='a')
+        elif len(polygons) > 0:
+            write_polygons(polygons, self.filename, self.layer)
+        np.save(self.state_file, self.cloudmask)
+
+        return len(changed_tiles)
+
+    def _polygonize(self, tiles):
+        return polygonize_cloudmask(self.cloudmask, self.areaid, tile_size=self.tile_size,
+                                    workers=self.workers, simplify_tolerance=self.simplify_tolerance,
+                                    min_area=self.min_area, tiles=tiles)
+
+    def _delete_tiles(self, tiles):
+        """Delete the features of the tiles from the layer (the spatial index is kept up to date by its triggers)."""
+        import sqlite3
+
+        with sqlite3.connect(self.filename) as conn:
+            conn.executemany('DELETE FROM "%s" WHERE tile_row = ? AND tile_col = ?' % self.layer,
+                             sorted(tiles))
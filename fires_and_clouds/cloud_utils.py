@@ -23,253 +23,382 @@
 """Helper functions to handle cloud information from the NWCSAF
 """
 
+import hashlib
+import json
+import logging
 import os
-from glob import glob
 import numpy as np
-from matplotlib import cm
-import matplotlib
-import matplotlib.pyplot as plt
-import cartopy.feature as cf
 
-from datetime import datetime, timedelta
-
-from satpy import Scene
-from satpy.utils import debug_on
-from trollsift.parser import Parser, globify
-from pykdtree.kdtree import KDTree
-from pyresample import load_area
-from pyresample import kd_tree, geometry
-
-from trollimage.colormap import rdbu, ylgnbu
-from trollimage.image import Image
-
-
-# debug_on()
+from datetime import datetime
+
+from fires_and_clouds.pps_files import PPS_PATH  # noqa: F401
+from fires_and_clouds.pps_files import PATTERN  # noqa: F401
+from fires_and_clouds.pps_files import PPS_SATNAMES  # noqa: F401
+from fires_and_clouds.pps_files import PRODUCT_DATASETS
+from fires_and_clouds.pps_files import PPSFilesGetter  # noqa: F401
+from fires_and_clouds.pps_files import get_granule_start_times
+from fires_and_clouds.pps_files import get_satname_from_files
+from fires_and_clouds.pps_files import get_sibling_product_files
+from fires_and_clouds.areas import get_area_def
+from fires_and_clouds.instrumentation import count, timer
+from fires_and_clouds.memory_profiling import memory_stage
+from fires_and_clouds.neighbours import get_sample_from_index
+from fires_and_clouds.resampling import resample
+from fires_and_clouds.pps_netcdf import PPSNetCDFReader
+from fires_and_clouds.swath_locator import SwathLocator
+from fires_and_clouds.areas import get_cartopy_crs
+from fires_and_clouds.satellite_scanning_geometry import get_swath_scanline_times
+from fires_and_clouds.satellite_scanning_geometry import get_timing_sensor
+
+
+# The heavy packages (satpy, pyresample, matplotlib, cartopy, trollimage) are
+# imported where they are used, so that importing this module stays cheap.
+
+LOG = logging.getLogger(__name__)
 
 AREAID = 'euron1'
-AREA_DEF_FILE = "/home/a000680/usr/src/pytroll-config/etc/areas.yaml"
 
-PPS_PATH = "/data/lang/satellit/polar/PPS_products/satproj/"
+EPOCH = np.datetime64('1970-01-01T00:00:00', 'us')
+MINUTES_NODATA = 65535
 
-# S_NWC_CMA_eos1_99033_20180731T2128120Z_20180731T2141123Z.nc
-PATTERN = "S_NWC_{product:s}_{platform_name:s}_{orbit_number:5d}_{starttime:%Y%m%dT%H%M%S%fZ}_{endtime:%Y%m%dT%H%M%S%fZ}.nc"
+# Positions further away (metres) from the nearest swath pixel are outside the swath:
+MAX_POINT_DISTANCE = 5000
 
-# PLATFORM_NAMES = {'npp': 'Suomi-NPP',
-#                  'noaa20': 'NOAA-20'}
+# No data value of the MESAN cloud amount ASCII grids:
+MESAN_NODATA = -999
 
-PPS_SATNAMES = {'npp': 'Suomi-NPP',
-                'eos1': 'EOS-Terra',
-                'eos2': 'EOS-Aqua',
-                'noaa18': 'NOAA-18',
-                'noaa19': 'NOAA-19',
-                'noaa20': 'NOAA-20',
-                'metopc': 'Metop-C',
-                'metopb': 'Metop-B',
-                'metopa': 'Metop-A',
-                'noaa15': 'NOAA-15'}
+# Datasets with class values (statistics are the most frequent class):
+CATEGORICAL_DATASETS = ['ct', 'cmic_phase']
 
 
 def get_cloudmask_scene(ppsfiles):
     """Get a cloudmask scene from a set of files."""
+    from satpy import Scene
 
     filenames = {'nwcsaf-pps_nc': ppsfiles}
-    scn = Scene(filenames=filenames)
-    scn.load(['cma', 'cloudmask'])
+    with timer('file_open'):
+        scn = Scene(filenames=filenames)
+        scn.load(['cma', 'cloudmask'])
+    count('files_opened', len(ppsfiles))
+    scn.attrs['granule_start_times'] = get_granule_start_times(ppsfiles)
 
     return scn
 
 
-def get_satname_from_files(pps_files):
-    """From a set of pps files extract the satellite name."""
+def get_sensor_from_scene(scn):
+    """Get the name of the instrument of a scene as used for the scan timing."""
 
-    pattern = 'S_NWC_{product:s}_{satid:s}_{orbit:s}_{start_time:%Y%m%dT%H%M%S%fZ}_{end_time:%Y%m%dT%H%M%S%fZ}.nc'
+    return get_timing_sensor(scn.sensor_names)
 
-    bname = os.path.basename(pps_files[0])
-    p__ = Parser(pattern)
-    res = p__.parse(bname)
-    return PPS_SATNAMES.get(res['satid'], res['satid'])
 
+def get_scene_scanline_times(scn, dataset='cma'):
+    """Get the observation time of each scan line of a (multi-granule) scene dataset.
 
-class PPSFilesGetter(object):
-    """Getting PPS cloud product files in a given time interval."""
+    Returns a numpy datetime64 array with one time per line. The times are
+    derived from the nominal scan timing of the instrument, anchored at the
+    start time of each granule. For unknown instruments the lines are spread
+    evenly over the scene duration.
+    """
 
-    def __init__(self, basedir, starttime, endtime, pattern=PATTERN):
-        """Initialize."""
-        self.basedir = basedir
-        self.start_time = starttime
-        self.end_time = endtime
-        self.platforms = []
-        self.product = None
-        self.pattern = pattern
-        self.parser = Parser(self.pattern)
-        self.pps_files = {}
-        self.granules = False
-
-    def collect_product_files(self, platforms=list(PPS_SATNAMES.values()), product_name='CMA'):
-        """Search PPS cloud product files within a time interval and add to the pps_files dict."""
-
-        otime = self.start_time
-        subdirs = []
-        while otime < self.end_time:
-            subdir = os.path.join(self.basedir, otime.strftime('%Y/%m/%d'))
-            if subdir not in subdirs:
-                subdirs.append(subdir)
-            otime = otime + timedelta(days=1)
-
-        flist = []
-        for sdir in subdirs:
-            flist = flist + glob(os.path.join(sdir, globify(self.pattern, {'product': product_name})))
-
-        newflist = []
-        for fpath in flist:
-            fname = os.path.basename(fpath)
-            res = self.parser.parse(fname)
-            if PPS_SATNAMES.get(res['platform_name']) not in platforms:
-                continue
-            if res['starttime'] < self.start_time or res['endtime'] > self.end_time:
-                continue
+    # The times of a scene cropped to an area are those of its lines in the full swath:
+    shape = scn.attrs.get('swath_shape', scn[dataset].shape)
+    rows = scn.attrs.get('swath_slices', (slice(None), slice(None)))[0]
 
-            newflist.append(fpath)
+    return get_swath_scanline_times(get_sensor_from_scene(scn), shape,
+                                    scn[dataset].attrs['start_time'], scn[dataset].attrs['end_time'],
+                                    scn.attrs.get('granule_start_times'))[rows]
 
-        if product_name not in self.pps_files:
-            self.pps_files[product_name] = newflist
-        else:
-            self.pps_files[product_name] = self.pps_files[product_name] + newflist
 
-    def gather_granules(self, product_name):
-        """Gather granules"""
+def get_area_crop_slices(swath_def, area_def, margin=20000, step=16):
+    """Get the (row, col) slices of the part of a swath covering an area, or None if it misses the area.
 
-        granule_collection = {}
-        for filepath in self.pps_files[product_name]:
-            res = self.parser.parse(os.path.basename(filepath))
-            keyname = res['platform_name'] + '_' + str(res['orbit_number'])
-            if keyname not in granule_collection:
-                granule_collection[keyname] = [filepath]
-            else:
-                granule_collection[keyname].append(filepath)
+    The geolocation is tested on every *step*:th line and pixel only,
+    projected to the area and compared to the area extent widened by
+    *margin* metres. The slices are widened by one step, so that no swath
+    pixel inside the area is lost between the tested ones.
+    """
+    from pyproj import Proj
 
-        self.granules = True
-        self.pps_files[product_name] = granule_collection
+    lons = np.asarray(swath_def.lons[::step, ::step], dtype='float64')
+    lats = np.asarray(swath_def.lats[::step, ::step], dtype='float64')
+    valid = np.isfinite(lons) & np.isfinite(lats)
+    xcoords, ycoords = Proj(area_def.crs)(np.where(valid, lons, 0), np.where(valid, lats, 0))
 
+    xmin, ymin, xmax, ymax = area_def.area_extent
+    inside = (valid & (xcoords >= xmin - margin) & (xcoords <= xmax + margin) &
+              (ycoords >= ymin - margin) & (ycoords <= ymax + margin))
+    if not inside.any():
+        return None
 
-def get_cloudfraction(lons, lats, filename):
-    """Read the PPS cloudmask file and retrieve the cloud fraction at specified geographical positions."""
+    nlines, npixels = swath_def.shape
+    rows = np.flatnonzero(inside.any(axis=1))
+    cols = np.flatnonzero(inside.any(axis=0))
+    return (slice(max(int(rows[0] - 1) * step, 0), min(int(rows[-1] + 2) * step, nlines)),
+            slice(max(int(cols[0] - 1) * step, 0), min(int(cols[-1] + 2) * step, npixels)))
 
-    scn = Scene(filenames=[filename], reader='nwcsaf-pps_nc')
-    scn.load(['cma'])
 
-    try:
-        start_time = scn.attrs['start_time']
-        end_time = scn.attrs['end_time']
-    except KeyError:
-        start_time = scn.start_time
-        end_time = scn.end_time
-
-    if 'viirs' in scn.sensor_names:
-        pixels_per_scan = 16
-    elif 'avhrr-3' in scn.sensor_names or 'avhrr' in scn.sensor_names:
-        pixels_per_scan = 1
-    else:
-        pixels_per_scan = 10
-
-    geodata = np.vstack((scn['cma'].area.lons.values.ravel(),
-                         scn['cma'].area.lats.values.ravel())).T
-    kd_tree = KDTree(geodata)
-    shape = scn['cma'].shape
-    number_of_scans = shape[0] / pixels_per_scan
-    time_per_scan = (end_time - start_time) / number_of_scans
-
-    req_point = np.vstack((lons, lats)).T.astype('float32')
-    dists, kidx = kd_tree.query(req_point, k=1)
-
-    rows, cols = kidx[:] / shape[1], kidx[:] % shape[1]
-    rows = np.round(rows).astype('int')
-    cols = np.round(cols).astype('int')
-
-    obstimes = start_time + np.divide(rows, pixels_per_scan) * time_per_scan
+def crop_scene_to_area(scn, area_def, radius_of_influence=10000, dataset='cma'):
+    """Crop a swath scene to the lines and pixels needed to resample it to an area.
+
+    The datasets and the geolocation are sliced lazily, so only the part of
+    the swath covering the area is read and resampled. A scene missing the
+    area is cut to a corner of the swath, which resamples to no data.
+    """
+
+    full_shape = scn[dataset].shape
+    slices = get_area_crop_slices(scn[dataset].area, area_def, margin=2 * radius_of_influence)
+    if slices is None:
+        slices = (slice(0, min(2, full_shape[0])), slice(0, min(2, full_shape[1])))
+    if (slices[0].stop - slices[0].start, slices[1].stop - slices[1].start) == full_shape:
+        return scn
+
+    with timer('crop'):
+        cropped = scn.slice(slices)
+    cropped.attrs['swath_shape'] = full_shape
+    cropped.attrs['swath_slices'] = slices
+    count('swath_pixels_cropped', full_shape[0] * full_shape[1] - cropped[dataset].size)
+
+    return cropped
+
+
+def get_swath_neighbours(swath_def, lons, lats):
+    """Find the swath pixels nearest to the requested geographical positions.
+
+    Returns the rows, columns and great circle distances (metres) of the nearest pixels.
+    """
+
+    with timer('geolocation_load'):
+        swath_lons = swath_def.lons.values
+        swath_lats = swath_def.lats.values
+
+    return SwathLocator(swath_lons, swath_lats).query(lons, lats)
+
+
+def get_pixel_window(data, row, col, valid_range=None, half_width=2, fill_value=None):
+    """Get the valid (compressed) values in a small window centered on a swath pixel."""
+
+    arr = np.asarray(data[row-half_width: row+half_width+1, col-half_width: col+half_width+1])
+    arr = np.ma.masked_invalid(arr)
+    if fill_value is not None:
+        arr = np.ma.masked_equal(arr, fill_value)
+    if valid_range is not None:
+        arr = np.ma.masked_outside(arr, *valid_range)
+    return arr.compressed()
+
+
+def get_window_cloudfractions(cma, rows, cols, dists, max_distance=MAX_POINT_DISTANCE):
+    """Get the cloud fraction in the pixel windows centered on swath pixels (NaN where unknown)."""
 
     clcovs = []
     for (row, col, dist) in zip(rows, cols, dists):
-        if dist < 0.1 and row >= 2 and col >= 2:
-            arr = scn['cma'].data[row-2: row+3, col-2: col+3]
-            arr = np.ma.masked_outside(arr, 0, 1)
-            arr = arr.compressed()
+        if dist < max_distance and row >= 2 and col >= 2:
+            arr = get_pixel_window(cma, row, col, valid_range=(0, 1))
             if len(arr) > 0:
                 clcovs.append(arr.sum() / arr.shape[0])
+                count('points_hit')
             else:
                 clcovs.append(np.nan)
+                count('points_nodata')
         else:
             clcovs.append(np.nan)
-            print("Outside or no-data. Continue...")
+            count('points_outside')
+
+    return np.array(clcovs)
+
 
-    return np.array(clcovs), obstimes
+def get_cloudfraction(lons, lats, filename, windowed=True, max_distance=MAX_POINT_DISTANCE):
+    """Read the PPS cloudmask file and retrieve the cloud fraction at specified geographical positions.
+
+    If *windowed*, only a decimated geolocation and the small windows around
+    the positions are read directly from the netCDF file. Otherwise (and for
+    files without full resolution geolocation) the whole granule is read
+    with satpy. Positions further than *max_distance* (metres) from the
+    nearest pixel are outside the swath.
+    """
+    if windowed:
+        with PPSNetCDFReader(filename) as reader:
+            if reader.has_geolocation:
+                with memory_stage('cloudfraction.neighbours'):
+                    line_times = reader.get_scanline_times()
+                    rows, cols, dists = reader.get_neighbours(lons, lats)
+                with memory_stage('cloudfraction.windows'):
+                    clcovs = get_window_cloudfractions(reader['cma'], rows, cols, dists, max_distance)
+                return clcovs, line_times[rows].astype(datetime)
+
+    from satpy import Scene
+
+    with timer('file_open'), memory_stage('cloudfraction.read'):
+        scn = Scene(filenames=[filename], reader='nwcsaf-pps_nc')
+        scn.load(['cma'])
+    count('files_opened')
+
+    with memory_stage('cloudfraction.neighbours'):
+        line_times = get_scene_scanline_times(scn, 'cma')
+        rows, cols, dists = get_swath_neighbours(scn['cma'].area, lons, lats)
+
+    with memory_stage('cloudfraction.windows'):
+        clcovs = get_window_cloudfractions(scn['cma'].data, rows, cols, dists, max_distance)
+
+    return clcovs, line_times[rows].astype(datetime)
+
+
+def get_window_statistics(dataset_name, arr):
+    """Get the statistics of the valid values in a pixel window for one PPS dataset."""
+
+    if dataset_name == 'cma':
+        if len(arr) == 0:
+            return {'cloud_fraction': np.nan}
+        return {'cloud_fraction': arr.sum() / arr.shape[0]}
+
+    if dataset_name in CATEGORICAL_DATASETS:
+        if len(arr) == 0:
+            return {'mode': np.nan}
+        values, counts = np.unique(arr, return_counts=True)
+        return {'mode': values[np.argmax(counts)]}
+
+    if len(arr) == 0:
+        return {'mean': np.nan, 'min': np.nan, 'max': np.nan}
+    return {'mean': arr.mean(), 'min': arr.min(), 'max': arr.max()}
+
+
+def get_cloud_statistics(lons, lats, ppsfile, products=list(PRODUCT_DATASETS.keys()),
+                         max_distance=MAX_POINT_DISTANCE):
+    """Retrieve statistics of several PPS cloud products at specified geographical positions.
+
+    The sibling files (CMA, CT, CTTH, CMIC, ...) of the granule of *ppsfile*
+    are opened together in one Scene. The geolocation is read and the
+    neighbour search done only once, and the indices are shared by all
+    products. Returns a pandas DataFrame with one row per position and one
+    column per product dataset statistic. Positions further than
+    *max_distance* (metres) from the nearest pixel are outside the swath.
+    The fill values and the values outside the valid range of each dataset
+    are left out of the statistics. Raises a ValueError if none of the
+    datasets can be loaded.
+    """
+    import pandas as pd
+    from satpy import Scene
+
+    sibling_files = get_sibling_product_files(ppsfile, products)
+    if not sibling_files:
+        raise ValueError("None of the products %s found for %s" % (products, ppsfile))
+    datasets = [dname for product in sibling_files for dname in PRODUCT_DATASETS[product]]
+
+    with timer('file_open'):
+        scn = Scene(filenames=list(sibling_files.values()), reader='nwcsaf-pps_nc')
+        scn.load(datasets)
+    count('files_opened', len(sibling_files))
+    datasets = [dname for dname in datasets if dname in scn]
+    if not datasets:
+        raise ValueError("None of the datasets of %s could be loaded from %s" %
+                         (list(sibling_files), list(sibling_files.values())))
+
+    ref_name = datasets[0]
+    line_times = get_scene_scanline_times(scn, ref_name)
+    rows, cols, dists = get_swath_neighbours(scn[ref_name].area, lons, lats)
+
+    table = {'lon': lons, 'lat': lats,
+             'obstime': line_times[rows].astype(datetime),
+             'row': rows, 'col': cols, 'distance': dists}
+    inside = (dists < max_distance) & (rows >= 2) & (cols >= 2)
+    count('points_hit', int(inside.sum()))
+    count('points_outside', int((~inside).sum()))
+
+    for dname in datasets:
+        if scn[dname].shape != scn[ref_name].shape:
+            LOG.warning("Dataset %s not on the same swath grid as %s. Skip", dname, ref_name)
+            continue
+        data = scn[dname].data
+        # Leave out the fill values, which would otherwise count e.g. as the most frequent class:
+        valid_range = scn[dname].attrs.get('valid_range')
+        if valid_range is None and dname == 'cma':
+            valid_range = (0, 1)
+        fill_value = scn[dname].attrs.get('_FillValue')
+        for (idx, row, col) in zip(range(len(rows)), rows, cols):
+            if inside[idx]:
+                stats = get_window_statistics(dname, get_pixel_window(data, row, col, valid_range=valid_range,
+                                                                      fill_value=fill_value))
+            else:
+                stats = get_window_statistics(dname, np.array([]))
+            for key in stats:
+                table.setdefault('%s_%s' % (dname, key), []).append(stats[key])
+
+    return pd.DataFrame(table)
+
+
+def resample_to_area(lons, lats, data, area_def, radius_of_influence=10000, fill_value=None, resampler='nearest',
+                     sensor=None):
+    """Remap swath data to an area, by default with nearest neighbour resampling.
+
+    The radius of influence is in metres. See the resampling module for the
+    other resamplers, the 'auto' choice depends on the *sensor*. This is a
+    plain module level function, so it can also be run in a separate worker
+    process.
+    """
+
+    with timer('resample'):
+        return resample(lons, lats, data, area_def, radius_of_influence=radius_of_influence,
+                        fill_value=fill_value, resampler=resampler, sensor=sensor)
 
 
 class LastCloudfreeView(object):
     """Keep track of the time of the last cloudfree observation."""
 
-    def __init__(self, areaid, start_datetime):
+    def __init__(self, areaid, start_datetime, crop_to_area=True, resampler='nearest'):
 
         self.areaid = areaid
+        self.crop_to_area = crop_to_area
+        self.resampler = resampler
         self.start_time = start_datetime
         self.seconds = None
-        self.area_def = load_area(AREA_DEF_FILE, self.areaid)
-        self._crs = self.area_def.to_cartopy_crs()
+        self.area_def = get_area_def(self.areaid)
+        self._crs = get_cartopy_crs(self.areaid)
 
         self.relative_obstimes = None
         self.scene_ids = []
+        self._renderer = None
 
     def get_cloudmask(self, ppsfiles):
 
-        scn = get_cloudmask_scene(ppsfiles)
+        with memory_stage('cloudfree_view.read'):
+            scn = get_cloudmask_scene(ppsfiles)
+            if self.crop_to_area:
+                scn = crop_scene_to_area(scn, self.area_def)
         scene_id = {'satellite': get_satname_from_files(ppsfiles),
                     'start_time': scn.start_time}
         self.scene_ids.append(scene_id)
         return scn
 
-    def map_data(self, lons, lats, time_data):
+    def map_data(self, lons, lats, time_data, sensor=None):
         """Remap the data to projected area."""
-        swath_def = geometry.SwathDefinition(lons=lons, lats=lats)
-        result = kd_tree.resample_nearest(swath_def, time_data,
-                                          self.area_def, radius_of_influence=10000,
-                                          fill_value=None)
-        return result
+        with memory_stage('cloudfree_view.resample'):
+            return resample_to_area(lons, lats, time_data, self.area_def, radius_of_influence=10000,
+                                    resampler=self.resampler, sensor=sensor)
 
     def set_time_dataset(self, data):
 
-        if self.relative_obstimes is None:
-            self.relative_obstimes = data
-        else:
-            # Change only the pixels where it was cloudy before
-            mask1 = self.relative_obstimes.mask
-            mask2 = data.mask
-            self.relative_obstimes = np.ma.where(mask1, data, self.relative_obstimes)
-            self.relative_obstimes.mask = np.logical_and(mask1, mask2)
+        with timer('composite_update'), memory_stage('cloudfree_view.composite_update'):
+            if self.relative_obstimes is None:
+                self.relative_obstimes = data
+            else:
+                # Change only the pixels where it was cloudy before
+                mask1 = self.relative_obstimes.mask
+                mask2 = data.mask
+                self.relative_obstimes = np.ma.where(mask1, data, self.relative_obstimes)
+                self.relative_obstimes.mask = np.logical_and(mask1, mask2)
 
     def get_scene_times_cloudfree_view(self, scn):
         """Create a dataset with seconds from start_time to observation for all cloudfree pixels."""
 
         # Create an observation time dataset:
-        num_of_lines = scn['cma'].shape[0]
         num_of_pixels_per_line = scn['cma'].shape[1]
-        start_time_scene = scn['cma'].start_time
-        end_time_scene = scn['cma'].end_time
-        scene_length = end_time_scene - start_time_scene
-        nsec = scene_length.total_seconds()
-
-        delta_step = nsec/(num_of_pixels_per_line * num_of_lines)
-
-        start_seconds = (self.start_time - start_time_scene).total_seconds()
-
-        time_data = np.arange(num_of_pixels_per_line * num_of_lines)
-        time_data = time_data.reshape(num_of_lines, num_of_pixels_per_line)
-        time_data = time_data * delta_step
-        time_data = time_data + start_seconds
+        line_times = get_scene_scanline_times(scn, 'cma')
 
-        # Convert to minutes:
-        time_data = (time_data / 60).astype('int')
+        # Minutes from the observation of each line to the start_time:
+        minutes = (np.datetime64(self.start_time, 'us') - line_times) / np.timedelta64(60, 's')
+        with memory_stage('cloudfree_view.time_data'):
+            time_data = np.repeat(minutes.astype('int')[:, np.newaxis], num_of_pixels_per_line, axis=1)
 
-        print("Min and max times in seconds: %d %d" % (time_data.min(), time_data.max()))
+        LOG.debug("Min and max times in minutes: %d %d", time_data.min(), time_data.max())
 
         # Create an array where value is -1 where it is cloudy:
         #time_data[scn['cma'].data == 1] = -1
@@ -278,59 +407,93 @@ class LastCloudfreeView(object):
         mask = scn['cma'].data == 255
         #time_data = np.ma.masked_array(time_data, mask=mask)
 
-        time_data = np.ma.masked_where(np.logical_or(scn['cma'].data == 1, scn['cma'].data == 255), time_data)
+        with memory_stage('cloudfree_view.cloud_masking'):
+            time_data = np.ma.masked_where(np.logical_or(scn['cma'].data == 1, scn['cma'].data == 255), time_data)
         #time_data.fill_value = 0
 
-        lons = np.ma.masked_array(scn['cma'].area.lons.data.compute(), mask=mask)
-        lats = np.ma.masked_array(scn['cma'].area.lats.data.compute(), mask=mask)
+        with timer('geolocation_load'), memory_stage('cloudfree_view.geolocation'):
+            lons = np.ma.masked_array(scn['cma'].area.lons.data.compute(), mask=mask)
+            lats = np.ma.masked_array(scn['cma'].area.lats.data.compute(), mask=mask)
 
         return lons, lats, time_data
 
-    def plot_data(self, filename, max_minutes=720):
+    def save(self, filename, chunk_size=256, complevel=4):
+        """Save the minutes since last cloudfree view and the scene ids to a netCDF file.
+
+        The minutes are stored as uint16 (values above 65534 are clipped) in
+        compressed chunks, so that sub-regions can be read without decoding
+        the whole area, see read_minutes_since_cloudfree.
+        """
+        import netCDF4
 
-        #cmap = cm.YlGn
-        #cmaplist = [cmap(i) for i in range(cmap.N)]
-        # create the new map
-        #mycmap = cmap.from_list('Custom cmap', cmaplist, cmap.N)
+        if self.relative_obstimes is None:
+            raise ValueError("No scene added to the cloudfree view, nothing to save")
+
+        nlines, npixels = self.area_def.shape
+        minutes = np.ma.masked_array(self.relative_obstimes)
+        minutes = np.ma.clip(np.ma.round(minutes), 0, MINUTES_NODATA - 1)
+        with netCDF4.Dataset(filename, 'w') as nc_:
+            nc_.createDimension('y', nlines)
+            nc_.createDimension('x', npixels)
+            nc_.createDimension('scene', len(self.scene_ids))
+
+            chunks = (min(chunk_size, nlines), min(chunk_size, npixels))
+            var = nc_.createVariable('minutes', 'u2', ('y', 'x'), zlib=True, complevel=complevel,
+                                     chunksizes=chunks, fill_value=MINUTES_NODATA)
+            var.long_name = 'Minutes since last cloudfree view'
+            var.units = 'minutes'
+            var[:, :] = minutes.astype('uint16')
+
+            times = nc_.createVariable('scene_start_time', 'f8', ('scene',))
+            times.units = 'seconds since 1970-01-01 00:00:00'
+            platforms = nc_.createVariable('scene_platform_name', str, ('scene',))
+            for idx, scene_id in enumerate(self.scene_ids):
+                times[idx] = netCDF4.date2num(scene_id['start_time'], times.units)
+                platforms[idx] = scene_id['satellite']
+
+            nc_.start_time = self.start_time.strftime('%Y-%m-%dT%H:%M:%S')
+            nc_.area_id = self.area_def.area_id
+            nc_.crs_wkt = self.area_def.crs.to_wkt()
+            nc_.area_extent = np.array(self.area_def.area_extent)
+
+    def load(self, filename):
+        """Load (and continue from) a view saved earlier for the same area."""
+        import netCDF4
+
+        with netCDF4.Dataset(filename, 'r') as nc_:
+            if nc_.area_id != self.area_def.area_id:
+                raise ValueError("Cloudfree view file is for area %s, not %s" %
+                                 (nc_.area_id, self.area_def.area_id))
+            self.start_time = datetime.strptime(nc_.start_time, '%Y-%m-%dT%H:%M:%S')
+            self.relative_obstimes = np.ma.masked_array(nc_['minutes'][:, :].astype('int'))
+            times = nc_['scene_start_time']
+            start_times = netCDF4.num2date(times[:], times.units, only_use_cftime_datetimes=False,
+                                           only_use_python_datetimes=True)
+            self.scene_ids = [{'satellite': str(platform_name), 'start_time': start_time}
+                              for platform_name, start_time in zip(nc_['scene_platform_name'][:], start_times)]
 
-        mycmap = cm.viridis
+    def plot_data(self, filename, max_minutes=720):
+        """Plot the minutes since last cloudfree view on a map and save it to *filename*.
 
-        # Plot the data with Cartopy:
-        plt.figure(figsize=(14, 12))
-        if len(self.scene_ids) > 1:
-            time_span = '%s to %s' % (self.scene_ids[0]['start_time'].strftime('%Y-%m-%d %H%M'),
-                                      self.scene_ids[-1]['start_time'].strftime('%Y-%m-%d %H%M'))
-        else:
-            time_span = '%s' % self.scene_ids[0]['start_time'].strftime('%Y-%m-%d %H%M')
-
-        # font = {'family': 'normal',
-        #         'weight': 'bold',
-        #         'size': 20}
-        # matplotlib.rc('font', **font)
-
-        plt.rc('font', size=18)
-        plt.tick_params(axis='both', labelsize=0, length=0)
-        plt.title('Minutes since last cloudfree view: %s' % time_span)
-        ax = plt.axes(projection=self._crs)
-        ax.coastlines()
-        ax.add_feature(cf.BORDERS)
-        ax.gridlines()
-        ax.set_global()
-        plt.imshow(self.relative_obstimes, transform=self._crs,
-                   extent=self._crs.bounds, interpolation='nearest',
-                   origin='upper', cmap=mycmap)
-        plt.clim(0, max_minutes)
-        cbar = plt.colorbar()
-        cbar.set_label("Minutes")
-        # ax.tick_params(axis=u'both', which=u'both',length=0) # Not tested!
-        plt.savefig(filename)
-        plt.clf()
+        The map background is built once and reused between calls.
+        """
+        from fires_and_clouds.rendering import CloudfreeViewRenderer
+        from fires_and_clouds.rendering import get_time_span_text
+
+        if self._renderer is None:
+            self._renderer = CloudfreeViewRenderer(self.areaid, max_minutes)
+        self._renderer.set_max_minutes(max_minutes)
+        self._renderer.render(self.relative_obstimes,
+                              'Minutes since last cloudfree view: %s' % get_time_span_text(self.scene_ids),
+                              filename)
 
     def create_image(self):
+        from trollimage.colormap import rdbu, ylgnbu
+        from trollimage.image import Image
 
         data = self.relative_obstimes
         img = Image(data, mode="L", fill_value=None)
-        print("Min: %d" % data.min())
+        LOG.debug("Min: %d", data.min())
 
         rdbu.set_range(0, data.max())
         img.colorize(ylgnbu)
@@ -338,6 +501,17 @@ class LastCloudfreeView(object):
         return img
 
 
+def read_minutes_since_cloudfree(filename, rows=slice(None), cols=slice(None)):
+    """Read a (sub-region of a) minutes since last cloudfree view file, masked where never seen cloudfree.
+
+    Only the compressed chunks overlapping the *rows* and *cols* slices are decoded.
+    """
+    import netCDF4
+
+    with netCDF4.Dataset(filename, 'r') as nc_:
+        return np.ma.masked_array(nc_['minutes'][rows, cols])
+
+
 def create_clfree_freshness_from_cloudmask(scn):
     """Get the cloudmask and derive a freshness of cloudfree view from it.
 
@@ -348,39 +522,26 @@ def create_clfree_freshness_from_cloudmask(scn):
     """
 
     # Create an observation time dataset:
-    num_of_lines = scn['cma'].shape[0]
     num_of_pixels_per_line = scn['cma'].shape[1]
-    start_time = scn['cma'].start_time
-    end_time = scn['cma'].end_time
-    scene_length = end_time - start_time
-    nsec = scene_length.total_seconds()
+    start_time = scn['cma'].attrs['start_time']
+    line_times = get_scene_scanline_times(scn, 'cma')
 
-    delta_step = nsec/(num_of_pixels_per_line * num_of_lines)
+    start_of_day = np.datetime64(datetime(start_time.year, start_time.month, start_time.day), 'us')
+    seconds_of_day = (line_times - start_of_day) / np.timedelta64(1, 's')
 
-    start_seconds_of_day = (start_time -
-                            datetime(start_time.year,
-                                     start_time.month,
-                                     start_time.day)).total_seconds()
+    with memory_stage('freshness.time_data'):
+        time_data = np.repeat(seconds_of_day[:, np.newaxis], num_of_pixels_per_line, axis=1)
 
-    # total_seconds_one_day = 3600*24
+        # Create array where value is 0 where it is cloudy:
+        time_data[scn['cma'].data == 1] = 0
 
-    # time_data = (np.arange(num_of_pixels_per_line * num_of_lines) *
-    #             delta_step + start_seconds_of_day)
-    # time_data = time_data.reshape(num_of_lines, num_of_pixels_per_line)
-    time_data = np.arange(num_of_pixels_per_line * num_of_lines)
-    time_data = time_data.reshape(num_of_lines, num_of_pixels_per_line)
-    time_data = time_data * delta_step
-    time_data = time_data + start_seconds_of_day
-
-    # Create array where value is 0 where it is cloudy:
-    time_data[scn['cma'].data == 1] = 0
-
-    # Mask out "bowtie-deleted" pixels:
-    mask = scn['cma'].data == 255
-    time_data = np.ma.masked_array(time_data, mask=mask)
+        # Mask out "bowtie-deleted" pixels:
+        mask = scn['cma'].data == 255
+        time_data = np.ma.masked_array(time_data, mask=mask)
 
-    lons = np.ma.masked_array(scn['cma'].area.lons.data.compute(), mask=mask)
-    lats = np.ma.masked_array(scn['cma'].area.lats.data.compute(), mask=mask)
+    with timer('geolocation_load'), memory_stage('freshness.geolocation'):
+        lons = np.ma.masked_array(scn['cma'].area.lons.data.compute(), mask=mask)
+        lats = np.ma.masked_array(scn['cma'].area.lats.data.compute(), mask=mask)
 
     # plt.hist(time_data[::10, ::10])
     # plt.show()
@@ -388,30 +549,427 @@ def create_clfree_freshness_from_cloudmask(scn):
     return lons, lats, time_data
 
 
+def get_cloudfree_obstimes(scn):
+    """Get the observation time of all cloudfree pixels of a scene.
+
+    Returns the lons, lats and a float64 array with the observation time in
+    seconds since 1970-01-01, masked where it is cloudy or there is no data.
+    The lons and lats are masked where there is no data (e.g. the
+    "bowtie-deleted" pixels), so that the resampling takes the neighbouring
+    pixels with data instead.
+    """
+
+    num_of_pixels_per_line = scn['cma'].shape[1]
+    line_times = get_scene_scanline_times(scn, 'cma')
+    seconds = (line_times - EPOCH) / np.timedelta64(1, 's')
+
+    cma = np.asarray(scn['cma'].data)
+    time_data = np.repeat(seconds[:, np.newaxis], num_of_pixels_per_line, axis=1)
+    time_data = np.ma.masked_where(cma != 0, time_data)
+
+    nodata = (cma != 0) & (cma != 1)
+    with timer('geolocation_load'):
+        lons = np.ma.masked_array(scn['cma'].area.lons.values, mask=nodata)
+        lats = np.ma.masked_array(scn['cma'].area.lats.values, mask=nodata)
+
+    return lons, lats, time_data
+
+
+class CloudfreeFreshnessComposite(object):
+    """Running composite of the time of the latest cloudfree view over an area.
+
+    Scenes are added one at a time in any order. Each scene is remapped to
+    the area and reduced into the composite with a per-pixel maximum of the
+    observation times, so the memory use is bounded by one scene plus the
+    composite itself. The latest end time of the scenes added is kept in
+    *end_time*.
+    """
+
+    def __init__(self, area_def, radius_of_influence=10000, resampler='nearest'):
+        """Initialize."""
+        self.area_def = area_def
+        self.radius_of_influence = radius_of_influence
+        self.resampler = resampler
+        self.latest = np.full(self.area_def.shape, np.nan)
+        self.scene_ids = []
+        self.end_time = None
+
+    def update(self, ppsfiles):
+        """Read the cloudmask of a scene (a set of granules) and add it to the composite."""
+
+        scn = get_cloudmask_scene(ppsfiles)
+        self.scene_ids.append({'satellite': get_satname_from_files(ppsfiles),
+                               'start_time': scn['cma'].attrs['start_time']})
+        self.update_from_scene(scn)
+
+    def update_from_scene(self, scn):
+        """Add a cloudmask scene to the composite."""
+
+        end_time = scn['cma'].attrs['end_time']
+        if self.end_time is None or end_time > self.end_time:
+            self.end_time = end_time
+        scn = crop_scene_to_area(scn, self.area_def, self.radius_of_influence)
+        lons, lats, time_data = get_cloudfree_obstimes(scn)
+        result = resample_to_area(lons, lats, time_data, self.area_def,
+                                  radius_of_influence=self.radius_of_influence, resampler=self.resampler,
+                                  sensor=get_sensor_from_scene(scn))
+        with timer('composite_update'):
+            self.latest = np.fmax(self.latest, np.ma.filled(result.astype('float64'), np.nan))
+
+    def get_latest_cloudfree_time(self):
+        """Get the time of the latest cloudfree view in seconds since 1970, masked if never seen cloudfree."""
+        return np.ma.masked_invalid(self.latest)
+
+    def get_minutes_since_cloudfree(self, end_time):
+        """Get the minutes from the latest cloudfree view to end_time, masked if never seen cloudfree."""
+
+        end_seconds = (np.datetime64(end_time, 'us') - EPOCH) / np.timedelta64(1, 's')
+        return (end_seconds - self.get_latest_cloudfree_time()) / 60.
+
+
+def create_freshness_composite(granule_groups, area_def, radius_of_influence=10000, resampler='nearest'):
+    """Reduce a list of granule groups into a composite of the time of the latest cloudfree view.
+
+    The granule groups are lists of PPS cloudmask files, e.g. the values of
+    PPSFilesGetter.pps_files['CMA'] after gather_granules. The area is
+    handled once and the scenes are reduced in a single pass.
+    """
+
+    composite = CloudfreeFreshnessComposite(area_def, radius_of_influence, resampler)
+    for ppsfiles in granule_groups:
+        LOG.info("Add scene: %s", os.path.basename(ppsfiles[0]))
+        composite.update(ppsfiles)
+
+    return composite
+
+
+def remap_cloudmask(scn, area_def, radius_of_influence=10000):
+    """Remap the PPS cloudmask of a scene to an area.
+
+    Returns a uint8 array with 0 for cloudfree, 1 for cloudy and 255 where
+    there is no data. The swath pixels without data (e.g. "bowtie-deleted")
+    are left out of the resampling, so that they do not leave holes where
+    they are nearer than the neighbouring pixels with data.
+    """
+
+    scn = crop_scene_to_area(scn, area_def, radius_of_influence)
+    cma = np.ma.masked_invalid(np.asarray(scn['cma'].data, dtype='float32'))
+    cma = np.ma.masked_outside(cma, 0, 1).filled(255).astype('uint8')
+
+    lons = np.ma.masked_array(scn['cma'].area.lons.values, mask=cma == 255)
+    lats = np.ma.masked_array(scn['cma'].area.lats.values, mask=cma == 255)
+    return resample_to_area(lons, lats, cma, area_def, radius_of_influence=radius_of_influence, fill_value=255)
+
+
+def get_geo_cloudmask_scene(filename):
+    """Get a cloudmask scene from a NWCSAF-GEO file (one slot of a geostationary satellite)."""
+    from satpy import Scene
+
+    with timer('file_open'):
+        scn = Scene(filenames=[filename], reader='nwcsaf-geo')
+        scn.load(['cma'])
+    count('files_opened')
+
+    return scn
+
+
+def get_fixed_grid_index(source_def, area_def):
+    """Get the flat index of the fixed grid pixel holding the centre of each area pixel, -1 for none."""
+    from pyproj import Proj
+
+    lons, lats = area_def.get_lonlats()
+    xcoords, ycoords = Proj(source_def.crs)(lons.ravel(), lats.ravel())
+
+    xmin, _, _, ymax = source_def.area_extent
+    cols = np.floor((xcoords - xmin) / source_def.pixel_size_x)
+    rows = np.floor((ymax - ycoords) / source_def.pixel_size_y)
+    # Outside the Earth disk the projected coordinates are not finite:
+    inside = (np.isfinite(cols) & np.isfinite(rows) &
+              (cols >= 0) & (cols < source_def.width) & (rows >= 0) & (rows < source_def.height))
+
+    index = np.full(area_def.size, -1, dtype='int32')
+    index[inside] = rows[inside].astype('int32') * source_def.width + cols[inside].astype('int32')
+    return index
+
+
+def _get_grids_key(source_def, area_def):
+    """Get a unique and stable key from the geometry of two area grids."""
+    grids = [[area.crs.to_wkt(), list(area.area_extent), list(area.shape)] for area in (source_def, area_def)]
+    return hashlib.sha1(json.dumps(grids).encode('utf-8')).hexdigest()
+
+
+class GeoCloudmaskMapper(object):
+    """Remap cloudmasks on the fixed grid of a geostationary satellite to an area.
+
+    The pixel geometry of a geostationary satellite never changes, so the
+    index of the fixed grid pixel for each area pixel is computed once per
+    grid and kept, in memory and optionally as a .npy file in *cache_dir*.
+    Each slot is then remapped with a single gather instead of a resampling.
+    The area pixels get the value of the grid pixel holding their centre,
+    which may differ from the nearest pixel centre where the geostationary
+    pixels are strongly elongated.
+    """
+
+    def __init__(self, area_def, cache_dir=None):
+        """Initialize."""
+        self.area_def = area_def
+        self.cache_dir = cache_dir
+        self._indices = {}
+
+    def get_index(self, source_def):
+        """Get the index mapping from a fixed grid to the area, computing it if not done before."""
+
+        key = _get_grids_key(source_def, self.area_def)
+        if key in self._indices:
+            return self._indices[key]
+
+        filename = None
+        if self.cache_dir is not None:
+            filename = os.path.join(self.cache_dir, 'geo_index_%s.npy' % key)
+        if filename is not None and os.path.exists(filename):
+            index = np.load(filename)
+        else:
+            with timer('geo_index'):
+                index = get_fixed_grid_index(source_def, self.area_def)
+            if filename is not None:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_filename = filename + '.tmp.npy'
+                np.save(tmp_filename, index)
+                os.replace(tmp_filename, filename)
+
+        self._indices[key] = index
+        return index
+
+    def remap(self, data, source_def, fill_value=None):
+        """Remap 2-D data on a fixed grid to the area (masked where there is no data, unless *fill_value*)."""
+
+        index = self.get_index(source_def)
+        with timer('geo_remap'):
+            return get_sample_from_index(data, index, self.area_def, fill_value)
+
+    def remap_cloudmask(self, scn):
+        """Remap the cloudmask of a NWCSAF-GEO scene to the area.
+
+        Returns a uint8 array with 0 for cloudfree, 1 for cloudy and 255 where
+        there is no data, like remap_cloudmask.
+        """
+
+        index = self.get_index(scn['cma'].attrs['area'])
+        with timer('geo_remap'):
+            # Gather first, so that only the area pixels are checked for valid values:
+            cma = np.asarray(scn['cma'].data).ravel()[np.maximum(index, 0)].astype('float32')
+            valid = (index >= 0) & (cma >= 0) & (cma <= 1)
+            return np.where(valid, cma, 255).astype('uint8').reshape(self.area_def.shape)
+
+
+def parse_mesan_ascii(filename, shape, nodata=MESAN_NODATA):
+    """Parse a MESAN cloud amount ASCII grid into a masked float32 array of *shape*.
+
+    The file holds the grid values separated by white space, line by line
+    from the top of the grid, with optional header lines starting with '#'.
+    The values are converted by numpy's C parser. Files with lines of
+    different lengths (values wrapped over several lines) are split and
+    converted all at once instead.
+    """
+
+    try:
+        values = np.loadtxt(filename, dtype='float32', comments='#', ndmin=1).ravel()
+    except ValueError:
+        with open(filename, 'rb') as fpt:
+            lines = [line for line in fpt.read().splitlines() if not line.lstrip().startswith(b'#')]
+        values = np.array(b' '.join(lines).split(), dtype='float32')
+    if values.size != shape[0] * shape[1]:
+        raise ValueError("MESAN file %s has %d values, expected %d for a %dx%d grid" % (
+            filename, values.size, shape[0] * shape[1], shape[0], shape[1]))
+
+    return np.ma.masked_values(values.reshape(shape), nodata)
+
+
+class MesanCloudAmountCache(object):
+    """Read MESAN cloud amount analyses through a binary cache.
+
+    Each ASCII file is parsed once and kept in *cache_dir* as a float32 .npy
+    file, with a .json file holding the area id, the nodata value and the
+    size and modification time of the ASCII file. Later reads memory-map the
+    .npy file, so an hourly analysis loads in milliseconds. The analyses are
+    on the grid of *areaid*, so they can be masked with rasters (e.g. swath
+    outlines) on that area just like the remapped PPS products.
+    """
+
+    def __init__(self, areaid, cache_dir, nodata=MESAN_NODATA):
+        """Initialize."""
+        self.areaid = areaid
+        self.area_def = get_area_def(areaid)
+        self.cache_dir = cache_dir
+        self.nodata = nodata
+
+    def _get_metadata(self, filename):
+        """Get the metadata identifying the cache of an ASCII file."""
+        stat = os.stat(filename)
+        return {'area_id': self.areaid, 'nodata': self.nodata,
+                'source_size': stat.st_size, 'source_mtime_ns': stat.st_mtime_ns}
+
+    def load(self, filename):
+        """Load the cloud amount of a MESAN ASCII file, masked where there is no data."""
+
+        basename = os.path.join(self.cache_dir, os.path.basename(filename))
+        data_file, meta_file = basename + '.npy', basename + '.json'
+        metadata = self._get_metadata(filename)
+
+        try:
+            with open(meta_file) as fpt:
+                cached = json.load(fpt) == metadata
+        except (OSError, ValueError):
+            cached = False
+
+        if cached:
+            count('mesan_cache_hits')
+            data = np.load(data_file, mmap_mode='r')
+            return np.ma.masked_values(data, self.nodata, copy=False)
+
+        with timer('mesan_parse'):
+            data = parse_mesan_ascii(filename, self.area_def.shape, self.nodata)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        np.save(data_file, data.filled(self.nodata))
+        # The metadata is written last, so that an interrupted write is not taken for a valid cache:
+        with open(meta_file, 'w') as fpt:
+            json.dump(metadata, fpt)
+
+        return data
+
+
+class CloudfreeClimatology(object):
+    """Streaming per-pixel statistics of how often a pixel is seen cloudfree.
+
+    For each month and hour-of-day bin (UTC) the number of valid
+    observations and the number of cloudfree observations are accumulated in
+    uint32 arrays over the target area, allocated only for the bins that
+    occur. Remapped cloudmasks are added one at a time and can be released
+    right after, so years of passes can be accumulated in bounded memory.
+    """
+
+    def __init__(self, area_def, hours_per_bin=3):
+        """Initialize."""
+        self.area_def = area_def
+        self.hours_per_bin = hours_per_bin
+        self.observations = {}
+        self.cloudfree = {}
+        self.scene_count = 0
+
+    def _get_bin(self, obstime):
+        """Get the (month, hour bin) key of an observation time."""
+        return (obstime.month, obstime.hour // self.hours_per_bin)
+
+    def update(self, cloudmask, obstime):
+        """Add a remapped cloudmask (0=cloudfree, 1=cloudy, 255=no data) observed at obstime."""
+
+        key = self._get_bin(obstime)
+        if key not in self.observations:
+            self.observations[key] = np.zeros(self.area_def.shape, dtype='uint32')
+            self.cloudfree[key] = np.zeros(self.area_def.shape, dtype='uint32')
+
+        cloudmask = np.ma.filled(cloudmask, 255)
+        self.observations[key] += cloudmask != 255
+        self.cloudfree[key] += cloudmask == 0
+        self.scene_count = self.scene_count + 1
+
+    def get_counts(self, months=None, hour_bins=None):
+        """Get the number of observations and cloudfree observations (uint32) summed over the selected bins."""
+
+        nobs = np.zeros(self.area_def.shape, dtype='uint32')
+        nclear = np.zeros(self.area_def.shape, dtype='uint32')
+        for (month, hour_bin) in self.observations:
+            if months is not None and month not in months:
+                continue
+            if hour_bins is not None and hour_bin not in hour_bins:
+                continue
+            nobs += self.observations[(month, hour_bin)]
+            nclear += self.cloudfree[(month, hour_bin)]
+
+        return nobs, nclear
+
+    def get_cloudfree_frequency(self, months=None, hour_bins=None):
+        """Get the fraction of observations that were cloudfree, masked where there are no observations."""
+
+        nobs, nclear = self.get_counts(months, hour_bins)
+        freq = np.ma.masked_where(nobs == 0, nclear.astype('float32'))
+        return freq / np.maximum(nobs, 1)
+
+    def save(self, filename):
+        """Save the accumulated counts to a compressed numpy file."""
+
+        arrays = {}
+        for (month, hour_bin) in self.observations:
+            arrays['observations_%02d_%02d' % (month, hour_bin)] = self.observations[(month, hour_bin)]
+            arrays['cloudfree_%02d_%02d' % (month, hour_bin)] = self.cloudfree[(month, hour_bin)]
+        np.savez_compressed(filename, area_id=self.area_def.area_id,
+                            hours_per_bin=self.hours_per_bin,
+                            scene_count=self.scene_count, **arrays)
+
+    def load(self, filename):
+        """Load counts saved earlier for the same area and hour bins, adding them to the counts accumulated so far."""
+
+        with np.load(filename) as npz:
+            if str(npz['area_id']) != self.area_def.area_id:
+                raise ValueError("Climatology file is for area %s, not %s" %
+                                 (npz['area_id'], self.area_def.area_id))
+            if int(npz['hours_per_bin']) != self.hours_per_bin:
+                raise ValueError("Climatology file has %d hours per bin, not %d" %
+                                 (int(npz['hours_per_bin']), self.hours_per_bin))
+            self.scene_count = self.scene_count + int(npz['scene_count'])
+            for key in npz.files:
+                if key.startswith('observations_'):
+                    _, month, hour_bin = key.split('_')
+                    bin_key = (int(month), int(hour_bin))
+                    observations = npz[key].astype('uint32')
+                    cloudfree = npz['cloudfree_%s_%s' % (month, hour_bin)].astype('uint32')
+                    if bin_key in self.observations:
+                        observations += self.observations[bin_key]
+                        cloudfree += self.cloudfree[bin_key]
+                    self.observations[bin_key] = observations
+                    self.cloudfree[bin_key] = cloudfree
+
+
+def accumulate_cloudfree_climatology(pps_file_getter, climatology, product_name='CMA', radius_of_influence=10000):
+    """Add all cloudmask scenes found by a PPSFilesGetter to a CloudfreeClimatology, one scene at a time."""
+
+    if not pps_file_getter.granules:
+        pps_file_getter.gather_granules(product_name)
+
+    for ppsfiles in pps_file_getter.pps_files[product_name].values():
+        scn = get_cloudmask_scene(ppsfiles)
+        cloudmask = remap_cloudmask(scn, climatology.area_def, radius_of_influence)
+        climatology.update(cloudmask, scn['cma'].attrs['start_time'])
+        del scn
+
+    return climatology
+
+
 def generate_cloudmask_image(scn, areaid=AREAID):
     """Generate a cloudmask image with coastlines and overlays."""
+    from fires_and_clouds.overlays import get_overlays_from_color
+    from fires_and_clouds.overlays import save_dataset_with_overlays
 
     smhilogo = "/home/a000680/data/logos/SMHIlogotypevitRGB8mm.png"
     eumetsatlogo = "/home/a000680/data/logos/eumetsat_logo.gif"
     fonts = "/usr/share/fonts/dejavu/DejaVuSerif.ttf"
 
-    local_scn = scn.resample(areaid, radius_of_influence=8000)
+    local_scn = scn.resample(get_area_def(areaid), radius_of_influence=8000)
     start_time_txt = local_scn.start_time.strftime('%Y-%m-%d %H:%M')
 
-    local_scn.save_dataset('cloudmask',
-                           filename='viirs_cloudmask_%s_%s.png' % (local_scn.start_time.strftime('%Y%m%d_%H%M'),
-                                                                   areaid),
-                           overlay={'coast_dir': '/home/a000680/data/shapes/', 'color': 'white'},
-                           decorate={'decorate': [
-                               {'logo': {'logo_path': smhilogo,
-                                         'height': 90, 'bg': 'white', 'bg_opacity': 120}},
-                               {'logo': {'logo_path': eumetsatlogo,
-                                         'height': 90, 'bg': 'white', 'bg_opacity': 120}},
-                               {'text': {'txt': start_time_txt,
-                                         'align': {'top_bottom': 'top', 'left_right': 'left'},
-                                         'font': fonts,
-                                         'font_size': 56,
-                                         'height': 90,
-                                         'bg': 'black',
-                                         'bg_opacity': 120,
-                                         'line': 'white'}}]})
+    save_dataset_with_overlays(local_scn, 'cloudmask',
+                               'viirs_cloudmask_%s_%s.png' % (local_scn.start_time.strftime('%Y%m%d_%H%M'),
+                                                              areaid),
+                               areaid, overlays=get_overlays_from_color('white'),
+                               decorate=[{'logo': {'logo_path': smhilogo,
+                                                   'height': 90, 'bg': 'white', 'bg_opacity': 120}},
+                                         {'logo': {'logo_path': eumetsatlogo,
+                                                   'height': 90, 'bg': 'white', 'bg_opacity': 120}},
+                                         {'text': {'txt': start_time_txt,
+                                                   'align': {'top_bottom': 'top', 'left_right': 'left'},
+                                                   'font': fonts,
+                                                   'font_size': 56,
+                                                   'height': 90,
+                                                   'bg': 'black',
+                                                   'bg_opacity': 120,
+                                                   'line': 'white'}}])
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2022 Adam.Dybbroe
+
+# Author(s):
+
+#   Adam.Dybbroe <a000680@c21856.ad.smhi.se>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Resident process that ingests new NWCSAF/PPS granules as they arrive.
+
+New cloudmask files are picked up either by polling the PPS output
+directories or from a local message queue standing in for posttroll. Each
+granule updates the time-since-cloudfree composite, the cloud statistics at
+the fire points and the rendered product image, and optionally COGs and web
+tile pyramids of the composite and the latest cloudmask. The area
+definition, the composite and the latest cloudmask are kept in memory
+between granules.
+"""
+
+import fnmatch
+import logging
+import os
+import queue
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from fires_and_clouds.areas import get_area_def
+from fires_and_clouds.instrumentation import METRICS
+from fires_and_clouds.instrumentation import timer
+from fires_and_clouds.pps_files import PATTERN
+from fires_and_clouds.pps_files import get_satname_from_files
+from trollsift.parser import globify
+
+LOG = logging.getLogger(__name__)
+
+# Area pixels without cloudmask data (see cloud_utils.remap_cloudmask):
+CLOUDMASK_NODATA = 255
+
+
+class DirectoryWatcher(object):
+    """Poll directories for new PPS product files.
+
+    A file is only reported once its size has been stable between two polls,
+    so that files still being written are not picked up. Only files modified
+    within *window* are considered, and with *date_subdirs* the date
+    subdirectories of every day within the window are searched, so that
+    granules landing in yesterday's directory after midnight are not missed.
+    """
+
+    def __init__(self, directories, product_name='CMA', pattern=PATTERN, date_subdirs=True,
+                 window=timedelta(days=1)):
+        """Initialize."""
+        self.directories = directories
+        self.glob_pattern = globify(pattern, {'product': product_name})
+        self.date_subdirs = date_subdirs
+        self.window = window
+        # Modification times of the files reported, and the sizes of those not yet complete:
+        self.seen = {}
+        self._sizes = {}
+
+    def _get_search_dirs(self, now):
+        """Get the directories to search, including the date subdirectories of the days within the window."""
+        search_dirs = []
+        for basedir in self.directories:
+            search_dirs.append(basedir)
+            if self.date_subdirs:
+                day = (now - self.window).date()
+                while day <= now.date():
+                    search_dirs.append(os.path.join(basedir, day.strftime('%Y/%m/%d')))
+                    day = day + timedelta(days=1)
+        return search_dirs
+
+    def _prune(self, oldest):
+        """Forget the files modified before *oldest* (seconds since 1970)."""
+        self.seen = {path: mtime for path, mtime in self.seen.items() if mtime >= oldest}
+        self._sizes = {path: stat for path, stat in self._sizes.items() if stat[1] >= oldest}
+
+    def get_new_files(self):
+        """Get the files that have appeared and are complete since the last call."""
+        now = datetime.now(timezone.utc)
+        oldest = now.timestamp() - self.window.total_seconds()
+        self._prune(oldest)
+
+        new_files = []
+        for sdir in self._get_search_dirs(now):
+            try:
+                entries = os.scandir(sdir)
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.path in self.seen or not fnmatch.fnmatch(entry.name, self.glob_pattern):
+                        continue
+                    stat = entry.stat()
+                    if stat.st_mtime < oldest:
+                        continue
+                    if self._sizes.get(entry.path, (None, ))[0] == stat.st_size:
+                        self.seen[entry.path] = stat.st_mtime
+                        del self._sizes[entry.path]
+                        new_files.append(entry.path)
+                    else:
+                        self._sizes[entry.path] = (stat.st_size, stat.st_mtime)
+
+        return sorted(new_files)
+
+
+class LocalMessageQueue(object):
+    """A local stand-in for a posttroll subscriber, fed with file messages."""
+
+    def __init__(self):
+        """Initialize."""
+        self._queue = queue.Queue()
+
+    def publish(self, filepath, **metadata):
+        """Publish a message announcing a new file."""
+        message = {'uri': filepath}
+        message.update(metadata)
+        self._queue.put(message)
+
+    def get_new_files(self, timeout=None):
+        """Get the files announced since the last call."""
+        new_files = []
+        try:
+            message = self._queue.get(timeout=timeout)
+            while True:
+                new_files.append(message['uri'])
+                message = self._queue.get_nowait()
+        except queue.Empty:
+            pass
+
+        return new_files
+
+
+class CloudfreeDaemon(object):
+    """Keep the cloudfree products up to date as new cloudmask granules arrive."""
+
+    def __init__(self, areaid, output_dir='./', fire_points=None, max_minutes=60*24,
+                 write_cog=False, tiles_dir=None, polygons_file=None, metrics_file=None):
+        """Initialize.
+
+        With *write_cog* the minutes since the last cloudfree view and the
+        latest cloudmask are also written as Cloud-Optimised GeoTIFFs. With
+        *tiles_dir* web tile pyramids of the time of the last cloudfree view
+        and of the latest cloudmask are updated only where the new granule
+        changed them, and the cloud statistics at the fire points are kept in
+        a GeoJSON file there. With *polygons_file* the cloud polygons of the
+        latest cloudmask are kept in a GeoPackage, patched where each granule
+        changed the cloudmask. With *metrics_file* the stage timings and
+        counters are written there in the Prometheus text format after each
+        granule.
+        """
+        from fires_and_clouds.cloud_utils import CloudfreeFreshnessComposite
+
+        self.areaid = areaid
+        self.output_dir = output_dir
+        self.fire_points = fire_points or []
+        self.max_minutes = max_minutes
+        self.write_cog = write_cog
+        self.tiles_dir = tiles_dir
+        self.metrics_file = metrics_file
+        self.composite = CloudfreeFreshnessComposite(get_area_def(areaid))
+        self.fire_stats_file = os.path.join(self.output_dir, 'cloud_statistics_at_fire_points.csv')
+        # The latest cloud statistics of each fire point:
+        self.fire_statistics = {}
+
+        # The latest cloudmask on the area (CLOUDMASK_NODATA where never seen), if written out:
+        self.cloudmask = None
+        self.time_tiles = None
+        self.cloudmask_tiles = None
+        self._tiles_written = False
+        if tiles_dir is not None:
+            from trollimage.colormap import Colormap
+            from fires_and_clouds.tiles import TilePyramid
+            from fires_and_clouds.tiles import TimeTilePyramid
+
+            self.time_tiles = TimeTilePyramid(os.path.join(tiles_dir, 'last_cloudfree_time'), areaid)
+            self.cloudmask_tiles = TilePyramid(os.path.join(tiles_dir, 'cloudmask'), areaid,
+                                               Colormap((0, (0.2, 0.5, 0.2)), (1, (1.0, 1.0, 1.0))))
+
+        self.polygon_layer = None
+        if polygons_file is not None:
+            from fires_and_clouds.cloud_polygons import CloudPolygonLayer
+
+            self.polygon_layer = CloudPolygonLayer(polygons_file, areaid)
+
+    def process_granule(self, filepath):
+        """Add a new cloudmask granule to all products."""
+        from fires_and_clouds.tiles import get_changed_pixels
+
+        tic = time.time()
+        previous = self.composite.get_latest_cloudfree_time().copy()
+        cloudmask_changed = None
+        if self.polygon_layer is None and not self.write_cog and self.tiles_dir is None:
+            self.composite.update([filepath])
+        else:
+            cloudmask_changed = self.update_composite_and_cloudmask(filepath)
+        if self.fire_points:
+            self.update_fire_statistics(filepath)
+        changed = get_changed_pixels(previous, self.composite.get_latest_cloudfree_time())
+        self.render(self.composite.end_time, changed, cloudmask_changed)
+        LOG.info("Granule %s processed in %.1f seconds", os.path.basename(filepath), time.time() - tic)
+        if self.metrics_file is not None:
+            METRICS.write_prometheus(self.metrics_file)
+
+    def update_composite_and_cloudmask(self, filepath):
+        """Add a granule to the composite, the latest cloudmask and the cloud polygons, reading it only once.
+
+        Returns a mask of the pixels where the latest cloudmask changed.
+        """
+        from fires_and_clouds.cloud_utils import get_cloudmask_scene
+        from fires_and_clouds.cloud_utils import remap_cloudmask
+
+        scn = get_cloudmask_scene([filepath])
+        self.composite.scene_ids.append({'satellite': get_satname_from_files([filepath]),
+                                         'start_time': scn['cma'].attrs['start_time']})
+        self.composite.update_from_scene(scn)
+        granule_cloudmask = remap_cloudmask(scn, self.composite.area_def, self.composite.radius_of_influence)
+
+        if self.cloudmask is None:
+            self.cloudmask = np.full(self.composite.area_def.shape, CLOUDMASK_NODATA, dtype=np.uint8)
+        cloudmask = np.where(granule_cloudmask != CLOUDMASK_NODATA, granule_cloudmask, self.cloudmask)
+        changed = cloudmask != self.cloudmask
+        self.cloudmask = cloudmask
+
+        if self.polygon_layer is not None:
+            ntiles = self.polygon_layer.update(granule_cloudmask)
+            LOG.info("Cloud polygons of %d tiles updated", ntiles)
+        return changed
+
+    def update_fire_statistics(self, filepath):
+        """Append the cloud statistics at the fire points seen by the granule to a csv file."""
+        from fires_and_clouds.cloud_utils import get_cloud_statistics
+
+        lons, lats = zip(*self.fire_points)
+        table = get_cloud_statistics(np.array(lons), np.array(lats), filepath)
+        table = table[np.isfinite(table['cma_cloud_fraction'])]
+        if len(table) == 0:
+            return
+
+        table.insert(0, 'platform_name', get_satname_from_files([filepath]))
+        table.to_csv(self.fire_stats_file, mode='a', index=False,
+                     header=not os.path.exists(self.fire_stats_file))
+
+        for row in table.to_dict('records'):
+            self.fire_statistics[(row['lon'], row['lat'])] = row
+        if self.tiles_dir is not None:
+            from fires_and_clouds.tiles import write_points_geojson
+
+            os.makedirs(self.tiles_dir, exist_ok=True)
+            write_points_geojson(os.path.join(self.tiles_dir, 'fires.geojson'),
+                                 lons, lats, [self.fire_statistics.get(point, {}) for point in self.fire_points])
+
+    def render(self, end_time, changed=None, cloudmask_changed=None):
+        """Render the minutes since the last cloudfree view to a png image, and the COGs and tiles if requested.
+
+        *end_time* is the reference time of the minutes, normally the latest
+        end time of the granules composited so far. *changed* and
+        *cloudmask_changed* are masks of the pixels changed by the last
+        granule in the composite and the latest cloudmask. The tiles hold the
+        time of the last cloudfree view, not the minutes since, so only the
+        changed tiles need to be rendered again.
+        """
+        from trollimage.colormap import ylgnbu
+        from trollimage.image import Image
+
+        minutes = np.ma.clip(self.composite.get_minutes_since_cloudfree(end_time), 0, self.max_minutes)
+        with timer('render'):
+            img = Image(minutes, mode="L", fill_value=None)
+            ylgnbu.set_range(0, self.max_minutes)
+            img.colorize(ylgnbu)
+            img.save(os.path.join(self.output_dir, 'minutes_since_last_cloudfree_view_%s.png' % self.areaid))
+
+        if self.write_cog:
+            from fires_and_clouds.tiles import write_cog
+
+            write_cog(os.path.join(self.output_dir, 'minutes_since_last_cloudfree_view_%s.tif' % self.areaid),
+                      minutes.astype('float32'), self.areaid)
+            if self.cloudmask is not None:
+                write_cog(os.path.join(self.output_dir, 'cloudmask_%s.tif' % self.areaid),
+                          self.cloudmask, self.areaid, nodata=CLOUDMASK_NODATA)
+
+        if self.time_tiles is not None:
+            if not self._tiles_written:
+                # All tiles are written the first time, then only those changed:
+                changed = cloudmask_changed = None
+            ntiles = self.time_tiles.write(self.composite.latest, changed)
+            ntiles = ntiles + self.cloudmask_tiles.write(np.ma.masked_equal(self.cloudmask, CLOUDMASK_NODATA),
+                                                         cloudmask_changed)
+            self._tiles_written = True
+            LOG.info("%d tiles rendered", ntiles)
+
+    def run(self, source, poll_interval=10):
+        """Process the new granules from a DirectoryWatcher or LocalMessageQueue, forever."""
+        while True:
+            for filepath in source.get_new_files():
+                try:
+                    self.process_granule(filepath)
+                except Exception as err:
+                    LOG.exception("Failed processing %s: %s", filepath, str(err))
+            if isinstance(source, DirectoryWatcher):
+                time.sleep(poll_interval)
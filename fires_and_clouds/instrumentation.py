@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2022 Adam.Dybbroe
+
+# Author(s):
+
+#   Adam.Dybbroe <a000680@c21856.ad.smhi.se>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Timers and counters of the processing stages.
+
+The stages (discovery, file_open, geolocation_load, kdtree_build, resample,
+composite_update, render) are timed with context managers, and events like
+files opened or skipped and points hit or missed are counted, in a
+process-wide registry. The results are reported as structured (key=value)
+log lines or in the Prometheus text exposition format, e.g. for the
+node_exporter textfile collector. Stages run in worker processes are
+recorded in the registry of the worker.
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+LOG = logging.getLogger(__name__)
+
+PROMETHEUS_PREFIX = 'fires_and_clouds'
+
+
+class Metrics(object):
+    """Accumulated stage timings and event counters."""
+
+    def __init__(self):
+        """Initialize."""
+        self._lock = threading.Lock()
+        self._timers = {}
+        self._counters = {}
+
+    @contextmanager
+    def timer(self, stage):
+        """Time the enclosed block as one call of a stage."""
+        tic = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - tic
+            with self._lock:
+                calls, total, longest = self._timers.get(stage, (0, 0.0, 0.0))
+                self._timers[stage] = (calls + 1, total + seconds, max(longest, seconds))
+
+    def count(self, name, num=1):
+        """Add *num* to an event counter."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + num
+
+    def get_timers(self):
+        """Get the {stage: (calls, total seconds, longest call in seconds)} of the stages."""
+        with self._lock:
+            return dict(self._timers)
+
+    def get_counters(self):
+        """Get the {name: count} of the counters."""
+        with self._lock:
+            return dict(self._counters)
+
+    def reset(self):
+        """Forget all timings and counts."""
+        with self._lock:
+            self._timers = {}
+            self._counters = {}
+
+    def log_report(self, level=logging.INFO):
+        """Log one key=value line per stage and one line with all the counters."""
+        for stage, (calls, total, longest) in sorted(self.get_timers().items()):
+            LOG.log(level, "stage=%s calls=%d total_seconds=%.3f max_seconds=%.3f", stage, calls, total, longest)
+        counters = self.get_counters()
+        if counters:
+            LOG.log(level, "counters %s", ' '.join('%s=%d' % item for item in sorted(counters.items())))
+
+    def to_prometheus(self, prefix=PROMETHEUS_PREFIX):
+        """Get the metrics in the Prometheus text exposition format."""
+        timers = sorted(self.get_timers().items())
+        lines = ['# HELP %s_stage_seconds_total Time spent in each processing stage.' % prefix,
+                 '# TYPE %s_stage_seconds_total counter' % prefix]
+        lines += ['%s_stage_seconds_total{stage="%s"} %f' % (prefix, stage, total)
+                  for stage, (_, total, _) in timers]
+        lines += ['# HELP %s_stage_calls_total Number of runs of each processing stage.' % prefix,
+                  '# TYPE %s_stage_calls_total counter' % prefix]
+        lines += ['%s_stage_calls_total{stage="%s"} %d' % (prefix, stage, calls)
+                  for stage, (calls, _, _) in timers]
+        lines += ['# HELP %s_stage_max_seconds Longest single run of each processing stage.' % prefix,
+                  '# TYPE %s_stage_max_seconds gauge' % prefix]
+        lines += ['%s_stage_max_seconds{stage="%s"} %f' % (prefix, stage, longest)
+                  for stage, (_, _, longest) in timers]
+        for name, value in sorted(self.get_counters().items()):
+            lines += ['# TYPE %s_%s_total counter' % (prefix, name),
+                      '%s_%s_total %d' % (prefix, name, value)]
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, filename, prefix=PROMETHEUS_PREFIX):
+        """Write the metrics in the Prometheus text format, replacing the file atomically."""
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'w') as fpt:
+            fpt.write(self.to_prometheus(prefix))
+        os.replace(tmp_filename, filename)
+
+
+METRICS = Metrics()
+
+
+def timer(stage):
+    """Time the enclosed block as one call of a stage, in the process-wide registry."""
+    return METRICS.timer(stage)
+
+
+def count(name, num=1):
+    """Add *num* to an event counter of the process-wide registry."""
+    METRICS.count(name, num)
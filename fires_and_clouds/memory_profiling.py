@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2022 Adam.Dybbroe
+
+# Author(s):
+
+#   Adam.Dybbroe <a000680@c21856.ad.smhi.se>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Opt-in peak memory profiling of the processing stages.
+
+When enabled, each stage records the high-water mark of the Python (and
+numpy) allocations with tracemalloc, and of the resident set size (RSS)
+sampled by a background thread. Stages can be nested; the outer stages
+include the peaks of the inner ones. In budget mode a MemoryBudgetExceeded
+error is raised at the next stage boundary once the RSS has exceeded the
+budget, instead of waiting for the node to run out of memory.
+
+Profiling is enabled with enable_memory_profiling(), or by setting the
+environment variable FIRES_AND_CLOUDS_MEMORY_PROFILE (to a budget in MB, or
+to 0 for no budget).
+"""
+
+import logging
+import os
+import resource
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+LOG = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+class MemoryBudgetExceeded(MemoryError):
+    """The resident memory has exceeded the configured budget."""
+
+
+def get_rss():
+    """Get the current resident set size of the process in bytes."""
+    try:
+        with open('/proc/self/statm') as fpt:
+            return int(fpt.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        # The peak is the best we can do without /proc (Linux reports kB):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MemoryProfiler(object):
+    """Record the peak Python allocations and RSS of nested processing stages."""
+
+    def __init__(self, budget_mb=None, trace_python=True, sample_interval=0.05):
+        """Initialize."""
+        self.budget = budget_mb * MB if budget_mb else None
+        self.trace_python = trace_python
+        self.sample_interval = sample_interval
+        self.stages = {}
+        self._open = []
+        self._lock = threading.Lock()
+        self._exceeded = None
+        self._sampler = None
+        self._stop_sampling = threading.Event()
+
+    def _sample(self):
+        while not self._stop_sampling.wait(self.sample_interval):
+            self._fold_rss(get_rss())
+
+    def _fold_rss(self, rss, stage=None):
+        with self._lock:
+            for frame in self._open:
+                frame['rss_peak'] = max(frame['rss_peak'], rss)
+            if self.budget is not None and rss > self.budget and self._exceeded is None:
+                if stage is None and self._open:
+                    stage = self._open[-1]['name']
+                self._exceeded = (stage, rss)
+                LOG.error("Memory budget of %.0f MB exceeded in stage %s: RSS %.0f MB",
+                          self.budget / MB, stage, rss / MB)
+
+    def _fold_python_peak(self):
+        if not self.trace_python:
+            return
+        peak = tracemalloc.get_traced_memory()[1]
+        with self._lock:
+            for frame in self._open:
+                frame['python_peak'] = max(frame['python_peak'], peak)
+        tracemalloc.reset_peak()
+
+    def check_budget(self, stage=None):
+        """Raise MemoryBudgetExceeded if the RSS has exceeded the budget."""
+        self._fold_rss(get_rss(), stage)
+        if self._exceeded is not None:
+            stage, rss = self._exceeded
+            raise MemoryBudgetExceeded("RSS of %.0f MB exceeds the budget of %.0f MB (in stage %s)" %
+                                       (rss / MB, self.budget / MB, stage))
+
+    @contextmanager
+    def stage(self, name):
+        """Profile the enclosed block as one run of a stage."""
+        if self.trace_python and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.check_budget(name)
+        self._fold_python_peak()
+        rss = get_rss()
+        frame = {'name': name, 'rss_start': rss, 'rss_peak': rss,
+                 'python_start': tracemalloc.get_traced_memory()[0] if self.trace_python else 0,
+                 'python_peak': 0}
+        with self._lock:
+            self._open.append(frame)
+            if self._sampler is None:
+                self._stop_sampling.clear()
+                self._sampler = threading.Thread(target=self._sample, daemon=True)
+                self._sampler.start()
+        try:
+            yield
+        finally:
+            self._fold_python_peak()
+            self._fold_rss(get_rss())
+            with self._lock:
+                self._open.remove(frame)
+                if not self._open:
+                    self._stop_sampling.set()
+                    self._sampler = None
+                self._record(frame)
+        self.check_budget(name)
+
+    def _record(self, frame):
+        stats = self.stages.setdefault(frame['name'], {'calls': 0, 'python_peak_mb': 0.0,
+                                                       'rss_peak_mb': 0.0, 'rss_increase_mb': 0.0})
+        stats['calls'] += 1
+        stats['python_peak_mb'] = max(stats['python_peak_mb'],
+                                      max(frame['python_peak'] - frame['python_start'], 0) / MB)
+        stats['rss_peak_mb'] = max(stats['rss_peak_mb'], frame['rss_peak'] / MB)
+        stats['rss_increase_mb'] = max(stats['rss_increase_mb'], (frame['rss_peak'] - frame['rss_start']) / MB)
+
+    def get_report(self):
+        """Get the per-stage high-water marks as a table (list of lines)."""
+        lines = ['%-40s %6s %14s %12s %14s' % ('stage', 'calls', 'python peak MB', 'RSS peak MB', 'RSS increase MB')]
+        for name, stats in sorted(self.stages.items(), key=lambda item: -item[1]['rss_peak_mb']):
+            lines.append('%-40s %6d %14.1f %12.1f %14.1f' % (name, stats['calls'], stats['python_peak_mb'],
+                                                             stats['rss_peak_mb'], stats['rss_increase_mb']))
+        return lines
+
+    def log_report(self, level=logging.INFO):
+        """Log the per-stage high-water marks."""
+        for line in self.get_report():
+            LOG.log(level, line)
+
+
+_PROFILER = None
+
+
+def enable_memory_profiling(budget_mb=None, trace_python=True, sample_interval=0.05):
+    """Enable the process-wide memory profiling of the stages, and return the profiler."""
+    global _PROFILER
+    _PROFILER = MemoryProfiler(budget_mb, trace_python, sample_interval)
+    return _PROFILER
+
+
+def disable_memory_profiling():
+    """Disable the memory profiling, and stop tracing the Python allocations."""
+    global _PROFILER
+    _PROFILER = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def get_memory_profiler():
+    """Get the process-wide memory profiler, or None if profiling is not enabled."""
+    return _PROFILER
+
+
+def memory_stage(name):
+    """Profile the enclosed block as a stage, if memory profiling is enabled."""
+    if _PROFILER is None:
+        return nullcontext()
+    return _PROFILER.stage(name)
+
+
+if os.environ.get('FIRES_AND_CLOUDS_MEMORY_PROFILE') is not None:
+    enable_memory_profiling(budget_mb=float(os.environ['FIRES_AND_CLOUDS_MEMORY_PROFILE']) or None)
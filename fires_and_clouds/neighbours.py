@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2022 Adam.Dybbroe
+
+# Author(s):
+
+#   Adam.Dybbroe <a000680@c21856.ad.smhi.se>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Neighbour search in Earth-centred Cartesian coordinates.
+
+Positions are converted to float32 x, y, z on a spherical Earth, so that
+Euclidean distances (chords) are free of the distortions of (lon, lat)
+degrees at high latitudes and across the dateline, and distance limits can
+be given in metres. The float32 coordinates take half the memory of the
+float64 ones used by pyresample. The same conversion is used for the point
+extraction (see swath_locator) and for the nearest neighbour resampling of
+swaths to areas here.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+from fires_and_clouds.instrumentation import count, timer
+
+# The Earth radius (metres) of the sphere used by pyresample:
+EARTH_RADIUS = 6370997.0
+
+
+def lonlat2xyz(lons, lats):
+    """Convert longitudes and latitudes (degrees) to an (N, 3) float32 array of Earth-centred coordinates."""
+
+    lons = np.deg2rad(np.asarray(lons, dtype='float32').ravel())
+    lats = np.deg2rad(np.asarray(lats, dtype='float32').ravel())
+    radii = np.float32(EARTH_RADIUS) * np.cos(lats)
+    xyz = np.empty((lons.size, 3), dtype='float32')
+    xyz[:, 0] = radii * np.cos(lons)
+    xyz[:, 1] = radii * np.sin(lons)
+    xyz[:, 2] = np.float32(EARTH_RADIUS) * np.sin(lats)
+    return xyz
+
+
+def get_chord_length(distance):
+    """Get the length of the chord between two points a great circle distance (metres) apart."""
+    return 2 * EARTH_RADIUS * np.sin(np.minimum(distance, np.pi * EARTH_RADIUS) / (2 * EARTH_RADIUS))
+
+
+def get_arc_length(chord):
+    """Get the great circle distance (metres) between two points a chord length apart."""
+    return 2 * EARTH_RADIUS * np.arcsin(np.clip(chord / (2 * EARTH_RADIUS), 0, 1))
+
+
+def get_valid_lonlats(lons, lats):
+    """Get a flat boolean array of the positions with valid (unmasked and in range) longitudes and latitudes."""
+
+    lons = np.ma.masked_invalid(lons).ravel()
+    lats = np.ma.masked_invalid(lats).ravel()
+    valid = (lons >= -180) & (lons <= 180) & (lats >= -90) & (lats <= 90)
+    return np.ma.filled(valid, False)
+
+
+@lru_cache(maxsize=4)
+def get_area_xyz(area_def):
+    """Get the Earth-centred coordinates of the valid pixels of an area, and their flat indices."""
+
+    lons, lats = area_def.get_lonlats()
+    valid = np.flatnonzero(get_valid_lonlats(lons, lats))
+    return lonlat2xyz(lons.ravel()[valid], lats.ravel()[valid]), valid
+
+
+def get_nearest_index(lons, lats, area_def, radius_of_influence=10000):
+    """Get the flat index of the swath pixel nearest to each area pixel, -1 where none is within the radius.
+
+    The tree is built on the swath pixels and queried with the area pixels,
+    with the radius of influence (metres) as upper distance bound.
+    """
+    from pykdtree.kdtree import KDTree
+
+    source = np.flatnonzero(get_valid_lonlats(lons, lats))
+    index = np.full(area_def.size, -1, dtype='int64')
+    if source.size == 0:
+        return index
+
+    with timer('kdtree_build'):
+        kd_tree = KDTree(lonlat2xyz(np.ravel(lons)[source], np.ravel(lats)[source]))
+    target_xyz, target = get_area_xyz(area_def)
+    with timer('kdtree_query'):
+        _, kidx = kd_tree.query(target_xyz, k=1,
+                                distance_upper_bound=np.float32(get_chord_length(radius_of_influence)))
+    found = kidx < source.size
+    index[target[found]] = source[kidx[found]]
+    count('pixels_resampled', int(found.sum()))
+    return index
+
+
+def get_sample_from_index(data, index, area_def, fill_value=None):
+    """Get the swath data at a flat index per area pixel (-1 for none) as an area array.
+
+    Like pyresample's kd_tree.resample_nearest the mask of the data is kept.
+    Area pixels without a swath pixel are masked if *fill_value* is None and
+    set to *fill_value* otherwise.
+    """
+
+    found = index >= 0
+    data = np.ma.asarray(data)
+    flat_data = data.reshape((-1,) + data.shape[2:])
+    result = np.ma.masked_all((area_def.size,) + data.shape[2:], dtype=data.dtype)
+    result[found] = flat_data[index[found]]
+
+    if fill_value is not None:
+        result[~found] = fill_value
+        if not np.ma.is_masked(data):
+            result = result.filled(fill_value)
+    return result.reshape(area_def.shape + data.shape[2:])
+
+
+def resample_nearest(lons, lats, data, area_def, radius_of_influence=10000, fill_value=None):
+    """Remap swath data to an area with nearest neighbour resampling.
+
+    Masked or invalid geolocation is not used, and the nearest pixel is
+    taken regardless of the mask of the data. Area pixels without a swath
+    pixel within the radius of influence (metres) get no data, see
+    get_sample_from_index.
+    """
+
+    index = get_nearest_index(lons, lats, area_def, radius_of_influence)
+    return get_sample_from_index(data, index, area_def, fill_value)
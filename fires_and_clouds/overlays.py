@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2022 Adam.Dybbroe
+
+# Author(s):
+
+#   Adam.Dybbroe <a000680@c21856.ad.smhi.se>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cached coastline, border and decoration layers for the product images.
+
+Drawing coasts and borders with pycoast means reading and projecting the GSHHS
+shapefiles, which takes much longer than producing the image itself. Here the
+static overlays (coasts, borders, grids, ...) and the decorations (logos,
+texts) are drawn once per area and configuration onto a transparent RGBA
+layer, which is then only alpha-composited onto each product image. The
+overlays changing with every image (points, e.g. the fire spots) are drawn
+on a layer of their own for each image.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from fires_and_clouds.areas import get_area_def
+
+COAST_DIR = '/home/a000680/data/shapes/'
+
+# The pycoast overlays that typically change with every image, never cached:
+DYNAMIC_OVERLAYS = ['points', 'text']
+
+
+def get_overlays_from_color(color, width=0.5):
+    """Get a pycoast overlays dict with coasts and borders drawn in one color."""
+    return {'coasts': {'outline': color, 'width': width, 'level': 1},
+            'borders': {'outline': color, 'width': width, 'level': 1}}
+
+
+def _get_config_key(areaid, config):
+    """Get a unique and stable key from an area id and an overlay/decoration config."""
+    return hashlib.sha1(json.dumps([areaid, config], sort_keys=True,
+                                   default=repr).encode('utf-8')).hexdigest()
+
+
+def _unpremultiply(layer):
+    """Convert a layer drawn with aggdraw on a transparent background to straight alpha.
+
+    Drawing on a transparent black background leaves the colors of the
+    semi-transparent (antialiased) pixels multiplied with their alpha.
+    """
+    import numpy as np
+    from PIL import Image
+
+    rgba = np.array(layer, dtype=np.float32)
+    alpha = rgba[:, :, 3:]
+    np.divide(rgba[:, :, :3] * 255, alpha, out=rgba[:, :, :3], where=alpha > 0)
+    return Image.fromarray(np.clip(rgba, 0, 255).round().astype(np.uint8), 'RGBA')
+
+
+class OverlayCache(object):
+    """Keep the overlay and decoration layers of areas as RGBA images.
+
+    Only the static overlays (without DYNAMIC_OVERLAYS) are cached. The
+    *max_overlays* most recently used overlay layers are kept in memory, and
+    optionally all of them as png files in *cache_dir* so that they survive
+    between runs. Decorations often hold a text changing with every image, so
+    only the *max_decorations* most recently used decoration layers are kept,
+    and only in memory.
+    """
+
+    def __init__(self, coast_dir=COAST_DIR, cache_dir=None, max_overlays=8, max_decorations=8):
+        """Initialize the cache."""
+        self.coast_dir = coast_dir
+        self.cache_dir = cache_dir
+        self.max_overlays = max_overlays
+        self.max_decorations = max_decorations
+        self._overlays = OrderedDict()
+        self._decorations = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_overlay(self, areaid, overlays):
+        """Get the RGBA layer with the static pycoast *overlays* drawn on the area.
+
+        The DYNAMIC_OVERLAYS in *overlays* are ignored, see get_dynamic_overlay.
+        """
+        overlays = {name: config for name, config in overlays.items() if name not in DYNAMIC_OVERLAYS}
+        key = 'overlay_' + _get_config_key(areaid, overlays)
+        with self._lock:
+            if key in self._overlays:
+                self._overlays.move_to_end(key)
+            else:
+                self._overlays[key] = self._load_or_draw_overlay(key, areaid, overlays)
+                while len(self._overlays) > self.max_overlays:
+                    self._overlays.popitem(last=False)
+            return self._overlays[key]
+
+    def get_dynamic_overlay(self, areaid, overlays):
+        """Draw the DYNAMIC_OVERLAYS of *overlays* (e.g. the fire spots) on a new layer, None if there are none."""
+        overlays = {name: config for name, config in overlays.items() if name in DYNAMIC_OVERLAYS}
+        if not overlays:
+            return None
+        return self._draw_overlay(areaid, overlays)
+
+    def get_decoration(self, areaid, decorate):
+        """Get the RGBA layer with the pydecorate *decorate* list drawn on the area."""
+        key = _get_config_key(areaid, decorate)
+        with self._lock:
+            if key in self._decorations:
+                self._decorations.move_to_end(key)
+            else:
+                self._decorations[key] = self._draw_decoration(areaid, decorate)
+                while len(self._decorations) > self.max_decorations:
+                    self._decorations.popitem(last=False)
+            return self._decorations[key]
+
+    def _load_or_draw_overlay(self, key, areaid, overlays):
+        from PIL import Image
+
+        if self.cache_dir is None:
+            return self._draw_overlay(areaid, overlays)
+        filename = os.path.join(self.cache_dir, key + '.png')
+        if os.path.exists(filename):
+            layer = Image.open(filename)
+            layer.load()
+            return layer
+        layer = self._draw_overlay(areaid, overlays)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        layer.save(filename)
+        return layer
+
+    def _get_empty_layer(self, areaid):
+        from PIL import Image
+
+        area_def = get_area_def(areaid)
+        return Image.new('RGBA', (area_def.width, area_def.height), (0, 0, 0, 0))
+
+    def _draw_overlay(self, areaid, overlays):
+        from pycoast import ContourWriterAGG
+
+        cwriter = ContourWriterAGG(self.coast_dir)
+        return _unpremultiply(cwriter.add_overlay_from_dict(overlays, get_area_def(areaid),
+                                                            background=self._get_empty_layer(areaid)))
+
+    def _draw_decoration(self, areaid, decorate):
+        from pydecorate import DecoratorAGG
+
+        layer = self._get_empty_layer(areaid)
+        dcr = DecoratorAGG(layer)
+        for dec in decorate:
+            if 'logo' in dec:
+                dcr.add_logo(**dec['logo'])
+            elif 'text' in dec:
+                dcr.add_text(**dec['text'])
+            elif 'scale' in dec:
+                dcr.add_scale(**dec['scale'])
+        return _unpremultiply(layer)
+
+    def apply(self, image, areaid, overlays=None, decorate=None):
+        """Alpha-composite the cached overlay and decoration layers onto a PIL *image*."""
+        from PIL import Image
+
+        image = image.convert('RGBA')
+        if overlays:
+            image = Image.alpha_composite(image, self.get_overlay(areaid, overlays))
+            dynamic_layer = self.get_dynamic_overlay(areaid, overlays)
+            if dynamic_layer is not None:
+                image = Image.alpha_composite(image, dynamic_layer)
+        if decorate:
+            image = Image.alpha_composite(image, self.get_decoration(areaid, decorate))
+        return image
+
+
+_OVERLAY_CACHE = None
+
+
+def get_overlay_cache():
+    """Get the process-wide overlay cache."""
+    global _OVERLAY_CACHE
+    if _OVERLAY_CACHE is None:
+        _OVERLAY_CACHE = OverlayCache()
+    return _OVERLAY_CACHE
+
+
+def save_dataset_with_overlays(scn, dataset, filename, areaid, overlays=None, decorate=None,
+                               overlay_cache=None):
+    """Save the enhanced image of a resampled scene dataset with cached overlays and decorations.
+    """
+    from satpy.writers import get_enhanced_image
+
+    if overlay_cache is None:
+        overlay_cache = get_overlay_cache()
+    image = get_enhanced_image(scn[dataset]).pil_image()
+    overlay_cache.apply(image, areaid, overlays, decorate).save(filename)
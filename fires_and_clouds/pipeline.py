@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2022 Adam.Dybbroe
+
+# Author(s):
+
+#   Adam.Dybbroe <a000680@c21856.ad.smhi.se>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A staged asyncio pipeline for the time since cloudfree view.
+
+The processing of each scene is split in stages connected by bounded
+queues:
+
+ * discovery of the scene files (PPSFilesGetter),
+ * reading the cloudmask scenes (thread pool, netCDF I/O),
+ * resampling to the area (process pool, KD-tree),
+ * compositing into a LastCloudfreeView (single writer).
+
+The stages overlap, and a full queue makes the upstream stage wait, so the
+throughput is set by the slowest stage. The number of scenes in flight,
+including those finished early and waiting for their turn in the
+compositor, is bounded by the queue size, which bounds the memory.
+If a stage fails the other stages are cancelled and the error is raised.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+
+from fires_and_clouds.cloud_utils import crop_scene_to_area
+from fires_and_clouds.cloud_utils import get_cloudmask_scene
+from fires_and_clouds.cloud_utils import get_sensor_from_scene
+from fires_and_clouds.cloud_utils import resample_to_area
+from fires_and_clouds.pps_files import get_granule_start_times
+from fires_and_clouds.pps_files import get_satname_from_files
+
+LOG = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class CloudfreePipeline(object):
+    """Feed the scenes found by a PPSFilesGetter through a LastCloudfreeView in overlapping stages.
+
+    The scenes are composited newest first, in the same order as when
+    processed one by one. *on_scene* is called by the compositor after each
+    scene with the view and the scene key, e.g. to plot intermediate maps.
+    """
+
+    def __init__(self, view, read_workers=2, resample_workers=2, queue_size=4,
+                 radius_of_influence=10000, on_scene=None):
+        """Initialize."""
+        self.view = view
+        self.read_workers = read_workers
+        self.resample_workers = resample_workers
+        self.queue_size = queue_size
+        self.radius_of_influence = radius_of_influence
+        self.on_scene = on_scene
+
+    def run(self, pps_file_getter, product_name='CMA'):
+        """Run the pipeline to completion."""
+        return asyncio.run(self.run_async(pps_file_getter, product_name))
+
+    async def run_async(self, pps_file_getter, product_name='CMA'):
+        """Run the pipeline to completion within a running event loop."""
+        read_queue = asyncio.Queue(self.queue_size)
+        resample_queue = asyncio.Queue(self.queue_size)
+        composite_queue = asyncio.Queue(self.queue_size)
+        in_flight = asyncio.Semaphore(self.queue_size)
+
+        # The resampling processes are not forked, as forking while the reader
+        # threads hold HDF5/dask locks can deadlock the children:
+        with ThreadPoolExecutor(self.read_workers) as thread_pool, \
+                ProcessPoolExecutor(self.resample_workers,
+                                    mp_context=multiprocessing.get_context('forkserver')) as process_pool:
+            stages = [self._discover(pps_file_getter, product_name, read_queue, thread_pool, in_flight),
+                      self._run_workers(self.read_workers, self._read, read_queue, resample_queue,
+                                        thread_pool),
+                      self._run_workers(self.resample_workers, self._resample, resample_queue,
+                                        composite_queue, process_pool),
+                      self._composite(composite_queue, in_flight)]
+            await self._gather_or_cancel(stages)
+
+        return self.view
+
+    @staticmethod
+    async def _gather_or_cancel(coroutines):
+        """Run coroutines concurrently, cancelling all if one fails, so no stage waits forever on its queue."""
+        tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def _discover(self, pps_file_getter, product_name, out_queue, executor, in_flight):
+        """Find the scenes and queue them newest first, when there is room in the pipeline."""
+        loop = asyncio.get_running_loop()
+
+        def find_scenes():
+            if product_name not in pps_file_getter.pps_files:
+                pps_file_getter.collect_product_files(product_name=product_name)
+            if not pps_file_getter.granules:
+                pps_file_getter.gather_granules(product_name)
+            scenes = pps_file_getter.pps_files[product_name]
+            return sorted(scenes.items(), key=lambda item: get_granule_start_times(item[1])[0], reverse=True)
+
+        for seqno, (scene_key, ppsfiles) in enumerate(await loop.run_in_executor(executor, find_scenes)):
+            await in_flight.acquire()
+            await out_queue.put((seqno, scene_key, ppsfiles))
+        await out_queue.put(_DONE)
+
+    async def _run_workers(self, nworkers, work, in_queue, out_queue, executor):
+        """Run a number of workers on a stage until the upstream stage is done."""
+        async def worker():
+            while True:
+                item = await in_queue.get()
+                if item is _DONE:
+                    # Let the other workers of this stage see the end too:
+                    await in_queue.put(_DONE)
+                    return
+                await out_queue.put(await work(item, executor))
+
+        await self._gather_or_cancel([worker() for _ in range(nworkers)])
+        await out_queue.put(_DONE)
+
+    async def _read(self, item, executor):
+        """Read a cloudmask scene and derive the minutes since observation of the cloudfree pixels."""
+        seqno, scene_key, ppsfiles = item
+
+        def read_scene():
+            scn = get_cloudmask_scene(ppsfiles)
+            scene_id = {'satellite': get_satname_from_files(ppsfiles),
+                        'start_time': scn.start_time}
+            if self.view.crop_to_area:
+                scn = crop_scene_to_area(scn, self.view.area_def, self.radius_of_influence)
+            lons, lats, time_data = self.view.get_scene_times_cloudfree_view(scn)
+            return scene_id, get_sensor_from_scene(scn), lons, lats, time_data
+
+        result = await asyncio.get_running_loop().run_in_executor(executor, read_scene)
+        return (seqno, scene_key) + result
+
+    async def _resample(self, item, executor):
+        """Remap the minutes since observation to the area."""
+        seqno, scene_key, scene_id, sensor, lons, lats, time_data = item
+        result = await asyncio.get_running_loop().run_in_executor(
+            executor, resample_to_area, lons, lats, time_data, self.view.area_def, self.radius_of_influence,
+            None, self.view.resampler, sensor)
+        return seqno, scene_key, scene_id, result
+
+    async def _composite(self, in_queue, in_flight):
+        """Add the remapped scenes to the view, in the order they were discovered."""
+        pending = {}
+        next_seqno = 0
+        while True:
+            item = await in_queue.get()
+            if item is _DONE:
+                break
+            pending[item[0]] = item
+            while next_seqno in pending:
+                _, scene_key, scene_id, result = pending.pop(next_seqno)
+                self.view.scene_ids.append(scene_id)
+                self.view.set_time_dataset(result)
+                LOG.info("Scene %s added (%d)", scene_key, next_seqno)
+                if self.on_scene is not None:
+                    self.on_scene(self.view, scene_key)
+                next_seqno = next_seqno + 1
+                in_flight.release()
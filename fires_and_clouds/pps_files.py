@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2022 Adam.Dybbroe
+
+# Author(s):
+
+#   Adam.Dybbroe <a000680@c21856.ad.smhi.se>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Finding and naming NWCSAF/PPS product files.
+
+Only file name handling is done here, so this module is fast to import for
+jobs that only need to locate files.
+"""
+
+import os
+from glob import glob
+from datetime import timedelta
+
+from trollsift.parser import Parser, globify
+
+from fires_and_clouds.instrumentation import count, timer
+
+PPS_PATH = "/data/lang/satellit/polar/PPS_products/satproj/"
+
+# S_NWC_CMA_eos1_99033_20180731T2128120Z_20180731T2141123Z.nc
+PATTERN = "S_NWC_{product:s}_{platform_name:s}_{orbit_number:5d}_{starttime:%Y%m%dT%H%M%S%fZ}_{endtime:%Y%m%dT%H%M%S%fZ}.nc"
+
+# Datasets to extract from each NWCSAF-PPS product:
+PRODUCT_DATASETS = {'CMA': ['cma'],
+                    'CMAPROB': ['cmaprob'],
+                    'CT': ['ct'],
+                    'CTTH': ['ctth_alti', 'ctth_tempe', 'ctth_pres'],
+                    'CMIC': ['cmic_phase', 'cmic_cot', 'cmic_lwp', 'cmic_iwp']}
+
+# PLATFORM_NAMES = {'npp': 'Suomi-NPP',
+#                  'noaa20': 'NOAA-20'}
+
+PPS_SATNAMES = {'npp': 'Suomi-NPP',
+                'eos1': 'EOS-Terra',
+                'eos2': 'EOS-Aqua',
+                'noaa18': 'NOAA-18',
+                'noaa19': 'NOAA-19',
+                'noaa20': 'NOAA-20',
+                'metopc': 'Metop-C',
+                'metopb': 'Metop-B',
+                'metopa': 'Metop-A',
+                'noaa15': 'NOAA-15'}
+
+# Instrument of each platform (for the scan timing of the swath):
+PLATFORM_SENSORS = {'Suomi-NPP': 'viirs',
+                    'NOAA-20': 'viirs',
+                    'NOAA-21': 'viirs',
+                    'EOS-Terra': 'modis',
+                    'EOS-Aqua': 'modis',
+                    'NOAA-15': 'avhrr-3',
+                    'NOAA-18': 'avhrr-3',
+                    'NOAA-19': 'avhrr-3',
+                    'Metop-A': 'avhrr-3',
+                    'Metop-B': 'avhrr-3',
+                    'Metop-C': 'avhrr-3'}
+
+
+def get_granule_start_times(pps_files):
+    """From a set of pps files (granules of one pass) get the sorted granule start times."""
+
+    p__ = Parser(PATTERN)
+    start_times = []
+    for filepath in pps_files:
+        try:
+            res = p__.parse(os.path.basename(filepath))
+        except ValueError:
+            return []
+        start_times.append(res['starttime'])
+
+    return sorted(start_times)
+
+
+def get_satname_from_files(pps_files):
+    """From a set of pps files extract the satellite name."""
+
+    pattern = 'S_NWC_{product:s}_{satid:s}_{orbit:s}_{start_time:%Y%m%dT%H%M%S%fZ}_{end_time:%Y%m%dT%H%M%S%fZ}.nc'
+
+    bname = os.path.basename(pps_files[0])
+    p__ = Parser(pattern)
+    res = p__.parse(bname)
+    return PPS_SATNAMES.get(res['satid'], res['satid'])
+
+
+class PPSFilesGetter(object):
+    """Getting PPS cloud product files in a given time interval."""
+
+    def __init__(self, basedir, starttime, endtime, pattern=PATTERN):
+        """Initialize."""
+        self.basedir = basedir
+        self.start_time = starttime
+        self.end_time = endtime
+        self.platforms = []
+        self.product = None
+        self.pattern = pattern
+        self.parser = Parser(self.pattern)
+        self.pps_files = {}
+        self.granules = False
+
+    def collect_product_files(self, platforms=list(PPS_SATNAMES.values()), product_name='CMA'):
+        """Search PPS cloud product files within a time interval and add to the pps_files dict."""
+
+        otime = self.start_time
+        subdirs = []
+        while otime < self.end_time:
+            subdir = os.path.join(self.basedir, otime.strftime('%Y/%m/%d'))
+            if subdir not in subdirs:
+                subdirs.append(subdir)
+            otime = otime + timedelta(days=1)
+
+        with timer('discovery'):
+            flist = []
+            for sdir in subdirs:
+                flist = flist + glob(os.path.join(sdir, globify(self.pattern, {'product': product_name})))
+
+            newflist = []
+            for fpath in flist:
+                fname = os.path.basename(fpath)
+                res = self.parser.parse(fname)
+                if PPS_SATNAMES.get(res['platform_name']) not in platforms:
+                    continue
+                if res['starttime'] < self.start_time or res['endtime'] > self.end_time:
+                    continue
+
+                newflist.append(fpath)
+
+        count('files_found', len(newflist))
+        count('files_skipped', len(flist) - len(newflist))
+
+        if product_name not in self.pps_files:
+            self.pps_files[product_name] = newflist
+        else:
+            self.pps_files[product_name] = self.pps_files[product_name] + newflist
+
+    def gather_granules(self, product_name):
+        """Gather granules"""
+
+        granule_collection = {}
+        for filepath in self.pps_files[product_name]:
+            res = self.parser.parse(os.path.basename(filepath))
+            keyname = res['platform_name'] + '_' + str(res['orbit_number'])
+            if keyname not in granule_collection:
+                granule_collection[keyname] = [filepath]
+            else:
+                granule_collection[keyname].append(filepath)
+
+        self.granules = True
+        self.pps_files[product_name] = granule_collection
+
+
+def get_sibling_product_files(ppsfile, products=list(PRODUCT_DATASETS.keys())):
+    """Get the existing PPS files of other products from the same granule as a PPS file."""
+
+    p__ = Parser(PATTERN)
+    dirname, bname = os.path.split(ppsfile)
+    this_product = p__.parse(bname)['product']
+
+    sibling_files = {}
+    for product in products:
+        fname = bname.replace('S_NWC_%s_' % this_product, 'S_NWC_%s_' % product, 1)
+        filepath = os.path.join(dirname, fname)
+        if os.path.exists(filepath):
+            sibling_files[product] = filepath
+
+    return sibling_files
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2022 Adam.Dybbroe
+
+# Author(s):
+
+#   Adam.Dybbroe <a000680@c21856.ad.smhi.se>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Direct windowed reading of NWCSAF-PPS netCDF files.
+
+For the extraction of a product at a handful of positions the full swath is
+not needed. The geolocation is read on a decimated grid to locate the
+points, and only the small chunk-aligned windows around them are read with
+netCDF4 hyperslab reads, so that the cost per point does not grow with the
+size of the granule.
+"""
+
+import logging
+from datetime import datetime
+
+import numpy as np
+
+from fires_and_clouds.instrumentation import count, timer
+from fires_and_clouds.neighbours import get_arc_length
+from fires_and_clouds.neighbours import get_valid_lonlats
+from fires_and_clouds.neighbours import lonlat2xyz
+from fires_and_clouds.pps_files import PLATFORM_SENSORS
+from fires_and_clouds.satellite_scanning_geometry import get_swath_scanline_times
+from fires_and_clouds.satellite_scanning_geometry import get_timing_sensor
+
+LOG = logging.getLogger(__name__)
+
+# Decimation of the geolocation used to locate the points:
+GEOLOCATION_STEP = 16
+# Size of the blocks read from variables stored without chunks:
+BLOCK_SIZE = (64, 64)
+# The local search for the nearest pixel is moved at most this many times:
+MAX_REFINE_STEPS = 8
+
+TIME_FORMATS = ['%Y-%m-%dT%H:%M:%SZ', '%Y%m%dT%H%M%S%fZ']
+
+
+def read_pps_time(value):
+    """Read a time attribute of a NWCSAF-PPS file."""
+
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, time_format)
+        except ValueError:
+            continue
+    raise ValueError('Unknown time format: %s' % value)
+
+
+class WindowedVariable(object):
+    """Array-like 2-D view of a swath variable, read block by block on demand.
+
+    The blocks are aligned to the chunks of the variable in the file (or of
+    BLOCK_SIZE for contiguous variables) and kept once read, so that windows
+    close to each other do not read the same chunk twice. Fill values and
+    values outside the valid range are returned as NaN.
+    """
+
+    def __init__(self, variable):
+        """Initialize."""
+        self.variable = variable
+        self.shape = variable.shape[-2:]
+        # Swath datasets of PPS have a leading time dimension of length one:
+        self._leading_index = (0,) * (variable.ndim - 2)
+        chunking = variable.chunking()
+        if chunking == 'contiguous':
+            self.block_shape = BLOCK_SIZE
+        else:
+            self.block_shape = tuple(chunking[-2:])
+        self._blocks = {}
+
+    def _get_block(self, block_row, block_col):
+        """Get a block of the variable, reading it if not done already."""
+        try:
+            return self._blocks[(block_row, block_col)]
+        except KeyError:
+            pass
+
+        nrows, ncols = self.block_shape
+        rows = slice(block_row * nrows, min((block_row + 1) * nrows, self.shape[0]))
+        cols = slice(block_col * ncols, min((block_col + 1) * ncols, self.shape[1]))
+        with timer('window_read'):
+            data = self.variable[self._leading_index + (rows, cols)]
+        block = np.ma.filled(np.ma.asarray(data, dtype='float64'), np.nan)
+        self._blocks[(block_row, block_col)] = block
+        count('blocks_read')
+        return block
+
+    def __getitem__(self, key):
+        """Get a window of the variable from a (rows, cols) tuple of slices."""
+        row0, row1, _ = key[0].indices(self.shape[0])
+        col0, col1, _ = key[1].indices(self.shape[1])
+        window = np.empty((max(row1 - row0, 0), max(col1 - col0, 0)), dtype='float64')
+
+        nrows, ncols = self.block_shape
+        for block_row in range(row0 // nrows, (row1 - 1) // nrows + 1):
+            for block_col in range(col0 // ncols, (col1 - 1) // ncols + 1):
+                block = self._get_block(block_row, block_col)
+                brow0, bcol0 = block_row * nrows, block_col * ncols
+                rows = slice(max(row0, brow0), min(row1, brow0 + nrows))
+                cols = slice(max(col0, bcol0), min(col1, bcol0 + ncols))
+                window[rows.start - row0:rows.stop - row0, cols.start - col0:cols.stop - col0] = \
+                    block[rows.start - brow0:rows.stop - brow0, cols.start - bcol0:cols.stop - bcol0]
+
+        return window
+
+
+class PPSNetCDFReader(object):
+    """Read windows of the datasets and geolocation of a NWCSAF-PPS netCDF file.
+
+    Only files with the geolocation in full resolution (the 'lon' and 'lat'
+    variables) can be located in; see `has_geolocation`.
+    """
+
+    def __init__(self, filename, geolocation_step=GEOLOCATION_STEP):
+        """Initialize."""
+        import netCDF4
+
+        self.filename = filename
+        self.geolocation_step = geolocation_step
+        with timer('file_open'):
+            self.nc = netCDF4.Dataset(filename)
+        count('files_opened')
+        self._variables = {}
+        self._coarse_geolocation = None
+
+    def __enter__(self):
+        """Enter the context."""
+        return self
+
+    def __exit__(self, *args):
+        """Close the file when leaving the context."""
+        self.close()
+
+    def close(self):
+        """Close the file."""
+        self.nc.close()
+
+    def __getitem__(self, name):
+        """Get a variable of the file as a windowed array."""
+        if name not in self._variables:
+            self._variables[name] = WindowedVariable(self.nc.variables[name])
+        return self._variables[name]
+
+    @property
+    def has_geolocation(self):
+        """Check if the file has the geolocation in full resolution."""
+        return 'lon' in self.nc.variables and 'lat' in self.nc.variables
+
+    @property
+    def shape(self):
+        """Get the shape (lines, pixels per line) of the swath."""
+        return self['lon'].shape
+
+    @property
+    def start_time(self):
+        """Get the start time of the swath."""
+        return read_pps_time(self.nc.getncattr('time_coverage_start'))
+
+    @property
+    def end_time(self):
+        """Get the end time of the swath."""
+        return read_pps_time(self.nc.getncattr('time_coverage_end'))
+
+    @property
+    def sensor(self):
+        """Get the instrument of the swath as used for the scan timing, or None if unknown."""
+        return get_timing_sensor([PLATFORM_SENSORS.get(getattr(self.nc, 'platform', ''), '')])
+
+    def get_scanline_times(self):
+        """Get the observation time of each scan line of the swath."""
+        return get_swath_scanline_times(self.sensor, self.shape, self.start_time, self.end_time)
+
+    def get_coarse_geolocation(self):
+        """Get the longitudes and latitudes on every geolocation_step:th line and pixel."""
+        if self._coarse_geolocation is None:
+            step = self.geolocation_step
+            # Strided reads along both dimensions are very slow in netCDF-C,
+            # so whole lines are read and the pixels decimated afterwards:
+            with timer('geolocation_load'):
+                self._coarse_geolocation = tuple(
+                    np.ma.filled(np.ma.asarray(self.nc.variables[name][::step, :][:, ::step], dtype='float64'),
+                                 np.nan)
+                    for name in ['lon', 'lat'])
+        return self._coarse_geolocation
+
+    def get_neighbours(self, lons, lats):
+        """Find the swath pixels nearest to the requested geographical positions.
+
+        Returns the rows, columns and great circle distances (metres) of the
+        nearest pixels, like `cloud_utils.get_swath_neighbours`. A tree on the
+        decimated geolocation gives the approximate pixel, which is refined
+        in a window of the full resolution geolocation around it. The window
+        is moved on as long as the nearest pixel is found on its border.
+        """
+        from pykdtree.kdtree import KDTree
+
+        coarse_lons, coarse_lats = self.get_coarse_geolocation()
+        valid = np.flatnonzero(get_valid_lonlats(coarse_lons, coarse_lats))
+        if valid.size == 0:
+            nreq = np.size(lons)
+            return np.zeros(nreq, dtype='int'), np.zeros(nreq, dtype='int'), np.full(nreq, np.inf)
+        with timer('kdtree_build'):
+            kd_tree = KDTree(lonlat2xyz(coarse_lons.ravel()[valid], coarse_lats.ravel()[valid]))
+
+        req_points = lonlat2xyz(lons, lats)
+        _, kidx = kd_tree.query(req_points, k=1)
+        coarse_rows, coarse_cols = np.divmod(valid[kidx.astype('int')], coarse_lons.shape[1])
+
+        rows, cols, chords = [], [], []
+        for (point, row, col) in zip(req_points, coarse_rows, coarse_cols):
+            row, col, chord = self._refine(point, row * self.geolocation_step, col * self.geolocation_step)
+            rows.append(row)
+            cols.append(col)
+            chords.append(chord)
+
+        return np.array(rows), np.array(cols), get_arc_length(np.array(chords, dtype='float64'))
+
+    def _refine(self, point, row, col):
+        """Find the pixel nearest to an (x, y, z) point in windows of the geolocation around a first guess.
+
+        If the nearest pixel is still on the window border after
+        MAX_REFINE_STEPS moves, a last search is done in a window four times
+        as wide around it.
+        """
+        half_width = self.geolocation_step
+        for _ in range(MAX_REFINE_STEPS):
+            row, col, chord, on_border = self._search_window(point, row, col, half_width)
+            if not on_border:
+                return row, col, chord
+
+        count('refine_not_converged')
+        row, col, chord, on_border = self._search_window(point, row, col, 4 * half_width)
+        if on_border:
+            LOG.warning("Nearest pixel search not converged at row %d, col %d of %s", row, col, self.filename)
+        return row, col, chord
+
+    def _search_window(self, point, row, col, half_width):
+        """Find the pixel nearest to an (x, y, z) point in a window of the geolocation.
+
+        Returns the row, column and chord length of the nearest pixel, and
+        whether it is on the window border (inside the swath).
+        """
+        nlines, npixels = self.shape
+        window = (slice(max(row - half_width, 0), min(row + half_width + 1, nlines)),
+                  slice(max(col - half_width, 0), min(col + half_width + 1, npixels)))
+        lons, lats = self['lon'][window], self['lat'][window]
+        xyz = lonlat2xyz(lons, lats)
+        xyz[~get_valid_lonlats(lons, lats)] = np.nan
+        sqdists = ((xyz - point)**2).sum(axis=1).reshape(lons.shape)
+        if np.isnan(sqdists).all():
+            return row, col, np.inf, False
+        wrow, wcol = np.unravel_index(np.nanargmin(sqdists), sqdists.shape)
+        on_border = ((wrow == 0 and window[0].start > 0) or
+                     (wrow == sqdists.shape[0] - 1 and window[0].stop < nlines) or
+                     (wcol == 0 and window[1].start > 0) or
+                     (wcol == sqdists.shape[1] - 1 and window[1].stop < npixels))
+        return window[0].start + wrow, window[1].start + wcol, np.sqrt(sqdists[wrow, wcol]), on_border
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2022 Adam.Dybbroe
+
+# Author(s):
+
+#   Adam.Dybbroe <a000680@c21856.ad.smhi.se>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Rendering of the minutes since last cloudfree view maps.
+
+The cartopy figure with coastlines, borders, gridlines and colorbar is built
+once per area, and only the image data and the title are updated between
+frames. Frames can also be rendered in a separate worker process, where
+intermediate frames may be skipped when only the latest map is of interest.
+"""
+
+import multiprocessing
+import queue
+import traceback
+
+from fires_and_clouds.areas import get_cartopy_crs
+from fires_and_clouds.instrumentation import timer
+
+
+def get_time_span_text(scene_ids):
+    """Get a text with the time span covered by a list of scene ids."""
+    if len(scene_ids) > 1:
+        return '%s to %s' % (scene_ids[0]['start_time'].strftime('%Y-%m-%d %H%M'),
+                             scene_ids[-1]['start_time'].strftime('%Y-%m-%d %H%M'))
+    return '%s' % scene_ids[0]['start_time'].strftime('%Y-%m-%d %H%M')
+
+
+class CloudfreeViewRenderer(object):
+    """Render minutes since last cloudfree view maps on a static cartopy background."""
+
+    def __init__(self, areaid, max_minutes=720, figsize=(14, 12)):
+        """Initialize, building the static background of the area."""
+        from matplotlib import cm
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        import cartopy.feature as cf
+        import numpy as np
+
+        self.areaid = areaid
+        crs = get_cartopy_crs(areaid)
+
+        self.fig = Figure(figsize=figsize)
+        FigureCanvasAgg(self.fig)
+        ax = self.fig.add_subplot(1, 1, 1, projection=crs)
+        ax.coastlines()
+        ax.add_feature(cf.BORDERS)
+        ax.gridlines()
+        ax.set_global()
+        ax.tick_params(axis='both', labelsize=0, length=0)
+
+        empty = np.ma.masked_all((2, 2))
+        self._image = ax.imshow(empty, transform=crs, extent=crs.bounds, interpolation='nearest',
+                                origin='upper', cmap=cm.viridis)
+        self._image.set_clim(0, max_minutes)
+        self._title = ax.set_title('', fontsize=18)
+        cbar = self.fig.colorbar(self._image, ax=ax)
+        cbar.set_label("Minutes", fontsize=18)
+        cbar.ax.tick_params(labelsize=18)
+
+    def set_max_minutes(self, max_minutes):
+        """Set the upper limit of the color scale."""
+        self._image.set_clim(0, max_minutes)
+
+    def render(self, data, title, filename):
+        """Render a frame with new data and title to an image file."""
+        with timer('render'):
+            self._image.set_data(data)
+            self._title.set_text(title)
+            self.fig.savefig(filename)
+
+
+def _render_frames(areaid, max_minutes, frames, skip_intermediate, errors):
+    """Render the frames put on a queue until a None is received (worker process).
+
+    If rendering fails the traceback is put on the *errors* queue and the
+    worker stops.
+    """
+    try:
+        _render_queued_frames(CloudfreeViewRenderer(areaid, max_minutes), frames, skip_intermediate)
+    except Exception:
+        errors.put(traceback.format_exc())
+
+
+def _render_queued_frames(renderer, frames, skip_intermediate):
+    """Render the frames put on a queue until a None is received."""
+    done = False
+    while not done:
+        frame = frames.get()
+        if frame is None:
+            return
+        if skip_intermediate:
+            # Only the latest frame waiting in the queue is rendered:
+            try:
+                while True:
+                    newer = frames.get_nowait()
+                    if newer is None:
+                        done = True
+                        break
+                    frame = newer
+            except queue.Empty:
+                pass
+        renderer.render(*frame)
+
+
+class RenderWorker(object):
+    """Render frames in a separate process, so that the processing does not wait for matplotlib.
+
+    With *skip_intermediate* frames submitted while the worker is busy are
+    dropped, except the most recent one. If the worker fails or dies, the
+    next submit or close raises a RuntimeError with the worker's traceback.
+    """
+
+    def __init__(self, areaid, max_minutes=720, queue_size=4, skip_intermediate=False, poll_interval=1.0):
+        """Initialize and start the worker process."""
+        self._frames = multiprocessing.Queue(queue_size)
+        self._errors = multiprocessing.Queue(1)
+        self.poll_interval = poll_interval
+        self._process = multiprocessing.Process(target=_render_frames,
+                                                args=(areaid, max_minutes, self._frames, skip_intermediate,
+                                                      self._errors))
+        self._process.start()
+
+    def submit(self, data, title, filename):
+        """Queue a frame for rendering, waiting if the queue is full."""
+        self._put((data, title, filename))
+
+    def close(self):
+        """Render the remaining frames and stop the worker."""
+        self._put(None)
+        self._process.join()
+        self._check_worker()
+
+    def _put(self, item):
+        """Put an item on the frame queue, as long as the worker is alive to take it."""
+        while True:
+            self._check_worker()
+            try:
+                self._frames.put(item, timeout=self.poll_interval)
+                return
+            except queue.Full:
+                continue
+
+    def _check_worker(self):
+        """Raise the error of the worker if it has failed or died."""
+        if self._process.is_alive() and self._errors.empty():
+            return
+        try:
+            error = self._errors.get_nowait()
+        except queue.Empty:
+            if self._process.exitcode == 0:
+                return
+            error = 'Render worker died with exit code %s' % self._process.exitcode
+        # Nobody will read the frames left in the queue:
+        self._frames.cancel_join_thread()
+        raise RuntimeError('Rendering failed in the worker process:\n' + error)
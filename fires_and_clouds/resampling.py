@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2022 Adam.Dybbroe
+
+# Author(s):
+
+#   Adam.Dybbroe <a000680@c21856.ad.smhi.se>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Resampling of swath data to area grids.
+
+The resamplers all find, for each area pixel, the swath pixel to take the
+data from, so that masks, data types and fill values are handled the same
+way whatever the resampler (see neighbours.get_sample_from_index):
+
+- 'nearest': the nearest swath pixel within the radius of influence, see
+  the neighbours module.
+- 'gradient': pyresample's gradient search (nearest neighbour flavour),
+  which follows the swath geometry block by block instead of building a
+  tree. Area pixels outside the swath get no data, whatever the radius.
+- 'bucket': each swath pixel is projected to the area pixel it falls in,
+  and the pixel nearest to the centre of the area pixel is kept. Only for
+  grids coarser than the swath, finer grids get holes between the swath
+  pixels.
+
+The 'auto' choice follows the benchmarks (ResamplingSuite) on VIIRS
+scenes: the gradient search on grids finer than the swath pixels, the
+bucket resampler on coarser grids, and the nearest neighbour search on
+very coarse grids, where its tree is queried by few area pixels. It is
+decided from the area and the nominal pixel size of the instrument only,
+so all scenes of an instrument get the same resampler on an area. Both the
+gradient search and the bucket resampler leave about 1% of the area pixels
+filled by the nearest neighbour search without data (along the swath edges
+and between scans), so the composites use 'nearest' by default.
+"""
+
+import numpy as np
+
+from fires_and_clouds.instrumentation import timer
+from fires_and_clouds.neighbours import get_nearest_index
+from fires_and_clouds.neighbours import get_sample_from_index
+from fires_and_clouds.neighbours import get_valid_lonlats
+
+RESAMPLERS = ['nearest', 'gradient', 'bucket']
+
+# Area pixel size (metres) from which the 'auto' choice is the nearest neighbour search:
+NEAREST_MIN_PIXEL_SIZE = 8000
+
+# Nominal largest distance (metres) between neighbouring pixels of the swath
+# (at the swath edge) of each instrument, the 'auto' choice takes the bucket
+# resampler on area grids at least this coarse:
+SENSOR_PIXEL_SIZES = {'viirs': 1600,
+                      'modis': 4800,
+                      'avhrr': 6100}
+
+CHUNK_SIZE = 2048
+
+
+def get_resampler_name(resampler, area_def, sensor=None):
+    """Get the name of the resampler to use for swath data of an instrument on an area, resolving 'auto'.
+
+    For 'auto' the nearest neighbour search is taken if the instrument is
+    unknown.
+    """
+
+    if resampler == 'auto':
+        pixel_size = min(area_def.pixel_size_x, area_def.pixel_size_y)
+        if pixel_size >= NEAREST_MIN_PIXEL_SIZE or sensor not in SENSOR_PIXEL_SIZES:
+            return 'nearest'
+        if pixel_size >= SENSOR_PIXEL_SIZES[sensor]:
+            return 'bucket'
+        return 'gradient'
+    if resampler not in RESAMPLERS:
+        raise ValueError("Unknown resampler '%s', use one of %s or 'auto'" % (resampler, RESAMPLERS))
+    return resampler
+
+
+def get_bucket_index(lons, lats, area_def):
+    """Get the flat index of the swath pixel nearest to the centre of each area pixel it falls in, -1 for none."""
+    from pyproj import Proj
+
+    source = np.flatnonzero(get_valid_lonlats(lons, lats))
+    xcoords, ycoords = Proj(area_def.crs)(np.ma.getdata(lons).ravel()[source],
+                                          np.ma.getdata(lats).ravel()[source])
+
+    xmin, _, _, ymax = area_def.area_extent
+    cols = (xcoords - xmin) / area_def.pixel_size_x
+    rows = (ymax - ycoords) / area_def.pixel_size_y
+    inside = (np.isfinite(cols) & np.isfinite(rows) &
+              (cols >= 0) & (cols < area_def.width) & (rows >= 0) & (rows < area_def.height))
+    source, cols, rows = source[inside], cols[inside], rows[inside]
+
+    cells = rows.astype('int64') * area_def.width + cols.astype('int64')
+    sqdists = ((cols % 1 - 0.5)**2 + (rows % 1 - 0.5)**2).astype('float32')
+    nearest = np.full(area_def.size, np.inf, dtype='float32')
+    np.minimum.at(nearest, cells, sqdists)
+    winners = sqdists == nearest[cells]
+
+    index = np.full(area_def.size, -1, dtype='int64')
+    index[cells[winners]] = source[winners]
+    return index
+
+
+def get_gradient_index(lons, lats, area_def):
+    """Get the flat index of the swath pixel found by gradient search for each area pixel, -1 for none."""
+    import dask.array as da
+    import xarray as xr
+    from pyresample.geometry import SwathDefinition
+    from pyresample.gradient import create_gradient_search_resampler
+
+    shape = np.shape(lons)
+    valid = get_valid_lonlats(lons, lats).reshape(shape)
+
+    def get_data_array(arr):
+        arr = np.where(valid, np.ma.filled(np.ma.asarray(arr, dtype='float64'), np.nan), np.nan)
+        return xr.DataArray(da.from_array(arr, chunks=CHUNK_SIZE), dims=('y', 'x'))
+
+    resampler = create_gradient_search_resampler(SwathDefinition(get_data_array(lons), get_data_array(lats)),
+                                                 area_def)
+    resampler.precompute()
+    # The flat pixel index is exact in float64:
+    pixels = da.arange(np.prod(shape), dtype='float64', chunks=CHUNK_SIZE**2).reshape(shape)
+    pixels = xr.DataArray(pixels.rechunk(CHUNK_SIZE), dims=('y', 'x'))
+    result = resampler.compute(pixels, method='nn', fill_value=np.nan).values.ravel()
+
+    return np.where(np.isfinite(result), result, -1).astype('int64')
+
+
+def resample(lons, lats, data, area_def, radius_of_influence=10000, fill_value=None, resampler='auto',
+             sensor=None):
+    """Remap swath data to an area with one of the RESAMPLERS, or the 'auto' choice for the area and *sensor*.
+
+    The radius of influence (metres) is used by the nearest neighbour
+    resampler only.
+    """
+
+    resampler = get_resampler_name(resampler, area_def, sensor)
+    with timer('resample_' + resampler):
+        if resampler == 'nearest':
+            index = get_nearest_index(lons, lats, area_def, radius_of_influence)
+        elif resampler == 'gradient':
+            index = get_gradient_index(lons, lats, area_def)
+        else:
+            index = get_bucket_index(lons, lats, area_def)
+
+    return get_sample_from_index(data, index, area_def, fill_value)
@@ -22,7 +22,8 @@
 
 """Tools for satellite viewing geometry.
 
-E.g to convert scanning angles to observer zenith angles
+E.g to convert scanning angles to observer zenith angles, or to derive the
+observation time of each scan line of a swath
 """
 
 
@@ -30,6 +31,17 @@ import numpy as np
 
 EARTH_RADIUS = 6371.0  # km
 
+# Nominal scan timing per instrument. For each number of pixels per scan line
+# (identifying the band/resolution) the number of lines swept per scan
+# (mirror rotation) and the scan period in seconds:
+SCAN_TIMING = {'viirs': {3200: (16, 1.779166667),  # M-bands
+                         6400: (32, 1.779166667)},  # I-bands
+               'modis': {1354: (10, 1.4771),  # 1 km
+                         2708: (20, 1.4771),  # 500 m
+                         5416: (40, 1.4771)},  # 250 m
+               'avhrr': {2048: (1, 1 / 6.0),  # LAC/FRAC
+                         409: (1, 0.5)}}  # GAC
+
 
 def convert_angles_scan2zenith(phi_scan, sat_height):
     """Convert satellite scan angles to satellite (observer) zenith angles."""
@@ -49,3 +61,78 @@ def convert_angles_zenith2scan(theta_zenith, sat_height):
     scan_angle = np.arcsin(rquota * np.sin(zenith_angle))
 
     return np.rad2deg(scan_angle)
+
+
+def get_timing_sensor(sensor_names):
+    """Get the instrument with a known scan timing from sensor names like 'avhrr-3' or 'viirs'."""
+
+    for sensor_name in sensor_names:
+        sensor = sensor_name.lower().split('-')[0].split('/')[0]
+        if sensor in SCAN_TIMING:
+            return sensor
+    return None
+
+
+def get_scan_timing(sensor, pixels_per_line):
+    """Get the number of lines per scan and the scan period (seconds) of an instrument.
+
+    The band/resolution is identified from the number of pixels per scan line,
+    taking the closest nominal swath width. Returns None if the sensor is unknown.
+    """
+    try:
+        timings = SCAN_TIMING[sensor]
+    except KeyError:
+        return None
+
+    width = min(timings, key=lambda npix: abs(npix - pixels_per_line))
+    return timings[width]
+
+
+def get_scanline_times(start_time, num_of_lines, lines_per_scan, scan_period):
+    """Get the observation time of each scan line as an array of numpy datetime64.
+
+    All lines swept by the same scan (e.g. the 16 detectors of a VIIRS M-band)
+    get the start time of that scan.
+    """
+    scan_number = np.arange(num_of_lines) // lines_per_scan
+    offsets = np.round(scan_number * scan_period * 1e6).astype('int64').astype('timedelta64[us]')
+    return np.datetime64(start_time, 'us') + offsets
+
+
+def get_granule_scanline_times(granule_start_times, lines_per_granule, lines_per_scan, scan_period):
+    """Get the observation time of each scan line of a swath made of several granules.
+
+    Each granule is anchored at its own start time, so gaps between granules
+    do not accumulate into a time drift along the swath.
+    """
+    return np.concatenate([get_scanline_times(start_time, lines_per_granule, lines_per_scan, scan_period)
+                           for start_time in granule_start_times])
+
+
+def get_evenly_spaced_line_times(start_time, end_time, num_of_lines):
+    """Get scan line times spread evenly between start and end time (unknown instruments)."""
+    start = np.datetime64(start_time, 'us')
+    step = (np.datetime64(end_time, 'us') - start) / num_of_lines
+    return start + np.arange(num_of_lines) * step
+
+
+def get_swath_scanline_times(sensor, shape, start_time, end_time, granule_start_times=None):
+    """Get the observation time of each scan line of a swath of *shape* (lines, pixels per line).
+
+    The times are derived from the nominal scan timing of the instrument,
+    anchored at the start time of each granule. For unknown instruments the
+    lines are spread evenly between start and end time.
+    """
+    num_of_lines, pixels_per_line = shape
+    timing = get_scan_timing(sensor, pixels_per_line)
+    if timing is None:
+        return get_evenly_spaced_line_times(start_time, end_time, num_of_lines)
+
+    granule_start_times = granule_start_times or [start_time]
+    if num_of_lines % len(granule_start_times) != 0:
+        granule_start_times = [start_time]
+
+    lines_per_scan, scan_period = timing
+    return get_granule_scanline_times(granule_start_times,
+                                      num_of_lines // len(granule_start_times),
+                                      lines_per_scan, scan_period)
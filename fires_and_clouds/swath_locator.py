@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2022 Adam.Dybbroe
+
+# Author(s):
+
+#   Adam.Dybbroe <a000680@c21856.ad.smhi.se>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Coarse-to-fine search for the swath pixels nearest to geographical positions.
+
+A tree over all pixels of a multi-granule swath (tens of millions of points)
+is expensive to build and to keep in memory. Here the swath is split in
+small blocks of pixels instead. A tree on one pixel per block gives a first
+guess, which is refined among the full resolution pixels of the blocks
+around it. All blocks that could still hold a nearer pixel, judged from
+their bounding boxes, are then searched too, so that the result is exactly
+the pixel a tree over the full swath would give. The search is done in
+Earth-centred coordinates, see the neighbours module.
+"""
+
+import numpy as np
+
+from fires_and_clouds.instrumentation import count, timer
+from fires_and_clouds.neighbours import get_arc_length
+from fires_and_clouds.neighbours import get_valid_lonlats
+from fires_and_clouds.neighbours import lonlat2xyz
+
+BLOCK_SIZE = 16
+
+
+class SwathLocator(object):
+    """Find the swath pixels nearest to geographical positions."""
+
+    def __init__(self, lons, lats, block_size=BLOCK_SIZE):
+        """Initialize from the 2-D longitudes and latitudes of the swath."""
+        from pykdtree.kdtree import KDTree
+
+        self.shape = np.shape(lons)
+        self.block_size = block_size
+
+        with timer('locator_build'):
+            # The pixels are rearranged block by block, with NaN padding at
+            # the swath edges and for invalid geolocation:
+            nblock_rows = -(-self.shape[0] // block_size)
+            nblock_cols = -(-self.shape[1] // block_size)
+            self.block_grid = (nblock_rows, nblock_cols)
+            xyz = lonlat2xyz(lons, lats)
+            xyz[~get_valid_lonlats(lons, lats)] = np.nan
+            self._xyz = self._get_blocks(xyz.reshape(self.shape + (3,)))
+
+            # Bounding boxes, NaN (all pixels invalid) replaced so that they are never near:
+            self._box_min = np.nan_to_num(np.fmin.reduce(self._xyz, axis=2), nan=np.inf)
+            self._box_max = np.nan_to_num(np.fmax.reduce(self._xyz, axis=2), nan=-np.inf)
+
+            # One (valid) pixel per block for the tree of first guesses:
+            valid = np.isfinite(self._xyz[:, 0, :])
+            first = valid.argmax(axis=1)
+            blocks = np.flatnonzero(valid.any(axis=1))
+            self._tree_blocks = blocks
+            self._tree = None
+            if blocks.size > 0:
+                self._tree = KDTree(np.ascontiguousarray(self._xyz[blocks, :, first[blocks]]))
+
+    def _get_blocks(self, data):
+        """Rearrange a swath array of (x, y, z) to (block, coordinate, pixel in the block) order."""
+        nblock_rows, nblock_cols = self.block_grid
+        size = self.block_size
+        padded = np.full((nblock_rows * size, nblock_cols * size, 3), np.nan, dtype='float32')
+        padded[:self.shape[0], :self.shape[1]] = data
+        blocks = padded.reshape(nblock_rows, size, nblock_cols, size, 3).transpose(0, 2, 4, 1, 3)
+        return blocks.reshape(nblock_rows * nblock_cols, 3, size * size)
+
+    def _get_swath_index(self, blocks, pixels):
+        """Get the flat swath index of pixels given by block number and position in the block."""
+        block_rows, block_cols = np.divmod(blocks, self.block_grid[1])
+        rows, cols = np.divmod(pixels, self.block_size)
+        return (block_rows * self.block_size + rows) * self.shape[1] + block_cols * self.block_size + cols
+
+    def _search_blocks(self, point, blocks):
+        """Find the pixel nearest to an (x, y, z) point in some blocks, as (squared chord, flat swath index)."""
+        sqdists = ((self._xyz[blocks] - point[:, np.newaxis])**2).sum(axis=1)
+        if np.isnan(sqdists).all():
+            return np.inf, -1
+        best = np.nanmin(sqdists)
+        # Ties are resolved to the first pixel in the swath:
+        ties = np.nonzero(sqdists == best)
+        return best, self._get_swath_index(blocks[ties[0]], ties[1]).min()
+
+    def _get_neighbour_blocks(self, block):
+        """Get a block and the (up to eight) blocks around it."""
+        nblock_rows, nblock_cols = self.block_grid
+        block_row, block_col = divmod(block, nblock_cols)
+        rows = np.arange(max(block_row - 1, 0), min(block_row + 2, nblock_rows))
+        cols = np.arange(max(block_col - 1, 0), min(block_col + 2, nblock_cols))
+        return (rows[:, np.newaxis] * nblock_cols + cols).ravel()
+
+    def query(self, lons, lats):
+        """Find the swath pixels nearest to the requested positions.
+
+        Returns the rows, columns and great circle distances (metres) of the
+        nearest pixels. If the swath has no valid geolocation at all, the
+        distances are infinite (and the rows and columns 0).
+        """
+        req_points = lonlat2xyz(lons, lats)
+        if self._tree is None:
+            nreq = len(req_points)
+            return np.zeros(nreq, dtype='int'), np.zeros(nreq, dtype='int'), np.full(nreq, np.inf)
+        _, kidx = self._tree.query(req_points, k=1)
+        guesses = self._tree_blocks[kidx.astype('int')]
+
+        indices = []
+        sqdists = []
+        for point, guess in zip(req_points, guesses):
+            searched = self._get_neighbour_blocks(guess)
+            best, index = self._search_blocks(point, searched)
+
+            # Blocks with a bounding box nearer than the best pixel so far may hold a nearer pixel:
+            box_dists = np.maximum(np.maximum(self._box_min - point, point - self._box_max), 0)
+            candidates = np.flatnonzero((box_dists**2).sum(axis=1) <= best)
+            candidates = np.setdiff1d(candidates, searched, assume_unique=True)
+            if len(candidates) > 0:
+                count('locator_blocks_searched', len(candidates))
+                other_best, other_index = self._search_blocks(point, candidates)
+                if other_best < best or (other_best == best and other_index < index):
+                    best, index = other_best, other_index
+
+            indices.append(index)
+            sqdists.append(best)
+
+        rows, cols = np.divmod(np.array(indices, dtype='int'), self.shape[1])
+        return rows, cols, get_arc_length(np.sqrt(np.array(sqdists, dtype='float64')))
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2022 Adam.Dybbroe
+
+# Author(s):
+
+#   Adam.Dybbroe <a000680@c21856.ad.smhi.se>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tiled output of the products for web viewers.
+
+Products on an area grid are written either as Cloud-Optimised GeoTIFFs,
+with internal tiling and overviews, or as a pyramid of png tiles in the
+native tile grid of the area ({z}/{x}/{y}.png, with the full resolution at
+the highest zoom level). The tile pyramid is updated incrementally: only the
+tiles containing changed pixels are re-rendered.
+
+Times are tiled as absolute times (TimeTilePyramid), which only change
+where new data arrive, and converted to e.g. the minutes since the last
+cloudfree view by the viewer. Point overlays (the fires) are written as
+GeoJSON.
+"""
+
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+from fires_and_clouds.areas import get_area_def
+from fires_and_clouds.areas import get_transform
+
+TILE_SIZE = 256
+
+# Times are encoded in the tiles as minutes since this epoch, in 24 bits (until 2051):
+TIME_TILE_EPOCH = datetime(2020, 1, 1)
+TIME_TILE_MAX_MINUTES = 2**24 - 1
+
+
+def write_cog(filename, data, areaid, nodata=None, overview_resampling='nearest'):
+    """Write a 2-D (masked) array on an area grid to a Cloud-Optimised GeoTIFF.
+
+    Masked pixels are set to *nodata*, which defaults to nan for float data.
+    """
+    import rasterio
+    import rasterio.shutil
+    from rasterio.io import MemoryFile
+
+    area_def = get_area_def(areaid)
+    if nodata is None and np.issubdtype(data.dtype, np.floating):
+        nodata = np.nan
+    if np.ma.isMaskedArray(data):
+        if nodata is None:
+            raise ValueError("A nodata value is needed for masked %s data" % data.dtype)
+        data = data.filled(nodata)
+
+    profile = {'driver': 'GTiff', 'width': area_def.width, 'height': area_def.height,
+               'count': 1, 'dtype': data.dtype, 'nodata': nodata,
+               'crs': rasterio.crs.CRS.from_wkt(area_def.crs.to_wkt()),
+               'transform': get_transform(areaid)}
+    with MemoryFile() as memfile:
+        with memfile.open(**profile) as dst:
+            dst.write(data, 1)
+        with memfile.open() as src:
+            rasterio.shutil.copy(src, filename, driver='COG', compress='DEFLATE',
+                                 blocksize=TILE_SIZE, overview_resampling=overview_resampling)
+
+
+def get_changed_pixels(old, new):
+    """Get a boolean mask of the pixels differing between two masked arrays (including the mask)."""
+    old_mask = np.ma.getmaskarray(old)
+    new_mask = np.ma.getmaskarray(new)
+    changed = old_mask != new_mask
+    changed |= ~new_mask & ~old_mask & (np.ma.getdata(old) != np.ma.getdata(new))
+    return changed
+
+
+class TilePyramid(object):
+    """A pyramid of png tiles in the native tile grid of an area.
+
+    The data are colorized with a trollimage colormap, with masked pixels
+    transparent. A tilegrid.json file describes the grid (projection, origin,
+    resolutions), so that a web viewer (e.g. OpenLayers) can be set up for it.
+    """
+
+    def __init__(self, output_dir, areaid, colormap, tile_size=TILE_SIZE):
+        """Initialize."""
+        self.output_dir = output_dir
+        self.areaid = areaid
+        self.colormap = colormap
+        self.tile_size = tile_size
+        self.area_def = get_area_def(areaid)
+        self.max_zoom = max(int(np.ceil(np.log2(max(self.area_def.shape) / tile_size))), 0)
+
+    def get_tile_grid(self):
+        """Get the description of the tile grid."""
+        xmin, _, _, ymax = self.area_def.area_extent
+        return {'area_id': self.areaid,
+                'projection': self.area_def.crs.to_wkt(),
+                'origin': [xmin, ymax],
+                'extent': list(self.area_def.area_extent),
+                'tile_size': self.tile_size,
+                'resolutions': [self.area_def.pixel_size_x * 2 ** (self.max_zoom - zoom)
+                                for zoom in range(self.max_zoom + 1)]}
+
+    def get_tiles(self, zoom, changed=None):
+        """Get the (x, y) indices of the tiles at a zoom level, only those with changed pixels if *changed* is given."""
+        step = self.tile_size * 2 ** (self.max_zoom - zoom)
+        ny, nx = (-(-self.area_def.height // step), -(-self.area_def.width // step))
+        if changed is None:
+            return [(x, y) for y in range(ny) for x in range(nx)]
+        rows, cols = np.nonzero(changed)
+        tiles = np.unique((rows // step) * nx + cols // step)
+        return [(int(tile % nx), int(tile // nx)) for tile in tiles]
+
+    def write(self, data, changed=None):
+        """Render the tiles of all zoom levels, only those with changed pixels if *changed* is given.
+
+        Returns the number of tiles written.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        if changed is None:
+            with open(os.path.join(self.output_dir, 'tilegrid.json'), 'w') as fpt:
+                json.dump(self.get_tile_grid(), fpt, indent=2)
+
+        ntiles = 0
+        for zoom in range(self.max_zoom + 1):
+            factor = 2 ** (self.max_zoom - zoom)
+            # Nearest neighbour decimation, as the products are categorical or times:
+            level_data = data[::factor, ::factor]
+            for x, y in self.get_tiles(zoom, changed):
+                self._write_tile(level_data, zoom, x, y)
+                ntiles = ntiles + 1
+
+        return ntiles
+
+    def get_rgba(self, values):
+        """Get the colours (uint8 rgba) of the tile values (float64, nan for no data)."""
+        colors = self.colormap.colorize(values)
+        rgb = np.nan_to_num(np.moveaxis(colors[:3], 0, -1)) * 255
+        return np.dstack((rgb.round().astype(np.uint8), np.where(np.isfinite(values), 255, 0).astype(np.uint8)))
+
+    def _write_tile(self, level_data, zoom, x, y):
+        from PIL import Image
+
+        tile = level_data[y * self.tile_size:(y + 1) * self.tile_size,
+                          x * self.tile_size:(x + 1) * self.tile_size]
+        rgba = np.zeros((self.tile_size, self.tile_size, 4), dtype=np.uint8)
+        if tile.size > 0:
+            rgba[:tile.shape[0], :tile.shape[1]] = self.get_rgba(
+                np.ma.filled(np.ma.asarray(tile, dtype='float64'), np.nan))
+
+        tile_dir = os.path.join(self.output_dir, str(zoom), str(x))
+        os.makedirs(tile_dir, exist_ok=True)
+        Image.fromarray(rgba, 'RGBA').save(os.path.join(tile_dir, '%d.png' % y))
+
+
+class TimeTilePyramid(TilePyramid):
+    """A pyramid of png tiles of times, in seconds since 1970.
+
+    The times are encoded as the minutes since TIME_TILE_EPOCH in the red,
+    green and blue bytes (most significant first), with alpha 0 where there
+    is no data. As the times only change where new data arrive, the tiles
+    updated incrementally stay consistent with each other, and the viewer
+    converts them to the time since at display time (see decode_time_tile).
+    """
+
+    def __init__(self, output_dir, areaid, tile_size=TILE_SIZE):
+        """Initialize."""
+        super().__init__(output_dir, areaid, None, tile_size)
+
+    def get_tile_grid(self):
+        """Get the description of the tile grid, with the encoding of the times."""
+        tile_grid = super().get_tile_grid()
+        tile_grid['encoding'] = {'type': 'time',
+                                 'units': 'minutes since %s' % TIME_TILE_EPOCH.strftime('%Y-%m-%dT%H:%M:%S'),
+                                 'value': '65536 * red + 256 * green + blue',
+                                 'nodata': 'alpha == 0'}
+        return tile_grid
+
+    def get_rgba(self, values):
+        """Encode the times (seconds since 1970, nan for no data) as rgba."""
+        epoch = (TIME_TILE_EPOCH - datetime(1970, 1, 1)).total_seconds()
+        valid = np.isfinite(values)
+        minutes = np.clip(np.round((np.where(valid, values, epoch) - epoch) / 60.), 0, TIME_TILE_MAX_MINUTES)
+        minutes = minutes.astype('uint32')
+        return np.dstack(((minutes >> 16) & 255, (minutes >> 8) & 255, minutes & 255,
+                          np.where(valid, 255, 0))).astype(np.uint8)
+
+
+def decode_time_tile(rgba):
+    """Decode the rgba values of a TimeTilePyramid tile to seconds since 1970, nan for no data."""
+    rgba = np.asarray(rgba, dtype='int64')
+    minutes = (rgba[..., 0] << 16) + (rgba[..., 1] << 8) + rgba[..., 2]
+    seconds = minutes * 60. + (TIME_TILE_EPOCH - datetime(1970, 1, 1)).total_seconds()
+    return np.where(rgba[..., 3] > 0, seconds, np.nan)
+
+
+def _get_json_value(value):
+    """Get a property value as a python scalar, with nan as None."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+def write_points_geojson(filename, lons, lats, properties=None):
+    """Write points, with a dict of properties per point, as a GeoJSON feature collection.
+
+    Numpy scalars are written as numbers, and missing (nan) values as null.
+    """
+    properties = properties or [{} for _ in lons]
+    features = [{'type': 'Feature',
+                 'geometry': {'type': 'Point', 'coordinates': [float(lon), float(lat)]},
+                 'properties': {key: _get_json_value(value) for key, value in props.items()}}
+                for lon, lat, props in zip(lons, lats, properties)]
+    tmpname = filename + '.tmp'
+    with open(tmpname, 'w') as fpt:
+        json.dump({'type': 'FeatureCollection', 'features': features}, fpt, default=str, allow_nan=False)
+    os.replace(tmpname, filename)
@@ -25,14 +25,20 @@
 
 
 from glob import glob
+import bisect
+import logging
 import os
 from datetime import datetime, timedelta
 
-from trollsched.satpass import Pass as overpass
-from pyorbital.orbital import Orbital
-from pyorbital import tlefile
 from trollsift import Parser, globify
 
+from fires_and_clouds.instrumentation import count, timer
+
+# pyorbital and pytroll-schedule are imported where they are used, to keep
+# the import of this module cheap.
+
+LOG = logging.getLogger(__name__)
+
 # Location = Longitude (deg), Latitude (deg), Altitude (km)
 NRK = (16.148649, 58.581844, 0.052765)
 #SDK = (26.632, 67.368, 0.18)
@@ -44,41 +50,58 @@ TLE_LONGTIME_ARCHIVE = "/data/lang/satellit/polar/orbital_elements/TLE"
 tlepattern = 'tle-{time:%Y%m%d%H%M}.txt'
 tlepattern2 = 'tle-{time:%Y%m%d}.txt'
 
+# Cached listings of the tle directories: (directory, pattern) -> (mtime, [(time, filepath), ...])
+_TLE_INDEX = {}
 
-def find_valid_file_from_list(parse_obj, obstime, tlefiles, tol_sec):
 
-    found_file = None
-    tlefiles.sort()
-    seconds_dist = timedelta(days=10).total_seconds()
-    for filepath in tlefiles[::-1]:
-        res = parse_obj.parse(os.path.basename(filepath))
-        dsecs = abs((res['time'] - obstime).total_seconds())
+def get_tle_index(directory, pattern):
+    """Get the tle files in a directory as a list of (time, filepath) sorted in time.
 
-        if dsecs < seconds_dist:
-            seconds_dist = dsecs
-            found_file = filepath
+    The listing is cached and only redone when the directory content has changed.
+    """
 
-        if seconds_dist < tol_sec:
-            break
+    try:
+        dir_mtime = os.stat(directory).st_mtime_ns
+    except OSError:
+        return []
 
-    return found_file
+    key = (directory, pattern)
+    if key in _TLE_INDEX and _TLE_INDEX[key][0] == dir_mtime:
+        return _TLE_INDEX[key][1]
 
+    p__ = Parser(pattern)
+    index = []
+    with timer('discovery'):
+        for filepath in glob(os.path.join(directory, globify(pattern))):
+            index.append((p__.parse(os.path.basename(filepath))['time'], filepath))
+        index.sort()
+
+    _TLE_INDEX[key] = (dir_mtime, index)
+    return index
 
-def find_actual_tlefile(obstime):
-    """Given a time find the tle-file with the timestamp closest in time and return filename."""
 
-    tlefiles = glob(os.path.join(TLE_REALTIME_ARCHIVE, globify(tlepattern)))
+def find_closest_file_in_index(index, obstime, max_dist=timedelta(days=10)):
+    """Find the file closest in time to obstime in a sorted list of (time, filepath)."""
 
-    p__ = Parser(tlepattern)
-    found_file = None
-    tol_sec = 3600
+    pos = bisect.bisect_left(index, (obstime, ''))
+    candidates = index[max(pos - 1, 0): pos + 1]
+    if not candidates:
+        return None
 
-    found_file = find_valid_file_from_list(p__, obstime, tlefiles, tol_sec)
+    ftime, filepath = min(candidates, key=lambda item: abs(item[0] - obstime))
+    if abs(ftime - obstime) >= max_dist:
+        return None
+    return filepath
+
+
+def find_actual_tlefile(obstime):
+    """Given a time find the tle-file with the timestamp closest in time and return filename."""
+
+    found_file = find_closest_file_in_index(get_tle_index(TLE_REALTIME_ARCHIVE, tlepattern), obstime)
     if not found_file:
         for pattern in [tlepattern, tlepattern2]:
-            p__ = Parser(pattern)
-            tlefiles_archive = glob(os.path.join(TLE_LONGTIME_ARCHIVE + obstime.strftime("/%Y%m"), globify(pattern)))
-            found_file = find_valid_file_from_list(p__, obstime, tlefiles_archive, tol_sec)
+            archive_dir = TLE_LONGTIME_ARCHIVE + obstime.strftime("/%Y%m")
+            found_file = find_closest_file_in_index(get_tle_index(archive_dir, pattern), obstime)
             if found_file:
                 break
 
@@ -87,6 +110,7 @@ def find_actual_tlefile(obstime):
 
 def get_sats_within_horizon(satnames, obstime, forward=1, tle_filename=None, location=NRK):
     """For a given time find all passes for a list of satellites within the horizon of a given location."""
+    from pyorbital.orbital import Orbital
 
     passes = {}
     local_horizon = 0
@@ -114,7 +138,7 @@ def create_passes_inside_time_window(allpasses, instruments, time_left, time_rig
             sensor = instruments.get(satname, 'mhs')
             if time_start > time_end:
                 continue
-            print(satname, sensor, rtime, ftime, time_start, time_end)
+            LOG.debug("Pass %s %s %s %s inside window %s - %s", satname, sensor, rtime, ftime, time_start, time_end)
             passes.append(create_pass(satname, sensor,
                                       time_start, time_end, tle_filename))
 
@@ -123,6 +147,8 @@ def create_passes_inside_time_window(allpasses, instruments, time_left, time_rig
 
 def create_pass(satname, instrument, starttime, endtime, tle_filename=None):
     """Create a satellite pass given a start and an endtime."""
+    from trollsched.satpass import Pass as overpass
+    from pyorbital import tlefile
 
     tle = tlefile.Tle(satname, tle_file=tle_filename)
     cpass = overpass(satname, starttime, endtime, instrument=instrument, tle1=tle.line1, tle2=tle.line2)
@@ -143,31 +169,35 @@ def get_af_files(base_dir, starttime, endtime, pattern):
             subdirs.append(subdir)
         otime = otime + timedelta(days=30)
 
-    flist = []
-    for sdir in subdirs:
-        flist = flist + glob(os.path.join(sdir, globify(pattern)))
+    with timer('discovery'):
+        flist = []
+        for sdir in subdirs:
+            flist = flist + glob(os.path.join(sdir, globify(pattern)))
+
+        flist = flist + glob(os.path.join(base_dir, globify(pattern)))
 
-    flist = flist + glob(os.path.join(base_dir, globify(pattern)))
+        newflist = []
+        for fpath in flist:
+            fname = os.path.basename(fpath)
+            res = p__.parse(fname)
 
-    newflist = []
-    for fpath in flist:
-        fname = os.path.basename(fpath)
-        res = p__.parse(fname)
+            stime = res['start_time']
+            year = stime.year
+            month = stime.month
+            day = stime.day
+            ehour = res['end_hour']
+            etime = datetime(year, month, day, ehour.hour, ehour.minute,
+                             ehour.second, ehour.microsecond)
 
-        stime = res['start_time']
-        year = stime.year
-        month = stime.month
-        day = stime.day
-        ehour = res['end_hour']
-        etime = datetime(year, month, day, ehour.hour, ehour.minute,
-                         ehour.second, ehour.microsecond)
+            if etime < stime:
+                etime = etime + timedelta(days=1)
 
-        if etime < stime:
-            etime = etime + timedelta(days=1)
+            if etime < starttime or stime > endtime:
+                continue
 
-        if etime < starttime or stime > endtime:
-            continue
+            newflist.append(fpath)
 
-        newflist.append(fpath)
+    count('files_found', len(newflist))
+    count('files_skipped', len(flist) - len(newflist))
 
     return newflist
@@ -47,7 +47,7 @@ except IOError:
 
 requires = ['docutils>=0.3', 'numpy', 'scipy', 'trollsift',
             'pytroll-schedule', 'pyorbital',
-            'geopandas', 'rasterio', 'shapely', 'pyproj']
+            'geopandas', 'rasterio', 'shapely', 'pyproj', 'netCDF4']
 
 
 NAME = "fires_and_clouds"
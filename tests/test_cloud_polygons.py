@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2022 Adam.Dybbroe
+
+# Author(s):
+
+#   Adam.Dybbroe <a000680@c21856.ad.smhi.se>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the polygonisation of the cloudmask."""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('geopandas')
+pytest.importorskip('rasterio')
+pytest.importorskip('scipy')
+
+from fires_and_clouds import areas  # noqa: E402
+from fires_and_clouds.cloud_polygons import get_cloud_components  # noqa: E402
+from fires_and_clouds.cloud_polygons import polygonize_cloudmask  # noqa: E402
+
+AREA_YAML = """test_polygons:
+  description: Test area of 1 km pixels
+  projection:
+    proj: stere
+    lat_0: 90
+    lon_0: 15
+    lat_ts: 60
+    ellps: WGS84
+  shape:
+    height: 64
+    width: 64
+  area_extent:
+    lower_left_xy: [0, -3064000]
+    upper_right_xy: [64000, -3000000]
+"""
+PIXEL_AREA = 1000 * 1000
+
+
+@pytest.fixture
+def cloudmask(tmp_path):
+    """A cloudfree mask with a 40x40 cloud across the corner of four 32x32 tiles, and a single pixel cloud."""
+    area_file = tmp_path / 'areas.yaml'
+    area_file.write_text(AREA_YAML)
+    areas.set_area_file(str(area_file))
+
+    cloudmask = np.zeros((64, 64), dtype=np.uint8)
+    cloudmask[12:52, 12:52] = 1
+    cloudmask[2, 60] = 1
+    cloudmask[60:, :4] = 255
+    return cloudmask
+
+
+def test_cloud_components(cloudmask):
+    """The clouds and the cloudfree area are labelled once, across tiles."""
+    labels, label_values, sizes = get_cloud_components(cloudmask)
+
+    assert (labels == 0).sum() == 16
+    assert len(label_values) == 4
+    assert sorted(zip(label_values[1:], sizes[1:])) == [(0, 64 * 64 - 1600 - 1 - 16), (1, 1), (1, 1600)]
+
+
+def test_one_shot_export_gives_whole_clouds(cloudmask):
+    """Without tiles each cloud is one polygon, and min_area removes the small cloud only."""
+    polygons = polygonize_cloudmask(cloudmask, 'test_polygons', tile_size=32, workers=1, min_area=2 * PIXEL_AREA)
+    clouds = polygons[polygons.raster_val == 1]
+
+    assert len(clouds) == 1
+    assert clouds.geometry.iloc[0].geom_type == 'Polygon'
+    assert clouds.area.sum() == pytest.approx(1600 * PIXEL_AREA)
+    assert polygons.area.sum() == pytest.approx((64 * 64 - 1 - 16) * PIXEL_AREA)
+    assert (polygons[['tile_row', 'tile_col']] == -1).all().all()
+
+
+def test_min_area_keeps_the_corner_pieces_of_a_cloud(cloudmask):
+    """The tile pieces of a cloud are kept when the whole cloud is big enough."""
+    polygons = polygonize_cloudmask(cloudmask, 'test_polygons', tile_size=32, workers=1,
+                                    min_area=500 * PIXEL_AREA, tiles={(0, 0), (0, 1), (1, 0), (1, 1)})
+    clouds = polygons[polygons.raster_val == 1]
+
+    assert len(clouds) == 4
+    assert clouds.area.sum() == pytest.approx(1600 * PIXEL_AREA)
+    assert sorted(zip(clouds.tile_row, clouds.tile_col)) == [(0, 0), (0, 1), (1, 0), (1, 1)]
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2022 Adam.Dybbroe
+
+# Author(s):
+
+#   Adam.Dybbroe <a000680@c21856.ad.smhi.se>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the scan line timing of the satellite scanning geometry."""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from fires_and_clouds.satellite_scanning_geometry import get_granule_scanline_times
+from fires_and_clouds.satellite_scanning_geometry import get_scan_timing
+from fires_and_clouds.satellite_scanning_geometry import get_scanline_times
+from fires_and_clouds.satellite_scanning_geometry import get_swath_scanline_times
+from fires_and_clouds.satellite_scanning_geometry import get_timing_sensor
+
+START_TIME = datetime(2021, 7, 28, 12, 0)
+VIIRS_SCAN_PERIOD = 1.779166667
+
+
+def _seconds_since_start(times, start_time=START_TIME):
+    return (times - np.datetime64(start_time, 'us')) / np.timedelta64(1, 's')
+
+
+def test_viirs_granule_scan_starts():
+    """A 768 line VIIRS M-band granule is 48 scans of 16 lines, 1.779 seconds apart."""
+    lines_per_scan, scan_period = get_scan_timing('viirs', 3200)
+    seconds = _seconds_since_start(get_scanline_times(START_TIME, 768, lines_per_scan, scan_period))
+
+    assert (lines_per_scan, scan_period) == (16, VIIRS_SCAN_PERIOD)
+    assert seconds.shape == (768, )
+    np.testing.assert_allclose(seconds[::16], np.arange(48) * VIIRS_SCAN_PERIOD, atol=1e-6)
+    assert np.unique(seconds).size == 48
+    np.testing.assert_allclose(seconds[-1], 47 * VIIRS_SCAN_PERIOD, atol=1e-6)
+
+
+def test_rows_of_a_scan_share_its_start_time():
+    """The row to scan number is an integer division: rows 0-15 are scan 0, row 16 starts scan 1."""
+    seconds = _seconds_since_start(get_scanline_times(START_TIME, 48, 16, VIIRS_SCAN_PERIOD))
+
+    np.testing.assert_array_equal(seconds[:16], 0)
+    np.testing.assert_allclose(seconds[16], VIIRS_SCAN_PERIOD, atol=1e-6)
+    np.testing.assert_allclose(seconds[31], VIIRS_SCAN_PERIOD, atol=1e-6)
+    np.testing.assert_allclose(seconds[32], 2 * VIIRS_SCAN_PERIOD, atol=1e-6)
+
+
+def test_viirs_image_bands_sweep_32_lines_per_scan():
+    """The I-bands have twice the lines per scan of the M-bands, with the same scan period."""
+    assert get_scan_timing('viirs', 6400) == (32, VIIRS_SCAN_PERIOD)
+
+
+def test_avhrr_six_lines_per_second():
+    """AVHRR scans one line at a time, six lines per second."""
+    lines_per_scan, scan_period = get_scan_timing('avhrr', 2048)
+    seconds = _seconds_since_start(get_scanline_times(START_TIME, 60, lines_per_scan, scan_period))
+
+    assert lines_per_scan == 1
+    np.testing.assert_allclose(seconds, np.arange(60) / 6., atol=1e-6)
+    np.testing.assert_allclose(seconds[6], 1.0, atol=1e-6)
+
+
+def test_modis_ten_line_scans():
+    """MODIS 1 km scans sweep 10 lines every 1.4771 seconds."""
+    lines_per_scan, scan_period = get_scan_timing('modis', 1354)
+    seconds = _seconds_since_start(get_scanline_times(START_TIME, 2030, lines_per_scan, scan_period))
+
+    assert (lines_per_scan, scan_period) == (10, 1.4771)
+    np.testing.assert_array_equal(seconds[:10], 0)
+    np.testing.assert_allclose(seconds[10], 1.4771, atol=1e-6)
+    np.testing.assert_allclose(seconds[-1], 202 * 1.4771, atol=1e-6)
+
+
+def test_scan_timing_takes_the_closest_swath_width():
+    """The band is identified by the nominal swath width closest to the number of pixels per line."""
+    assert get_scan_timing('viirs', 3180) == (16, VIIRS_SCAN_PERIOD)
+    assert get_scan_timing('modis', 2700) == (20, 1.4771)
+    assert get_scan_timing('unknown', 3200) is None
+
+
+def test_get_timing_sensor():
+    """The instrument is found from satpy like sensor names."""
+    assert get_timing_sensor(['avhrr-3']) == 'avhrr'
+    assert get_timing_sensor({'VIIRS'}) == 'viirs'
+    assert get_timing_sensor(['seviri']) is None
+
+
+def test_granules_are_anchored_at_their_own_start_times():
+    """A gap between two granules does not drift the times of the second granule."""
+    second_start = START_TIME + timedelta(seconds=86, microseconds=500000)
+    seconds = _seconds_since_start(get_granule_scanline_times([START_TIME, second_start], 768, 16,
+                                                              VIIRS_SCAN_PERIOD))
+
+    assert seconds.shape == (1536, )
+    np.testing.assert_allclose(seconds[767], 47 * VIIRS_SCAN_PERIOD, atol=1e-6)
+    np.testing.assert_allclose(seconds[768], 86.5, atol=1e-6)
+    np.testing.assert_allclose(seconds[768 + 16], 86.5 + VIIRS_SCAN_PERIOD, atol=1e-6)
+
+
+def test_swath_scanline_times_of_several_granules():
+    """A three granule VIIRS swath gets the scan timing of each granule."""
+    starts = [START_TIME + timedelta(seconds=85.4 * idx) for idx in range(3)]
+    seconds = _seconds_since_start(get_swath_scanline_times('viirs', (3 * 768, 3200), starts[0],
+                                                            starts[-1] + timedelta(seconds=85.4), starts))
+
+    np.testing.assert_allclose(seconds[::768], [0, 85.4, 170.8], atol=1e-6)
+    np.testing.assert_allclose(seconds[768 + 47 * 16], 85.4 + 47 * VIIRS_SCAN_PERIOD, atol=1e-6)
+
+
+def test_swath_scanline_times_with_inconsistent_granules():
+    """If the lines can not be split evenly on the granules the swath is anchored at its start time."""
+    starts = [START_TIME + timedelta(seconds=85.4 * idx) for idx in range(3)]
+    seconds = _seconds_since_start(get_swath_scanline_times('viirs', (1536 + 16, 3200), START_TIME,
+                                                            START_TIME + timedelta(seconds=180), starts))
+
+    np.testing.assert_allclose(seconds[::16], np.arange(97) * VIIRS_SCAN_PERIOD, atol=1e-6)
+
+
+def test_swath_scanline_times_of_unknown_instrument():
+    """The lines of an unknown instrument are spread evenly between start and end time."""
+    seconds = _seconds_since_start(get_swath_scanline_times(None, (100, 500), START_TIME,
+                                                            START_TIME + timedelta(seconds=100)))
+
+    np.testing.assert_allclose(seconds, np.arange(100), atol=1e-6)
+
+
+def test_scene_scanline_times():
+    """The line times of a cropped multi-granule scene are those of its lines in the full swath."""
+    xr = pytest.importorskip('xarray')
+    satpy = pytest.importorskip('satpy')
+    from fires_and_clouds.cloud_utils import get_scene_scanline_times
+
+    starts = [START_TIME + timedelta(seconds=85.4 * idx) for idx in range(2)]
+    end_time = starts[-1] + timedelta(seconds=85.4)
+    scn = satpy.Scene()
+    scn['cma'] = xr.DataArray(np.zeros((1536, 3200), dtype=np.uint8), dims=('y', 'x'),
+                              attrs={'sensor': 'viirs', 'start_time': starts[0], 'end_time': end_time})
+    scn.attrs['granule_start_times'] = starts
+
+    seconds = _seconds_since_start(get_scene_scanline_times(scn))
+    np.testing.assert_allclose(seconds[[0, 16, 768, 784]],
+                               [0, VIIRS_SCAN_PERIOD, 85.4, 85.4 + VIIRS_SCAN_PERIOD], atol=1e-6)
+
+    scn.attrs['swath_shape'] = (1536, 3200)
+    scn.attrs['swath_slices'] = (slice(760, 800), slice(100, 200))
+    scn['cma'] = scn['cma'][760:800, 100:200]
+    cropped = _seconds_since_start(get_scene_scanline_times(scn))
+    np.testing.assert_array_equal(cropped, seconds[760:800])